@@ -1,3 +1,5 @@
 #!/bin/sh
 source .venv/bin/activate
+# With DEBUG on, background tasks run inside the request, so no run_tasks worker
+# is needed here; see FITNESS_TASKS in mysite/settings.py.
 python mysite/manage.py runserver $PORT
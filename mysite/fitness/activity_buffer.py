@@ -0,0 +1,173 @@
+"""
+Write-behind buffering for `log_activity` heartbeats.
+
+When FITNESS_ACTIVITY_BUFFER['ENABLED'] is set, seconds reported by the
+frontend are summed per (user, date) in a local store and written to
+DailyUserStats as one bulk upsert, either every FLUSH_INTERVAL seconds or as
+soon as MAX_PENDING distinct rows are waiting, and once more at exit. A flush
+that fails keeps its seconds pending for the next one. flush_activity()
+writes them on demand.
+
+Each worker process keeps its own store and flushes increments rather than
+absolute values, so any number of processes can flush concurrently without
+losing or double counting time. A forked child starts with an empty store so
+the parent's pending seconds are only ever written by the parent.
+"""
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'STORE': 'fitness.activity_buffer.LocalMemoryStore',
+    'FLUSH_INTERVAL': 5,
+    'MAX_PENDING': 500,
+}
+
+
+def buffer_settings():
+    return {**DEFAULTS, **getattr(settings, 'FITNESS_ACTIVITY_BUFFER', {})}
+
+
+class LocalMemoryStore:
+    """
+    Thread-safe in-process store of pending seconds keyed by (user_id, date).
+    Alternative stores must provide the same `add`, `drain`, `__len__` and `after_fork`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def add(self, user_id, date, seconds):
+        """Add seconds for a key and return the number of pending keys."""
+        with self._lock:
+            key = (user_id, date)
+            self._pending[key] = self._pending.get(key, 0) + seconds
+            return len(self._pending)
+
+    def drain(self):
+        """Remove and return everything pending as {(user_id, date): seconds}."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            return pending
+
+    def __len__(self):
+        return len(self._pending)
+
+    def after_fork(self):
+        # The lock may have been held by another thread at fork time, so replace it too.
+        self._lock = threading.Lock()
+        self._pending = {}
+
+
+class ActivityBuffer:
+    def __init__(self, store, flush_interval, max_pending):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def add(self, user_id, date, seconds):
+        self._ensure_flusher()
+        if self.store.add(user_id, date, seconds) >= self.max_pending:
+            try:
+                self.flush()
+            except Exception:
+                # The seconds stay pending for the next flush; the heartbeat itself was recorded
+                logger.exception('Flushing buffered activity failed')
+
+    def flush(self):
+        """Write everything pending in one bulk upsert. Returns the number of rows written."""
+        # Imported here to avoid a circular import with models.py
+        from .cache import bump_user_version
+        from .models import DailyUserStats, UserProfile
+
+        with self._flush_lock:
+            pending = self.store.drain()
+            if not pending:
+                return 0
+            rows = [{'user': user_id, 'date': date, 'seconds': seconds} for (user_id, date), seconds in pending.items()]
+            try:
+                written = DailyUserStats.objects.bulk_increment(rows)
+            except Exception:
+                # Put the seconds back so the next flush retries them.
+                for (user_id, date), seconds in pending.items():
+                    self.store.add(user_id, date, seconds)
+                raise
+            UserProfile.objects.record_active_days(rows)
+            for user_id in {user_id for user_id, _ in pending}:
+                bump_user_version(user_id)
+            return written
+
+    def _ensure_flusher(self):
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pid = os.getpid()
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='activity-buffer-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing buffered activity failed')
+            finally:
+                # This thread owns its own connection; don't leave it open between flushes.
+                connections.close_all()
+
+    def shutdown(self):
+        self._stopped.set()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Flushing buffered activity at exit failed')
+
+    def _after_fork(self):
+        self.store.after_fork()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_activity_buffer():
+    """Return this process's buffer, or None when write-behind is disabled."""
+    global _buffer
+    config = buffer_settings()
+    if not config['ENABLED']:
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                store = import_string(config['STORE'])()
+                _buffer = ActivityBuffer(store, config['FLUSH_INTERVAL'], config['MAX_PENDING'])
+                atexit.register(_buffer.shutdown)
+                os.register_at_fork(after_in_child=_buffer._after_fork)
+    return _buffer
+
+
+def flush_activity():
+    """Write this process's pending seconds now. Returns the number of rows written."""
+    activity_buffer = get_activity_buffer()
+    return activity_buffer.flush() if activity_buffer is not None else 0
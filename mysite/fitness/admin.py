@@ -1,9 +1,11 @@
 from django.contrib import admin
-from .models import UserProfile, DailyUserStats
+from .models import (
+    BackgroundTask, UserProfile, DailyUserStats, MonthlyUserStats, SessionDailySummary, WeeklyUserStats, WorkoutVideo,
+)
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
-    list_display = ['user', 'weight', 'height', 'date_of_birth', 'total_exercise_time', 'total_workouts']
+    list_display = ['user', 'weight', 'height', 'date_of_birth', 'total_exercise_time', 'total_workouts', 'current_streak', 'longest_streak']
     list_filter = ['date_of_birth']
     
 @admin.register(DailyUserStats)
@@ -11,3 +13,25 @@ class DailyUserStatsAdmin(admin.ModelAdmin):
     list_display = ['user', 'date', 'calories_burned', 'workouts_today', 'weight', 'time_spent_today']
     list_filter = ['date']
     search_fields = ['user__username']
+
+@admin.register(WeeklyUserStats, MonthlyUserStats)
+class PeriodUserStatsAdmin(admin.ModelAdmin):
+    list_display = ['user', 'period_start', 'calories_burned', 'workouts', 'weight', 'time_spent']
+    list_filter = ['period_start']
+    search_fields = ['user__username']
+
+@admin.register(SessionDailySummary)
+class SessionDailySummaryAdmin(admin.ModelAdmin):
+    list_display = ['user', 'date', 'sessions', 'total_seconds']
+    list_filter = ['date']
+    search_fields = ['user__username']
+
+@admin.register(WorkoutVideo)
+class WorkoutVideoAdmin(admin.ModelAdmin):
+    list_display = ['video_id', 'title', 'position', 'updated_at']
+    ordering = ['position', 'video_id']
+
+@admin.register(BackgroundTask)
+class BackgroundTaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'run_after', 'locked_by', 'created_at']
+    list_filter = ['status', 'name']
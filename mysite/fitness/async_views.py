@@ -0,0 +1,147 @@
+"""
+Async versions of the hot read views: dashboard_data, get_user_profile and
+videos. mysite/asgi.py turns on FITNESS_ASYNC_VIEWS, so the ASGI application
+routes to these while WSGI workers keep the sync views in fitness/views.py.
+Both produce the same bodies, and share their cache entries and ETags.
+
+A sync view holds a thread for its whole run under ASGI. These only leave the
+event loop for blocking work: authentication with the ETag check, cache reads
+and writes, and queries. dashboard_data runs its three independent queries at
+once. Django's async ORM sends every query of a request to that request's one
+sync thread, so two of them go to pool threads with their own connections
+(in_pool), while the range scan uses `async for`.
+"""
+import asyncio
+import functools
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils import timezone
+from rest_framework.exceptions import APIException, NotAuthenticated
+
+from . import views
+from .authentication import ProfileJWTAuthentication
+from .cache import dashboard_cache_key, get_cached_dashboard, set_cached_dashboard
+from .catalog import get_video_catalog, normalize_level
+from .conditional import etag_matches, tag_response, user_data_etag
+from .models import UserProfile
+from .renderers import dumps
+
+
+def _run_with_connections(func, *args):
+    # Pool threads outlive requests: treat each call like a request for connection upkeep
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+async def in_pool(func, *args):
+    """Run blocking `func` on a pool thread, concurrently with other in_pool calls."""
+    return await sync_to_async(_run_with_connections, thread_sensitive=False)(func, *args)
+
+
+def _authenticate(request, endpoint, daily):
+    authenticator = ProfileJWTAuthentication()
+    result = authenticator.authenticate(request)
+    if result is None:
+        raise NotAuthenticated()
+    request.user, request.auth = result
+    if endpoint is None:
+        return None
+    return user_data_etag(request.user, endpoint, timezone.now().date() if daily else None)
+
+
+def _error_response(request, exc):
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    response = JsonResponse(data, status=exc.status_code, safe=False)
+    if exc.status_code == 401:
+        response['WWW-Authenticate'] = ProfileJWTAuthentication().authenticate_header(request)
+    return response
+
+
+def api_get(endpoint=None, daily=False):
+    """
+    The async counterpart of @api_view(['GET']) with @permission_classes([IsAuthenticated]),
+    authenticating with ProfileJWTAuthentication, plus @user_etag(endpoint, daily) when
+    `endpoint` is given.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                response = JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+                response['Allow'] = 'GET, HEAD'
+                return response
+            try:
+                etag = await in_pool(_authenticate, request, endpoint, daily)
+            except APIException as exc:
+                return _error_response(request, exc)
+            if etag is None:
+                return await view(request, *args, **kwargs)
+            if etag_matches(etag, request.META.get('HTTP_IF_NONE_MATCH', '')):
+                return tag_response(HttpResponseNotModified(), etag)
+            response = await view(request, *args, **kwargs)
+            return tag_response(response, etag) if response.status_code == 200 else response
+        return wrapper
+    return decorator
+
+
+async def aget_request_profile(request):
+    """Async get_request_profile()."""
+    profile = getattr(request, 'profile', None)
+    if profile is None:
+        profile, _ = await UserProfile.objects.aget_or_create(user=request.user)
+    return profile
+
+
+def json_response(body):
+    return HttpResponse(body, content_type='application/json')
+
+
+def _cached_dashboard(user, today):
+    key = dashboard_cache_key(user, today)
+    return key, get_cached_dashboard(key)
+
+
+@api_get('dashboard', daily=True)
+async def dashboard_data(request):
+    today = timezone.now().date()
+    cache_key, body = await in_pool(_cached_dashboard, request.user, today)
+    if body is None:
+        payload = await build_dashboard_payload(request.user, await aget_request_profile(request), today)
+        body = dumps(payload)
+        await in_pool(set_cached_dashboard, cache_key, body)
+    return json_response(body)
+
+
+async def build_dashboard_payload(user, profile, today):
+    """views.build_dashboard_payload() with its three queries run concurrently."""
+    start_date = today - timedelta(days=29)
+    daily_stats, most_recent_weight, total_calories = await asyncio.gather(
+        _fetch(views.dashboard_range(user, start_date)),
+        in_pool(views.dashboard_weight_before, user, start_date),
+        in_pool(views.dashboard_calories_total, user, start_date),
+    )
+    return views.assemble_dashboard_payload(user, profile, today, daily_stats, most_recent_weight, total_calories)
+
+
+async def _fetch(queryset):
+    return [row async for row in queryset]
+
+
+@api_get('get_user_profile')
+async def get_user_profile(request):
+    return json_response(dumps(views.profile_payload(request.user, await aget_request_profile(request))))
+
+
+@api_get()
+async def videos(request):
+    """views.videos(); the catalog checks its version in the cache, so the lookup runs on a pool thread."""
+    profile = await aget_request_profile(request)
+    user_level = normalize_level(getattr(profile, 'level', 'beginner'))
+    body, etag = await in_pool(get_video_catalog().for_level, user_level)
+    return views.catalog_response(request, body, etag)
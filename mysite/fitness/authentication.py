@@ -0,0 +1,77 @@
+import copy
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import get_user_version, user_cache
+from .models import UserProfile
+
+
+class ProfileJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that loads the user together with their UserProfile in one
+    query, keeps them in a short-lived per-process cache, and exposes the profile
+    as `request.profile` so views don't need their own get_or_create.
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is None:
+            return None
+        user, token = result
+        request.profile = user.userprofile
+        return user, token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        user = user_cache.get(user_id)
+        if user is None:
+            # Read the version first so a write racing with this load leaves the entry stale, not wrong
+            version = get_user_version(user_id)
+            user = self.load_user(user_id)
+            user_cache.set(user_id, user, version)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return self.detached_copy(user)
+
+    def load_user(self, user_id):
+        try:
+            user = User.objects.select_related('userprofile').get(**{api_settings.USER_ID_FIELD: user_id})
+        except User.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+        try:
+            user.userprofile
+        except UserProfile.DoesNotExist:
+            # First authenticated request of a user registered without a profile.
+            # The join already showed it's missing, so go straight to the insert.
+            try:
+                with transaction.atomic():
+                    profile = UserProfile.objects.create(user=user)
+            except IntegrityError:
+                profile = UserProfile.objects.get(user=user)
+            user.userprofile = profile
+        return user
+
+    @staticmethod
+    def detached_copy(user):
+        """Per-request copies, so a view mutating its user or profile never touches the cached objects."""
+        user_copy = copy.copy(user)
+        profile_copy = copy.copy(user.userprofile)
+        profile_copy.user = user_copy
+        user_copy.userprofile = profile_copy
+        return user_copy
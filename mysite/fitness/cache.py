@@ -0,0 +1,119 @@
+"""
+Per-user data versions, the cached dashboard payload and the authenticated-user cache.
+
+Every write that changes what a user sees on the dashboard bumps that user's
+data version. Cached payloads are keyed by (user, version, day), so a bump
+simply makes the old entry unreachable and it ages out on its own. They are
+stored as serialized JSON bytes, ready to be sent.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .routers import pin_to_primary
+
+VERSION_KEY = 'fitness:user:{user_id}:version'
+DASHBOARD_KEY = 'fitness:user:{user_id}:dashboard:{version}:{day}'
+
+
+def _user_id(user):
+    return getattr(user, 'pk', user)
+
+
+def _fresh_version():
+    # Seed from the clock instead of 1 so a version key that was evicted and
+    # re-created can never collide with a payload cached under the old one.
+    return time.time_ns()
+
+
+def get_user_version(user):
+    """Return the current data version for a user, creating it if missing."""
+    key = VERSION_KEY.format(user_id=_user_id(user))
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _fresh_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_user_version(user):
+    """Invalidate everything cached for a user after a write."""
+    key = VERSION_KEY.format(user_id=_user_id(user))
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Key was never set or has been evicted.
+        cache.set(key, _fresh_version(), timeout=None)
+    # Read-your-writes: this user's next reads come from the primary, not a lagging replica
+    pin_to_primary(_user_id(user))
+
+
+def dashboard_cache_key(user, day):
+    return DASHBOARD_KEY.format(
+        user_id=_user_id(user),
+        version=get_user_version(user),
+        day=day.isoformat(),
+    )
+
+
+def get_cached_dashboard(key):
+    return cache.get(key)
+
+
+def set_cached_dashboard(key, payload):
+    cache.set(key, payload, timeout=getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300))
+
+
+class UserCache:
+    """
+    Bounded, per-process LRU of authenticated users (with their profile) keyed by user id.
+
+    Entries expire after `ttl` seconds and are also dropped as soon as the user's
+    data version moves on, so with a shared CACHES backend a save in one worker
+    invalidates the copies held by the others.
+    """
+
+    def __init__(self, max_entries=10000, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, version, user = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+        if version != get_user_version(user_id):
+            self.invalidate(user_id)
+            return None
+        return user
+
+    def set(self, user_id, user, version):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, version, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(
+    max_entries=getattr(settings, 'FITNESS_AUTH_CACHE', {}).get('MAX_ENTRIES', 10000),
+    ttl=getattr(settings, 'FITNESS_AUTH_CACHE', {}).get('TTL', 30),
+)
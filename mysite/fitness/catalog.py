@@ -0,0 +1,135 @@
+"""
+The workout video catalog, compiled once per level into ready-to-send bytes.
+
+The catalog comes from WORKOUT_VIDEOS below or, with
+FITNESS_VIDEO_CATALOG_SOURCE = 'database', from the WorkoutVideo table. Each
+level's response body is serialized once and served with a strong ETag.
+Saving or deleting a WorkoutVideo bumps a catalog version in the shared
+cache, and every process recompiles the next time it sees a new version.
+Checking the version is a single cache read, so serving the catalog never
+touches the database.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Level normalization and video configurations
+ALLOWED_LEVELS = {"beginner", "intermediate", "advanced"}
+
+def normalize_level(level):
+    """Normalize various forms of level input to canonical strings: beginner|intermediate|advanced."""
+    s = str(level).strip().lower() if level is not None else ""
+    if s in ("1", "beginner"):
+        return "beginner"
+    if s in ("2", "intermediate"):
+        return "intermediate"
+    if s in ("3", "advanced"):
+        return "advanced"
+    # Default/fallback
+    return "beginner"
+
+# Define your videos with per-level sets and calories per set
+WORKOUT_VIDEOS = [
+    {
+        "id": "warmup",
+        "title": "Full Body Warm-up",
+        "sets": {"beginner": 2, "intermediate": 3, "advanced": 4},
+        "calories_per_set": {"beginner": 20, "intermediate": 25, "advanced": 30}
+    },
+    {
+        "id": "jjacks",
+        "title": "Jumping Jacks",
+        "sets": {"beginner": 3, "intermediate": 4, "advanced": 5},
+        "calories_per_set": {"beginner": 30, "intermediate": 40, "advanced": 55}
+    },
+    {
+        "id": "squats",
+        "title": "Bodyweight Squats",
+        "sets": {"beginner": 2, "intermediate": 3, "advanced": 5},
+        "calories_per_set": {"beginner": 35, "intermediate": 45, "advanced": 60}
+    },
+    {
+        "id": "pushups",
+        "title": "Push-ups",
+        "sets": {"beginner": 2, "intermediate": 3, "advanced": 4},
+        "calories_per_set": {"beginner": 25, "intermediate": 35, "advanced": 50}
+    },
+    {
+        "id": "plank",
+        "title": "Plank Holds",
+        "sets": {"beginner": 2, "intermediate": 3, "advanced": 4},
+        "calories_per_set": {"beginner": 15, "intermediate": 20, "advanced": 28}
+    }
+]
+
+CATALOG_VERSION_KEY = 'fitness:videos:version'
+
+
+def compile_level(videos, level):
+    payload = []
+    for v in videos:
+        sets = v["sets"].get(level, v["sets"]["beginner"])  # fallback safe
+        cal_per_set = v["calories_per_set"].get(level, v["calories_per_set"]["beginner"])  # fallback safe
+        payload.append({
+            "id": v["id"],
+            "title": v["title"],
+            "level": level,
+            "sets": sets,
+            "calories_per_set": cal_per_set,
+            "total_calories": sets * cal_per_set
+        })
+    body = json.dumps({"videos": payload}, separators=(',', ':')).encode()
+    etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+    return body, etag
+
+
+class VideoCatalog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (catalog version, {level: (body, etag)}), swapped as a whole so readers never see a mix
+        self._state = (None, {})
+
+    def source_videos(self):
+        if getattr(settings, 'FITNESS_VIDEO_CATALOG_SOURCE', 'static') == 'database':
+            from .models import WorkoutVideo
+            return [v.as_catalog_entry() for v in WorkoutVideo.objects.order_by('position', 'video_id')]
+        return WORKOUT_VIDEOS
+
+    def for_level(self, level):
+        """Return (body bytes, strong ETag) for a normalized level."""
+        version = current_catalog_version()
+        compiled_version, compiled = self._state
+        if compiled_version != version:
+            with self._lock:
+                compiled_version, compiled = self._state
+                if compiled_version != version:
+                    videos = self.source_videos()
+                    compiled = {lvl: compile_level(videos, lvl) for lvl in sorted(ALLOWED_LEVELS)}
+                    self._state = (version, compiled)
+        return compiled[level]
+
+
+def current_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+_catalog = VideoCatalog()
+
+
+def get_video_catalog():
+    return _catalog
@@ -0,0 +1,86 @@
+"""
+Response compression for API clients on slow links.
+
+CompressionMiddleware compresses responses of at least MIN_SIZE bytes whose
+content type starts with one of CONTENT_TYPES, using brotli when the client
+accepts it and the `brotli` package is installed, and gzip otherwise. gzip
+output gets Django's random padding against BREACH-style attacks. Streaming
+responses are left alone; exports offer their own .gz downloads.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULTS = {
+    'MIN_SIZE': 1024,
+    'CONTENT_TYPES': ['application/json', 'application/x-ndjson', 'text/'],
+    'BROTLI_QUALITY': 5,
+}
+
+
+def compression_settings():
+    return {**DEFAULTS, **getattr(settings, 'FITNESS_COMPRESSION', {})}
+
+
+def accepted_encodings(header):
+    """The codings an Accept-Encoding header allows, ignoring those with q=0."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        params = params.replace(' ', '')
+        if coding and params not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        config = compression_settings()
+        if response.streaming or response.has_header('Content-Encoding') \
+                or len(response.content) < config['MIN_SIZE'] \
+                or not response.get('Content-Type', '').startswith(tuple(config['CONTENT_TYPES'])):
+            return response
+
+        patch_vary_headers(response, ['Accept-Encoding'])
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and 'br' in accepted:
+            encoding = 'br'
+            content = brotli.compress(response.content, quality=config['BROTLI_QUALITY'])
+        elif 'gzip' in accepted:
+            encoding = 'gzip'
+            content = compress_string(response.content, max_random_bytes=100)
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+        # The bytes changed, so a strong ETag no longer holds
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,60 @@
+"""
+Conditional GET for per-user endpoints.
+
+@user_etag marks a GET view whose body only changes when the user's data
+version (see fitness/cache.py) moves on, or, with `daily=True`, also when the
+day changes. The ETag is derived from those alone, so checking
+If-None-Match costs one cache read and never builds the payload: an
+unchanged poll is answered with an empty 304 before the view body runs.
+
+ETags are weak because they describe the data, not the bytes, which also
+lets CompressionMiddleware re-encode the body without invalidating them.
+"""
+import functools
+import hashlib
+
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache import get_user_version
+
+
+def etag_matches(etag, if_none_match):
+    """Weak comparison of `etag` against an If-None-Match header value."""
+    tags = parse_etags(if_none_match)
+    return '*' in tags or etag.removeprefix('W/') in {tag.removeprefix('W/') for tag in tags}
+
+
+def user_data_etag(user, endpoint, day=None):
+    marker = f'{endpoint}:{user.pk}:{get_user_version(user)}:{day.isoformat() if day else ""}'
+    return 'W/"%s"' % hashlib.sha256(marker.encode()).hexdigest()[:32]
+
+
+def user_etag(endpoint, daily=False):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            # Taken before the view runs: a write racing with it only makes the tag older, never newer
+            etag = user_data_etag(request.user, endpoint, timezone.now().date() if daily else None)
+            if etag_matches(etag, request.META.get('HTTP_IF_NONE_MATCH', '')):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = view(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+            return tag_response(response, etag)
+        return wrapper
+    return decorator
+
+
+def tag_response(response, etag):
+    response['ETag'] = etag
+    # Personal data: caches must revalidate with the tag, and keep users apart
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ['Authorization'])
+    return response
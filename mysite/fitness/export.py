@@ -0,0 +1,177 @@
+"""
+Streaming CSV and NDJSON exports of DailyUserStats and UserSessionActivity.
+
+Rows are read with `values_list().iterator(chunk_size=...)`, so only one
+chunk of plain tuples is alive at a time, encoded straight to bytes, and
+handed to StreamingHttpResponse in blocks of roughly BLOCK_SIZE bytes. With
+compression enabled, the blocks go through a single zlib stream in gzip
+format as they are produced. Memory stays flat however much history is
+exported, which matters on workers that also serve live traffic. With
+sharding, the all-users export reads the shards one after another.
+
+Under ASGI, Django drains a sync iterator into memory before sending it, so
+requests served there get an async iterator that produces each block on the
+request's sync thread instead.
+"""
+import csv
+import json
+import zlib
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import router
+from django.http import StreamingHttpResponse
+
+from .models import DailyUserStats, UserSessionActivity
+from .sharding import shard_aliases
+
+DEFAULTS = {
+    'CHUNK_SIZE': 2000,
+    'BLOCK_SIZE': 64 * 1024,
+}
+
+# dataset -> (model, exported fields, order for one user, order for all users)
+DATASETS = {
+    'daily': (
+        DailyUserStats,
+        ('date', 'calories_burned', 'weight', 'time_spent_today', 'workouts_today'),
+        ('date',),
+        ('user', 'date'),
+    ),
+    'sessions': (
+        UserSessionActivity,
+        ('session_key', 'login_time', 'logout_time', 'duration_seconds', 'date'),
+        ('login_time',),
+        ('user', 'login_time'),
+    ),
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def export_settings():
+    return {**DEFAULTS, **getattr(settings, 'FITNESS_EXPORT', {})}
+
+
+def _plain(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+class _Line:
+    """File-like target that hands back what csv.writer writes instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def encode_csv(header, rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(header).encode()
+    for row in rows:
+        yield writer.writerow([_plain(v) for v in row]).encode()
+
+
+def encode_ndjson(header, rows):
+    for row in rows:
+        yield (json.dumps(dict(zip(header, map(_plain, row))), separators=(',', ':')) + '\n').encode()
+
+
+ENCODERS = {'csv': encode_csv, 'ndjson': encode_ndjson}
+
+
+def blocks(pieces, block_size):
+    """Join small byte strings into blocks of about `block_size` bytes."""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= block_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def aiterate(iterator):
+    """Iterate a blocking iterator from async code, one step at a time on the request's sync thread."""
+    step = sync_to_async(next, thread_sensitive=True)
+    done = object()
+    try:
+        while (item := await step(iterator, done)) is not done:
+            yield item
+    finally:
+        # Closes the database cursor of an export the client stopped reading
+        await sync_to_async(iterator.close, thread_sensitive=True)()
+
+
+def export_rows(dataset, user=None):
+    """
+    Return (header, row iterator) for one user's rows of `dataset`, or for every
+    user's, with user id and username leading each row, when `user` is None.
+    """
+    model, fields, user_order, all_order = DATASETS[dataset]
+    chunk_size = export_settings()['CHUNK_SIZE']
+    if user is not None:
+        queryset = model.objects.for_user(user).order_by(*user_order).values_list(*fields)
+        # Rows are read while the response streams, after the request's routing has ended: fix the alias now
+        return fields, queryset.using(queryset.db).iterator(chunk_size=chunk_size)
+    header = ('user_id', 'username') + fields
+    querysets = [
+        model.objects.using(db).order_by(*all_order).values_list('user_id', *fields)
+        for db in shard_aliases(default=router.db_for_read(model))
+    ]
+    return header, _with_usernames(querysets, chunk_size)
+
+
+def _with_usernames(querysets, chunk_size):
+    """
+    Chain `querysets`, adding each row's username after its user id. Users live on the
+    primary and the rows may not, so names are looked up once per chunk instead of joined.
+    """
+    for queryset in querysets:
+        rows = queryset.iterator(chunk_size=chunk_size)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            names = dict(User.objects.using(router.db_for_read(User))
+                         .filter(pk__in={row[0] for row in chunk}).values_list('pk', 'username'))
+            for row in chunk:
+                yield (row[0], names.get(row[0])) + row[1:]
+
+
+def export_response(dataset, fmt, compress=False, user=None, asynchronous=False):
+    """
+    A StreamingHttpResponse that downloads `dataset` as `fmt`, gzipped when `compress`,
+    streaming from an async iterator when `asynchronous`.
+    """
+    header, rows = export_rows(dataset, user)
+    stream = blocks(ENCODERS[fmt](header, rows), export_settings()['BLOCK_SIZE'])
+    filename = f'{dataset}.{fmt}'
+    if compress:
+        stream = gzip_stream(stream)
+        content_type = 'application/gzip'
+        filename += '.gz'
+    else:
+        content_type = CONTENT_TYPES[fmt]
+    response = StreamingHttpResponse(aiterate(stream) if asynchronous else stream, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Exports are personal and always read fresh
+    response['Cache-Control'] = 'private, no-store'
+    return response
@@ -0,0 +1,216 @@
+"""
+Bulk import of per-day history from other apps and wearables.
+
+Input is NDJSON (one object per line) or CSV with a header row, using the
+same columns as the daily export: date, calories_burned, weight,
+time_spent_today and workouts_today. Only `date` is required. An imported
+value replaces what is stored for that day, so importing the same file
+twice changes nothing.
+
+The input is read line by line and written in chunks. Each chunk looks up
+the days it touches, turns the imported totals into deltas and applies them
+with DailyUserStats.objects.bulk_increment, which keeps the rollups in step.
+The profile's totals, weight and streak are updated once, after the last
+chunk. Memory is bounded by the chunk size, not the file size.
+"""
+import codecs
+import csv
+import json
+import math
+from datetime import date
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import bump_user_version
+from .models import DailyUserStats, UserProfile
+
+# Errors reported back to the caller; further bad rows are only counted
+MAX_ERRORS = 100
+
+
+class ImportFormatError(ValueError):
+    """
+    The input as a whole can't be read, e.g. a CSV file without a date column, or bytes
+    that aren't UTF-8. Chunks written before the error are kept.
+    """
+
+
+def read_ndjson(lines):
+    for number, line in enumerate(codecs.iterdecode(lines, 'utf-8-sig'), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None
+            continue
+        yield number, record if isinstance(record, dict) else None
+
+
+def read_csv(lines):
+    reader = csv.reader(codecs.iterdecode(lines, 'utf-8-sig'))
+    header = next(reader, None)
+    if header is None:
+        return
+    header = [name.strip() for name in header]
+    if 'date' not in header:
+        raise ImportFormatError("CSV input needs a header row with a 'date' column.")
+    for number, values in enumerate(reader, start=2):
+        if not values:
+            continue
+        # Empty cells mean "not provided", like a missing key in NDJSON
+        yield number, {name: value for name, value in zip(header, values) if value.strip() != ''}
+
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+
+def _number(record, name, cast, minimum, maximum):
+    value = record.get(name)
+    if value is None:
+        return None
+    value = cast(value)
+    if not math.isfinite(value):
+        raise ValueError(f'{name} must be a finite number')
+    if value < minimum:
+        raise ValueError(f'{name} must be at least {minimum}')
+    if value > maximum:
+        raise ValueError(f'{name} must be at most {maximum}')
+    return value
+
+
+def clean(record, today):
+    """Validate one record. Returns (day, values) where values holds only the fields provided."""
+    if record is None:
+        raise ValueError('not a JSON object')
+    try:
+        day = date.fromisoformat(str(record['date']))
+    except KeyError:
+        raise ValueError('date is required')
+    if day > today:
+        raise ValueError('date cannot be in the future')
+    try:
+        values = {
+            'calories_burned': _number(record, 'calories_burned', float, 0, 100000),
+            'weight': _number(record, 'weight', float, 0, 1000),
+            # A day has no more seconds than this, and the bounds keep sums well inside 64 bits
+            'time_spent_today': _number(record, 'time_spent_today', int, 0, 86400),
+            'workouts_today': _number(record, 'workouts_today', int, 0, 1000),
+        }
+    except OverflowError:
+        # int() of an infinite float, e.g. 1e400 in JSON
+        raise ValueError('numbers must be finite')
+    if values['weight'] == 0:
+        raise ValueError('weight must be positive')
+    return day, {name: value for name, value in values.items() if value is not None}
+
+
+class Importer:
+    def __init__(self, user, chunk_size=1000):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self.days = 0
+        self.rejected = 0
+        self.errors = []
+        self.workouts = 0
+        self.seconds = 0
+        self.latest_weight = None
+
+    def run(self, lines, fmt):
+        """Import every record in `lines` (an iterable of byte lines) and return a summary."""
+        today = timezone.now().date()
+        chunk = {}
+        try:
+            try:
+                for number, record in READERS[fmt](lines):
+                    try:
+                        day, values = clean(record, today)
+                    except (TypeError, ValueError) as exc:
+                        self.reject(number, exc)
+                        continue
+                    self.rows += 1
+                    # Later lines for the same day win
+                    chunk.setdefault(day, {}).update(values)
+                    if len(chunk) >= self.chunk_size:
+                        self.write(chunk)
+                        chunk = {}
+            except UnicodeDecodeError:
+                raise ImportFormatError('Input must be UTF-8 encoded.')
+            except csv.Error as exc:
+                raise ImportFormatError(f'Malformed CSV input: {exc}.')
+            if chunk:
+                self.write(chunk)
+        finally:
+            # Whatever was written gets reflected on the profile, even if a later chunk failed
+            self.finish()
+        return {
+            'imported': self.rows,
+            'days': self.days,
+            'rejected': self.rejected,
+            'errors': self.errors,
+        }
+
+    def reject(self, number, exc):
+        self.rejected += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'line': number, 'error': str(exc)})
+
+    def write(self, chunk):
+        with transaction.atomic(using=DailyUserStats.objects.db_for_user(self.user)):
+            existing = {
+                row[0]: row[1:] for row in DailyUserStats.objects.for_user(self.user).filter(date__in=list(chunk))
+                .values_list('date', 'calories_burned', 'time_spent_today', 'workouts_today')
+            }
+            deltas = []
+            for day, values in chunk.items():
+                calories, seconds, workouts = existing.get(day, (0, 0, 0))
+                delta = {
+                    'user': self.user.pk,
+                    'date': day,
+                    'calories': values.get('calories_burned', calories) - calories,
+                    'seconds': values.get('time_spent_today', seconds) - seconds,
+                    'workouts': values.get('workouts_today', workouts) - workouts,
+                    'weight': values.get('weight'),
+                }
+                deltas.append(delta)
+                self.workouts += delta['workouts']
+                self.seconds += delta['seconds']
+                if delta['weight'] is not None and (self.latest_weight is None or day >= self.latest_weight[0]):
+                    self.latest_weight = (day, delta['weight'])
+            DailyUserStats.objects.bulk_increment(deltas)
+        self.days += len(chunk)
+
+    def finish(self):
+        if not self.days:
+            return
+        updates = {
+            'total_workouts': F('total_workouts') + self.workouts,
+            'total_exercise_time': F('total_exercise_time') + self.seconds,
+            **DailyUserStats.objects.streaks([self.user])[self.user.pk],
+        }
+        # Only move the profile's current weight if nothing newer is on record
+        if self.latest_weight is not None and not DailyUserStats.objects.for_user(self.user).filter(
+            date__gt=self.latest_weight[0], weight__isnull=False
+        ).exists():
+            updates['weight'] = self.latest_weight[1]
+        UserProfile.objects.filter(user=self.user).update(**updates)
+        bump_user_version(self.user)
+
+
+def import_history(user, lines, fmt, chunk_size=1000):
+    """Import `lines` of `fmt` ('csv' or 'ndjson') into `user`'s history. Returns a summary dict."""
+    return Importer(user, chunk_size).run(lines, fmt)
+
+
+def detect_format(name, content_type):
+    """Pick 'csv' or 'ndjson' from a file name or content type, or None."""
+    name = (name or '').lower()
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if name.endswith('.csv') or content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')) or content_type in ('application/x-ndjson', 'application/jsonl'):
+        return 'ndjson'
+    return None
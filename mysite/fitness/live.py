@@ -0,0 +1,196 @@
+"""
+Live dashboard updates over server-sent events.
+
+GET /api/live/ (served by the ASGI application, mysite/asgi.py) keeps a
+text/event-stream open and pushes a `delta` event whenever the user's numbers
+for a day change:
+
+    event: delta
+    data: {"date":"2024-03-01","delta":{"calories_burned":250.0,"workouts_today":1,
+           "total_workouts":1},"today":{"calories_burned":730.0,"time_spent_today":1800,
+           "workouts_today":3}}
+
+`delta` holds what was added to that day's DailyUserStats and to the profile
+totals. `today` holds the day's values after the write, when the writer had
+them at hand. A client that falls too far behind gets a `resync` event and
+should reload /api/dashboard/. A comment line is sent every HEARTBEAT seconds
+so proxies keep idle streams open. EventSource can't send headers, so the
+access token may be passed as ?token=.
+
+Events come from complete_workout, log_activity and the logout rollup through
+publish_stats, once their transaction commits. The broadcaster is in-process:
+a stream only sees writes handled by the same worker process, so several
+workers need sticky routing of each user to one worker, or a shared pub/sub
+in place of Broadcaster. An idle stream is one suspended coroutine and a small
+queue, so a worker can hold thousands of them.
+"""
+import asyncio
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .renderers import dumps
+
+DEFAULTS = {
+    'HEARTBEAT': 15,
+    # Events buffered per stream before the client is told to resync
+    'QUEUE_SIZE': 100,
+    # Milliseconds EventSource waits before reconnecting
+    'RETRY_MS': 5000,
+}
+
+
+def live_settings():
+    return {**DEFAULTS, **getattr(settings, 'FITNESS_LIVE', {})}
+
+
+class Subscription:
+    """One open stream: a queue fed on the event loop that serves it."""
+
+    def __init__(self, user_id, queue_size):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(queue_size)
+        self.overflowed = False
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class Broadcaster:
+    """Fans events for a user out to that user's open streams. publish() may be called from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def subscribe(self, user_id, queue_size):
+        subscription = Subscription(user_id, queue_size)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.user_id, None)
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The serving loop has shut down
+                self.unsubscribe(subscription)
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+
+broadcaster = Broadcaster()
+
+
+def publish_stats(user, day, stats=None, **delta):
+    """
+    Tell `user`'s open streams that `delta` was added to their numbers for `day`. `stats` is the
+    day's DailyUserStats row after the write, if the caller has it. Sent once the surrounding
+    transaction commits, so streams never show a write that was rolled back.
+    """
+    user_id = getattr(user, 'pk', user)
+    event = {'date': day.isoformat(), 'delta': {name: value for name, value in delta.items() if value}}
+    if stats is not None:
+        event['today'] = {
+            'calories_burned': stats.calories_burned,
+            'time_spent_today': stats.time_spent_today,
+            'workouts_today': stats.workouts_today,
+        }
+    transaction.on_commit(lambda: broadcaster.publish(user_id, event))
+
+
+def _token(request):
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        return header[len('Bearer '):]
+    return request.GET.get('token')
+
+
+async def _authenticated_user_id(request):
+    try:
+        user_id = AccessToken(_token(request) or '')[jwt_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None
+    # The claim is a string; the broadcaster is keyed by the real primary key
+    return await User.objects.filter(**{jwt_settings.USER_ID_FIELD: user_id}, is_active=True) \
+        .values_list('pk', flat=True).afirst()
+
+
+class EventStream:
+    """
+    The chunks of one stream. Django calls close() when the response ends, e.g. on
+    client disconnect, which drops the subscription straight away.
+    """
+
+    def __init__(self, user_id, config):
+        self.user_id = user_id
+        self.config = config
+        self.subscription = None
+
+    def __aiter__(self):
+        return self._events()
+
+    async def _events(self):
+        self.subscription = broadcaster.subscribe(self.user_id, self.config['QUEUE_SIZE'])
+        try:
+            yield f"retry: {self.config['RETRY_MS']}\n\nevent: ready\ndata: {{}}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(self.subscription.queue.get(), self.config['HEARTBEAT'])
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                if self.subscription.overflowed:
+                    while not self.subscription.queue.empty():
+                        self.subscription.queue.get_nowait()
+                    self.subscription.overflowed = False
+                    yield 'event: resync\ndata: {}\n\n'
+                    continue
+                yield f'event: delta\ndata: {dumps(event).decode()}\n\n'
+        finally:
+            self.close()
+
+    def close(self):
+        if self.subscription is not None:
+            broadcaster.unsubscribe(self.subscription)
+            self.subscription = None
+
+
+async def live_updates(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would have to buffer the endless stream
+        return JsonResponse({'error': 'Live updates are only served by the ASGI application.'}, status=501)
+    user_id = await _authenticated_user_id(request)
+    if user_id is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided or are invalid.'},
+                            status=401)
+    response = StreamingHttpResponse(EventStream(user_id, live_settings()), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Don't let nginx buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
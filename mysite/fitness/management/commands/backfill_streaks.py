@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from fitness.cache import bump_user_version
+from fitness.models import DailyUserStats, UserProfile
+
+STREAK_FIELDS = ['current_streak', 'longest_streak', 'last_active_date']
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute current streak, longest streak and last active date for every user profile "
+        "from DailyUserStats history, in chunks of users."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users recomputed per transaction.')
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only backfill this user id. May be repeated.')
+        parser.add_argument('--database', default='default', help='Database alias to use.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] <= 0:
+            raise CommandError('--chunk-size must be positive.')
+        using = options['database']
+        chunk_size = options['chunk_size']
+
+        started = time.perf_counter()
+        done = 0
+        last_id = 0
+        while True:
+            # Keyset pagination over profiles, so each chunk is an index range scan
+            profiles = UserProfile.objects.using(using).filter(user_id__gt=last_id)
+            if options['users']:
+                profiles = profiles.filter(user_id__in=options['users'])
+            profiles = list(profiles.order_by('user_id')[:chunk_size])
+            if not profiles:
+                break
+            last_id = profiles[-1].user_id
+
+            streaks = DailyUserStats.objects.db_manager(using).streaks([p.user_id for p in profiles])
+            changed = []
+            for profile in profiles:
+                state = streaks[profile.user_id]
+                if any(getattr(profile, field) != value for field, value in state.items()):
+                    for field, value in state.items():
+                        setattr(profile, field, value)
+                    changed.append(profile)
+            with transaction.atomic(using=using):
+                UserProfile.objects.using(using).bulk_update(changed, STREAK_FIELDS, batch_size=chunk_size)
+            for profile in changed:
+                bump_user_version(profile.user_id)
+
+            done += len(profiles)
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'{done} profiles checked, {len(changed)} updated in this chunk')
+
+        if options['users'] and not done:
+            raise CommandError('No profiles found for the given users.')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Backfilled streaks for {done} profiles in {elapsed:.1f}s.'))
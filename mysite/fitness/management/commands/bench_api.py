@@ -0,0 +1,159 @@
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from fitness.seeding import seed
+
+BENCH_PASSWORD = 'bench-password'
+
+# name -> (method, path, needs access token)
+ENDPOINTS = {
+    'dashboard_data': ('get', '/api/dashboard/', True),
+    'complete_workout': ('post', '/api/complete-workout/', True),
+    'log_activity': ('post', '/api/log_activity/', True),
+    'videos': ('get', '/api/videos/', True),
+    'token_obtain_pair': ('post', '/api/token/', False),
+    'token_refresh': ('post', '/api/token/refresh/', False),
+}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database and measure throughput, latency percentiles and queries "
+        "per request for the main API endpoints. Prints a JSON report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Number of users to seed.')
+        parser.add_argument('--days', type=int, default=90, help='Days of DailyUserStats history per user.')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint.')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent client threads.')
+        parser.add_argument('--endpoints', nargs='+', choices=list(ENDPOINTS), default=list(ENDPOINTS))
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for data and request order.')
+        parser.add_argument('--label', default='', help='Free-form label stored in the report, e.g. a commit.')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        # Never touch the real database: run against a temporary file-backed test database
+        # so worker threads each get their own connection.
+        tmpdir = tempfile.mkdtemp(prefix='bench_api_')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            rng = random.Random(options['seed'])
+            users = self.seed_users(options['users'], options['days'], options['seed'])
+            report = {
+                'label': options['label'],
+                'config': {k: options[k] for k in ('users', 'days', 'requests', 'workers', 'seed')},
+                'endpoints': {},
+            }
+            for name in options['endpoints']:
+                cache.clear()
+                report['endpoints'][name] = self.run_endpoint(name, users, options, rng)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def seed_users(self, num_users, days, seed_value):
+        user_ids = []
+        for _, ids in seed(users=num_users, days=days, end_date=timezone.now().date(), seed=seed_value,
+                           prefix='bench', password=BENCH_PASSWORD):
+            user_ids += ids
+        users = list(User.objects.filter(pk__in=user_ids).order_by('pk'))
+
+        tokens = {}
+        for u in users:
+            refresh = RefreshToken.for_user(u)
+            tokens[u.pk] = {'access': str(refresh.access_token), 'refresh': str(refresh)}
+        return [(u, tokens[u.pk]) for u in users]
+
+    def request_kwargs(self, name, user, tokens, rng):
+        _, _, needs_token = ENDPOINTS[name]
+        kwargs = {'content_type': 'application/json'}
+        if needs_token:
+            kwargs['HTTP_AUTHORIZATION'] = f"Bearer {tokens['access']}"
+        if name == 'complete_workout':
+            kwargs['data'] = {'calories_burned': round(rng.uniform(20, 400), 1)}
+        elif name == 'log_activity':
+            kwargs['data'] = {'seconds': 30}
+        elif name == 'token_obtain_pair':
+            kwargs['data'] = {'username': user.username, 'password': BENCH_PASSWORD}
+        elif name == 'token_refresh':
+            kwargs['data'] = {'refresh': tokens['refresh']}
+        return kwargs
+
+    def run_endpoint(self, name, users, options, rng):
+        method, path, _ = ENDPOINTS[name]
+        plan = [self.request_kwargs(name, *rng.choice(users), rng) for _ in range(options['requests'])]
+        local = threading.local()
+
+        def call(kwargs):
+            client = getattr(local, 'client', None)
+            if client is None:
+                # Count server errors as failed requests instead of aborting the run
+                client = local.client = Client(raise_request_exception=False)
+            with CaptureQueriesContext(connections['default']) as queries:
+                start = time.perf_counter()
+                response = getattr(client, method)(path, **kwargs)
+                elapsed = time.perf_counter() - start
+            return elapsed, len(queries), response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            samples = list(pool.map(call, plan))
+        wall = time.perf_counter() - started
+
+        latencies = sorted(s[0] * 1000 for s in samples)
+        queries = [s[1] for s in samples]
+        errors = sum(1 for s in samples if s[2] >= 400)
+        return {
+            'method': method.upper(),
+            'path': path,
+            'requests': len(samples),
+            'errors': errors,
+            'throughput_rps': round(len(samples) / wall, 2) if wall else None,
+            'latency_ms': {
+                'mean': round(statistics.fmean(latencies), 3),
+                'p50': round(percentile(latencies, 50), 3),
+                'p95': round(percentile(latencies, 95), 3),
+                'p99': round(percentile(latencies, 99), 3),
+                'max': round(latencies[-1], 3),
+            },
+            'queries_per_request': {
+                'mean': round(statistics.fmean(queries), 2),
+                'max': max(queries),
+            },
+        }
@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from fitness.management.commands.bench_api import percentile
+from fitness.seeding import seed
+
+ENDPOINTS = {
+    'dashboard_data': '/api/dashboard/',
+    # Every request rebuilds the dashboard: the concurrent-query path
+    'dashboard_data_uncached': '/api/dashboard/',
+    'get_user_profile': '/api/get_user_profile/',
+    'videos': '/api/videos/',
+}
+
+# name -> (server, FITNESS_ASYNC_VIEWS)
+VARIANTS = {
+    'wsgi': ('wsgi', '0'),
+    'asgi-sync': ('asgi', '0'),
+    'asgi-async': ('asgi', '1'),
+}
+
+
+class WSGIServer:
+    """A threaded WSGI server, like gunicorn's gthread worker, minus the sockets."""
+
+    def __init__(self, threads):
+        from django.core.wsgi import get_wsgi_application
+        self.application = get_wsgi_application()
+        self.pool = ThreadPoolExecutor(threads)
+
+    def call(self, path, token):
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+            'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'testserver', 'HTTP_AUTHORIZATION': f'Bearer {token}',
+            'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+            'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        status = []
+        result = self.application(environ, lambda s, headers, exc_info=None: status.append(int(s[:3])))
+        try:
+            body = b''.join(result)
+        finally:
+            # Sends request_finished, which closes the thread's connections
+            result.close()
+        return status[0], body
+
+    async def request(self, path, token):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, self.call, path, token)
+
+    def close(self):
+        self.pool.shutdown()
+
+
+class ASGIServer:
+    """Calls the ASGI application the way uvicorn does for one keep-alive-less request."""
+
+    def __init__(self):
+        from django.core.asgi import get_asgi_application
+        self.application = get_asgi_application()
+
+    async def request(self, path, token):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'',
+            'headers': [(b'host', b'testserver'), (b'authorization', f'Bearer {token}'.encode())],
+            'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+        }
+        sent_request = False
+        disconnected = asyncio.Event()
+        status, chunks = [], []
+
+        async def receive():
+            nonlocal sent_request
+            if not sent_request:
+                sent_request = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            else:
+                chunks.append(message.get('body', b''))
+
+        await self.application(scope, receive, send)
+        disconnected.set()
+        return status[0], b''.join(chunks)
+
+    def close(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare throughput and latency of the hot read views at high concurrency under "
+        "mysite/wsgi.py (threaded), and under mysite/asgi.py with the sync and with the async "
+        "views. Each variant runs in its own process against the same seeded database, driving "
+        "the application in-process. Prints a JSON report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Number of users to seed.')
+        parser.add_argument('--days', type=int, default=90, help='Days of DailyUserStats history per user.')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per endpoint and variant.')
+        parser.add_argument('--concurrency', type=int, default=200, help='Requests in flight at once.')
+        parser.add_argument('--wsgi-threads', type=int, default=32, help='Threads of the WSGI server.')
+        parser.add_argument('--endpoints', nargs='+', choices=list(ENDPOINTS), default=list(ENDPOINTS))
+        parser.add_argument('--variants', nargs='+', choices=list(VARIANTS), default=list(VARIANTS))
+        parser.add_argument('--db-profile', choices=['development', 'production'], default='production',
+                            help='FITNESS_DB_PROFILE for the servers.')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+        # Set by the parent process for each variant
+        parser.add_argument('--worker', choices=list(VARIANTS), help='Run one variant; internal.')
+        parser.add_argument('--database', help='SQLite file the worker serves from; internal.')
+        parser.add_argument('--tokens', help='JSON file of access tokens; internal.')
+
+    def handle(self, *args, **options):
+        if options['requests'] <= 0 or options['concurrency'] <= 0:
+            raise CommandError('--requests and --concurrency must be positive.')
+        if options['worker']:
+            self.stdout.write(json.dumps(self.run_worker(options)))
+            return
+
+        # Never touch the real database: seed a temporary file-backed test database for the workers
+        tmpdir = tempfile.mkdtemp(prefix='bench_asgi_')
+        database = os.path.join(tmpdir, 'bench.sqlite3')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = database
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            user_ids = []
+            for _, ids in seed(users=options['users'], days=options['days'], end_date=timezone.now().date(),
+                               prefix='asgi'):
+                user_ids += ids
+            tokens = [str(AccessToken.for_user(user)) for user in User.objects.filter(pk__in=user_ids)]
+            tokens_path = os.path.join(tmpdir, 'tokens.json')
+            with open(tokens_path, 'w') as f:
+                json.dump(tokens, f)
+            connections.close_all()
+            variants = {name: self.spawn(name, database, tokens_path, options) for name in options['variants']}
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+        for endpoint in options['endpoints']:
+            if len({report[endpoint].pop('bodies') for report in variants.values()}) > 1:
+                raise CommandError(f'{endpoint}: variants returned different bodies.')
+        report = {
+            'config': {k: options[k] for k in ('users', 'days', 'requests', 'concurrency', 'wsgi_threads',
+                                               'db_profile')},
+            'endpoints': {
+                endpoint: {name: results[endpoint] for name, results in variants.items()}
+                for endpoint in options['endpoints']
+            },
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def spawn(self, name, database, tokens_path, options):
+        _, async_views = VARIANTS[name]
+        env = {**os.environ, 'FITNESS_ASYNC_VIEWS': async_views, 'FITNESS_DB_PROFILE': options['db_profile']}
+        command = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'bench_asgi', '--worker', name,
+            '--database', database, '--tokens', tokens_path, '--requests', str(options['requests']),
+            '--concurrency', str(options['concurrency']), '--wsgi-threads', str(options['wsgi_threads']),
+            '--endpoints', *options['endpoints'],
+        ]
+        result = subprocess.run(command, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise CommandError(f'{name} failed:\n{result.stderr}')
+        return json.loads(result.stdout)
+
+    def run_worker(self, options):
+        settings.DATABASES['default']['NAME'] = options['database']
+        setup_test_environment()
+        with open(options['tokens']) as f:
+            tokens = json.load(f)
+        server_type, _ = VARIANTS[options['worker']]
+        server = WSGIServer(options['wsgi_threads']) if server_type == 'wsgi' else ASGIServer()
+        try:
+            return {
+                endpoint: asyncio.run(self.measure(server, endpoint, tokens, options))
+                for endpoint in options['endpoints']
+            }
+        finally:
+            server.close()
+
+    async def measure(self, server, endpoint, tokens, options):
+        path = ENDPOINTS[endpoint]
+        settings.DASHBOARD_CACHE_TIMEOUT = 0 if endpoint == 'dashboard_data_uncached' else 300
+        # Warm the authenticated-user cache and, for the cached endpoints, the payloads
+        bodies = {}
+        for i, token in enumerate(tokens):
+            status, body = await server.request(path, token)
+            if status != 200:
+                raise CommandError(f'{endpoint}: status {status}: {body[:200]!r}')
+            bodies[i] = body
+
+        remaining = iter(range(options['requests']))
+        timings, errors = [], 0
+        peak_threads = threading.active_count()
+
+        async def client():
+            nonlocal errors, peak_threads
+            for n in remaining:
+                start = time.perf_counter()
+                status, _ = await server.request(path, tokens[n % len(tokens)])
+                timings.append((time.perf_counter() - start) * 1000)
+                errors += status != 200
+                peak_threads = max(peak_threads, threading.active_count())
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(min(options['concurrency'], options['requests']))))
+        elapsed = time.perf_counter() - started
+        timings.sort()
+        return {
+            'requests_per_second': round(len(timings) / elapsed, 1),
+            'latency_ms': {
+                'mean': round(statistics.fmean(timings), 2),
+                'p50': round(percentile(timings, 50), 2),
+                'p95': round(percentile(timings, 95), 2),
+                'p99': round(percentile(timings, 99), 2),
+            },
+            'errors': errors,
+            'peak_threads': peak_threads,
+            'bodies': hashlib.sha256(b'\0'.join(bodies[i] for i in sorted(bodies))).hexdigest(),
+        }
@@ -0,0 +1,130 @@
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, renderer_classes
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.permissions import AllowAny
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+
+from fitness import renderers, views
+from fitness.management.commands.bench_api import percentile
+from fitness.models import DailyUserStats, UserProfile
+from fitness.renderers import FastJSONRenderer, SingleRendererNegotiation, dumps
+from fitness.seeding import build_chunk
+
+
+def dashboard_payload(today):
+    """dashboard_data's body for one seeded user, built by the view's own code from unsaved rows."""
+    row = build_chunk({'seed': 0, 'chunk': 0, 'start': 0, 'count': 1, 'end_date': today, 'days': 30,
+                       'sessions_per_day': 0, 'prefix': 'bench'})[0]
+    user = User(username=row['username'])
+    profile = UserProfile(user=user, **row['profile'])
+    daily_stats = [
+        DailyUserStats(user=user, date=day, calories_burned=calories, weight=weight, time_spent_today=seconds,
+                       workouts_today=workouts)
+        for day, calories, weight, seconds, workouts in row['stats']
+    ]
+    total_calories = sum(s.calories_burned for s in daily_stats)
+    return views.assemble_dashboard_payload(user, profile, today, daily_stats, None, total_calories)
+
+
+def make_view(renderer_classes_, negotiation_class, payload):
+    @api_view(['GET'])
+    @authentication_classes([])
+    @permission_classes([AllowAny])
+    @renderer_classes(renderer_classes_)
+    def view(request):
+        return Response(payload)
+
+    view.cls.content_negotiation_class = negotiation_class
+    return view
+
+
+def variants(payload):
+    """name -> view. 'drf' is the stock setup every response went through before FastJSONRenderer."""
+    return {
+        'drf': make_view([JSONRenderer, BrowsableAPIRenderer], DefaultContentNegotiation, payload),
+        'fast': make_view([FastJSONRenderer], SingleRendererNegotiation, payload),
+        # A cache hit on the dashboard: the body was serialized when it was cached
+        'preserialized': make_view([FastJSONRenderer], SingleRendererNegotiation, dumps(payload)),
+    }
+
+
+def respond(view, request):
+    response = view(request)
+    response.render()
+    return response.content
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the time and memory taken to produce one dashboard response with DRF's stock "
+        "renderer and content negotiation, with FastJSONRenderer, and with a pre-serialized body. "
+        "Prints a JSON report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000, help='Responses timed per variant.')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        if options['iterations'] <= 0:
+            raise CommandError('--iterations must be positive.')
+        payload = dashboard_payload(timezone.now().date())
+        request = APIRequestFactory().get('/api/dashboard/', HTTP_ACCEPT='application/json')
+        views = variants(payload)
+        bodies = {name: respond(view, request) for name, view in views.items()}
+        if len({json.dumps(json.loads(body), sort_keys=True) for body in bodies.values()}) != 1:
+            raise CommandError('Variants rendered different documents.')
+
+        report = {
+            'config': {'points': len(payload['chart_data']), 'iterations': options['iterations'],
+                       'orjson': renderers.orjson is not None, 'body_bytes': len(bodies['fast'])},
+            'variants': {name: self.measure(view, request, options['iterations']) for name, view in views.items()},
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def measure(self, view, request, iterations):
+        for _ in range(min(iterations, 100)):
+            respond(view, request)
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            respond(view, request)
+            timings.append((time.perf_counter() - start) * 1e6)
+        timings.sort()
+
+        # Peak memory traced while producing one response, over a few samples
+        peaks = []
+        tracemalloc.start()
+        try:
+            for _ in range(20):
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                respond(view, request)
+                peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'latency_us': {
+                'mean': round(statistics.fmean(timings), 1),
+                'p50': round(percentile(timings, 50), 1),
+                'p95': round(percentile(timings, 95), 1),
+                'p99': round(percentile(timings, 99), 1),
+            },
+            'per_second': round(1e6 / statistics.fmean(timings)),
+            'peak_alloc_bytes': int(statistics.median(peaks)),
+        }
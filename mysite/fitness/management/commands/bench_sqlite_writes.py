@@ -0,0 +1,153 @@
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from fitness.management.commands.bench_api import percentile
+from fitness.models import DailyUserStats, UserProfile
+from fitness.seeding import seed
+from fitness.sqlite import PROFILE_PRAGMAS
+
+
+def log_activity_writes(user_id, today):
+    DailyUserStats.objects.increment(user_id, today, seconds=30)
+    UserProfile.objects.record_active_day([user_id], today)
+
+
+def dashboard_reads(user_id, today):
+    list(DailyUserStats.objects.filter(user=user_id, date__gte=today - timedelta(days=29)).order_by('date'))
+
+
+def run_loop(kind, operation, user_ids, duration, seed, barrier, results):
+    """Repeat `operation` as fast as possible for `duration` seconds in a forked worker."""
+    rng = random.Random(seed)
+    latencies = []
+    errors = 0
+    barrier.wait()
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        user_id = rng.choice(user_ids)
+        start = time.perf_counter()
+        try:
+            operation(user_id, timezone.now().date())
+        except OperationalError:
+            # "database is locked": the operation failed, as it would for a real request
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    connections.close_all()
+    results.put({'kind': kind, 'latencies': latencies, 'errors': errors})
+
+
+def summarize(samples, duration):
+    latencies = sorted(l * 1000 for s in samples for l in s['latencies'])
+    return {
+        'operations': len(latencies),
+        'errors': sum(s['errors'] for s in samples),
+        'per_second': round(len(latencies) / duration, 1),
+        'latency_ms': {
+            'mean': round(statistics.fmean(latencies), 3) if latencies else None,
+            'p50': round(percentile(latencies, 50), 3) if latencies else None,
+            'p95': round(percentile(latencies, 95), 3) if latencies else None,
+            'p99': round(percentile(latencies, 99), 3) if latencies else None,
+            'max': round(latencies[-1], 3) if latencies else None,
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent write throughput on a throwaway SQLite file, once per FITNESS_DB_PROFILE. "
+        "Writer processes repeat log_activity's writes while reader processes repeat the dashboard's "
+        "range read; prints a JSON report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', choices=list(PROFILE_PRAGMAS),
+                            default=list(PROFILE_PRAGMAS), help='Database profiles to compare.')
+        parser.add_argument('--writers', type=int, default=8, help='Concurrent writer processes.')
+        parser.add_argument('--readers', type=int, default=4, help='Concurrent reader processes.')
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds each profile is measured.')
+        parser.add_argument('--users', type=int, default=200, help='Users written to.')
+        parser.add_argument('--days', type=int, default=60, help='Days of history seeded per user.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('This benchmark only makes sense on SQLite.')
+        if options['writers'] + options['readers'] <= 0:
+            raise CommandError('Need at least one writer or reader.')
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError('Writer processes are forked; this platform cannot fork.')
+
+        report = {
+            'config': {k: options[k] for k in ('writers', 'readers', 'duration', 'users', 'days', 'seed')},
+            'profiles': {},
+        }
+        setup_test_environment()
+        try:
+            for profile in options['profiles']:
+                with override_settings(FITNESS_DB_PROFILE=profile):
+                    report['profiles'][profile] = self.run_profile(options)
+        finally:
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def run_profile(self, options):
+        # A fresh file per profile: journal_mode is stored in the database file itself
+        tmpdir = tempfile.mkdtemp(prefix='bench_sqlite_')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            user_ids = []
+            for _, ids in seed(users=options['users'], days=options['days'], end_date=timezone.now().date(),
+                               seed=options['seed'], prefix='writer'):
+                user_ids += ids
+            with connection.cursor() as cursor:
+                journal_mode = cursor.execute('PRAGMA journal_mode').fetchone()[0]
+            # Forked children must open their own connections
+            connections.close_all()
+
+            ctx = multiprocessing.get_context('fork')
+            plan = [('writes', log_activity_writes)] * options['writers'] + \
+                [('reads', dashboard_reads)] * options['readers']
+            barrier = ctx.Barrier(len(plan))
+            results = ctx.Queue()
+            workers = [
+                ctx.Process(target=run_loop, args=(kind, operation, user_ids, options['duration'],
+                                                   options['seed'] + n, barrier, results))
+                for n, (kind, operation) in enumerate(plan)
+            ]
+            for worker in workers:
+                worker.start()
+            samples = [results.get() for _ in workers]
+            for worker in workers:
+                worker.join()
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+        result = {'journal_mode': journal_mode}
+        for kind in ('writes', 'reads'):
+            kind_samples = [s for s in samples if s['kind'] == kind]
+            if kind_samples:
+                result[kind] = summarize(kind_samples, options['duration'])
+        return result
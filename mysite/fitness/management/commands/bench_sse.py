@@ -0,0 +1,178 @@
+import asyncio
+import json
+import os
+import resource
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from fitness.live import broadcaster
+from fitness.management.commands.bench_api import percentile
+from fitness.seeding import seed
+
+
+def rss_bytes():
+    """Current resident set size, or the peak where /proc isn't available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Client:
+    """One simulated EventSource, talking to the ASGI application through receive/send."""
+
+    def __init__(self, token, number):
+        self.token = token
+        self.number = number
+        self.ready = asyncio.Event()
+        self.disconnect = asyncio.Event()
+        self.status = None
+        self.latencies = []
+        self.requested = False
+
+    def scope(self):
+        return {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': '/api/live/', 'raw_path': b'/api/live/', 'root_path': '',
+            'query_string': f'token={self.token}'.encode(), 'headers': [(b'host', b'testserver')],
+            'client': ('127.0.0.1', 10000 + self.number), 'server': ('testserver', 80),
+        }
+
+    async def receive(self):
+        if not self.requested:
+            self.requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.disconnect.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+            if self.status != 200:
+                self.ready.set()
+            return
+        received = time.perf_counter()
+        for chunk in message.get('body', b'').decode().split('\n\n'):
+            if 'event: ready' in chunk:
+                self.ready.set()
+            elif chunk.startswith('event: delta'):
+                event = json.loads(chunk.split('data: ', 1)[1])
+                self.latencies.append(received - event['sent_at'])
+
+
+class Command(BaseCommand):
+    help = (
+        "Open many /api/live/ event streams against the ASGI application in this process, then "
+        "publish deltas from another thread, as committed writes do, and measure memory per "
+        "connection and fan-out latency. Prints a JSON report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=2000, help='Streams held open.')
+        parser.add_argument('--users', type=int, default=200, help='Users the streams are spread over.')
+        parser.add_argument('--rounds', type=int, default=20, help='Deltas published to every user.')
+        parser.add_argument('--interval', type=float, default=0.05, help='Seconds between rounds.')
+        parser.add_argument('--batch', type=int, default=200, help='Streams opened at a time.')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        if options['connections'] <= 0 or options['users'] <= 0:
+            raise CommandError('--connections and --users must be positive.')
+        # Never touch the real database: run against a temporary file-backed test database
+        setup_test_environment()
+        tmpdir = tempfile.mkdtemp(prefix='bench_sse_')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            user_ids = []
+            for _, ids in seed(users=options['users'], days=1, end_date=timezone.now().date(), prefix='sse'):
+                user_ids += ids
+            tokens = {user.pk: str(AccessToken.for_user(user)) for user in User.objects.filter(pk__in=user_ids)}
+            report = asyncio.run(self.run(get_asgi_application(), tokens, options))
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    async def run(self, application, tokens, options):
+        user_ids = list(tokens)
+        clients = [Client(tokens[user_ids[n % len(user_ids)]], n) for n in range(options['connections'])]
+        tasks = []
+
+        rss_before = rss_bytes()
+        started = time.perf_counter()
+        for i in range(0, len(clients), options['batch']):
+            batch = clients[i:i + options['batch']]
+            tasks += [asyncio.create_task(application(c.scope(), c.receive, c.send)) for c in batch]
+            await asyncio.gather(*(c.ready.wait() for c in batch))
+        open_seconds = time.perf_counter() - started
+        rss_open = rss_bytes()
+        failed = sum(c.status != 200 for c in clients)
+        held = broadcaster.connection_count()
+
+        # Publish from another thread, like on_commit callbacks in sync views
+        expected = options['rounds'] * held
+
+        def publish():
+            for _ in range(options['rounds']):
+                for user_id in user_ids:
+                    broadcaster.publish(user_id, {'date': '2024-01-01', 'delta': {'time_spent_today': 30},
+                                                  'sent_at': time.perf_counter()})
+                time.sleep(options['interval'])
+
+        publish_started = time.perf_counter()
+        publisher = threading.Thread(target=publish)
+        publisher.start()
+        deadline = time.perf_counter() + options['rounds'] * options['interval'] + 30
+        while sum(len(c.latencies) for c in clients) < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        publish_seconds = time.perf_counter() - publish_started
+        await asyncio.get_running_loop().run_in_executor(None, publisher.join)
+
+        for c in clients:
+            c.disconnect.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        latencies = sorted(l * 1000 for c in clients for l in c.latencies)
+        return {
+            'config': {k: options[k] for k in ('connections', 'users', 'rounds', 'interval', 'batch')},
+            'connections': {
+                'held': held,
+                'failed': failed,
+                'opened_per_second': round(len(clients) / open_seconds, 1),
+                'rss_per_connection_bytes': round((rss_open - rss_before) / max(held, 1)),
+                'left_after_disconnect': broadcaster.connection_count(),
+            },
+            'fanout': {
+                'expected': expected,
+                'delivered': len(latencies),
+                'deliveries_per_second': round(len(latencies) / publish_seconds, 1),
+                'latency_ms': {
+                    'mean': round(statistics.fmean(latencies), 3) if latencies else None,
+                    'p50': round(percentile(latencies, 50), 3) if latencies else None,
+                    'p95': round(percentile(latencies, 95), 3) if latencies else None,
+                    'p99': round(percentile(latencies, 99), 3) if latencies else None,
+                    'max': round(latencies[-1], 3) if latencies else None,
+                },
+            },
+        }
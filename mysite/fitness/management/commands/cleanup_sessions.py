@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fitness.sessions import close_stale_sessions, compact_sessions, session_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Close abandoned sessions and compact old sessions into per-day summaries. Closed sessions "
+        "are credited no time: daily stats are left unchanged unless the user later logs out of "
+        "the session. Safe to run periodically, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        config = session_settings()
+        parser.add_argument('--idle-timeout', type=int, default=config['IDLE_TIMEOUT'],
+                            help='Seconds after login at which an open session is closed, with no time credited.')
+        parser.add_argument('--retention-days', type=int, default=config['RETENTION_DAYS'],
+                            help='Keep individual sessions for this many days before compacting them.')
+        parser.add_argument('--batch-size', type=int, default=config['BATCH_SIZE'],
+                            help='Sessions handled per transaction.')
+        parser.add_argument('--pause', type=float, default=config['PAUSE'],
+                            help='Seconds to sleep between batches.')
+        parser.add_argument('--skip-close', action='store_true', help="Don't close stale sessions.")
+        parser.add_argument('--skip-compact', action='store_true', help="Don't compact old sessions.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0 or options['idle_timeout'] <= 0 or options['retention_days'] < 0:
+            raise CommandError('--batch-size and --idle-timeout must be positive, --retention-days not negative.')
+
+        started = time.perf_counter()
+        closed = compacted = 0
+        if not options['skip_close']:
+            closed = close_stale_sessions(options['idle_timeout'], options['batch_size'], options['pause'])
+        if not options['skip_compact']:
+            compacted = compact_sessions(options['retention_days'], options['batch_size'], options['pause'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Closed {closed} stale sessions and compacted {compacted} old sessions in {elapsed:.1f}s.'
+        ))
@@ -0,0 +1,54 @@
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from fitness.importing import ImportFormatError, detect_format, import_history
+
+
+class Command(BaseCommand):
+    help = (
+        "Import per-day history (date, calories_burned, weight, time_spent_today, workouts_today) "
+        "for one user from a CSV or NDJSON file, streaming it in chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for standard input.")
+        parser.add_argument('--user', required=True, help='Username or id of the user to import into.')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], dest='fmt',
+                            help='Input format. Guessed from the file extension if omitted.')
+        parser.add_argument('--chunk-size', type=int,
+                            default=getattr(settings, 'FITNESS_IMPORT_CHUNK_SIZE', 1000),
+                            help='Days written per transaction.')
+
+    def handle(self, *args, **options):
+        lookup = {'pk': options['user']} if options['user'].isdigit() else {'username': options['user']}
+        try:
+            user = User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist.")
+        fmt = options['fmt'] or detect_format(options['path'], None)
+        if fmt is None:
+            raise CommandError('Could not tell the input format; pass --format.')
+        if options['chunk_size'] <= 0:
+            raise CommandError('--chunk-size must be positive.')
+
+        started = time.perf_counter()
+        try:
+            if options['path'] == '-':
+                summary = import_history(user, sys.stdin.buffer, fmt, options['chunk_size'])
+            else:
+                with open(options['path'], 'rb') as f:
+                    summary = import_history(user, f, fmt, options['chunk_size'])
+        except (ImportFormatError, OSError) as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - started
+
+        for error in summary['errors']:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['imported']} rows into {summary['days']} days for {user.username} "
+            f"({summary['rejected']} rejected) in {elapsed:.1f}s."
+        ))
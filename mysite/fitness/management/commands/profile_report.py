@@ -0,0 +1,63 @@
+import io
+import json
+import os
+import pstats
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fitness.profiling import profiling_settings
+
+
+class Command(BaseCommand):
+    help = "Merge profiles written by @profile_view into a top-N hot-function and SQL report."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', help='Profile directory. Defaults to FITNESS_PROFILING["DIRECTORY"].')
+        parser.add_argument('--top', type=int, default=25, help='Number of functions and queries to show.')
+        parser.add_argument('--sort', default='cumulative', choices=['cumulative', 'tottime', 'ncalls'],
+                            help='pstats sort key.')
+        parser.add_argument('--view', help='Only include profiles of this view function.')
+
+    def handle(self, *args, **options):
+        directory = options['directory'] or profiling_settings()['DIRECTORY']
+        if not os.path.isdir(directory):
+            raise CommandError(f'No profile directory at {directory}.')
+
+        names = sorted(n[:-len('.prof')] for n in os.listdir(directory) if n.endswith('.prof'))
+        metas = {}
+        for name in names:
+            try:
+                with open(os.path.join(directory, name + '.json')) as f:
+                    metas[name] = json.load(f)
+            except (OSError, ValueError):
+                metas[name] = {}
+        if options['view']:
+            names = [n for n in names if metas[n].get('view') == options['view']]
+        if not names:
+            raise CommandError('No matching profiles found.')
+
+        stream = io.StringIO()
+        stats = pstats.Stats(*(os.path.join(directory, n + '.prof') for n in names), stream=stream)
+        stats.strip_dirs().sort_stats(options['sort']).print_stats(options['top'])
+
+        elapsed = sorted(metas[n]['elapsed_ms'] for n in names if 'elapsed_ms' in metas[n])
+        self.stdout.write(f'{len(names)} profiles from {directory}')
+        if elapsed:
+            self.stdout.write(
+                f'wall time ms: median {elapsed[len(elapsed) // 2]:.1f}, max {elapsed[-1]:.1f}'
+            )
+        self.stdout.write(stream.getvalue())
+
+        # Aggregate SQL by statement text across all selected requests
+        sql_totals = defaultdict(lambda: [0, 0.0])
+        for name in names:
+            for query in metas[name].get('sql', []):
+                total = sql_totals[query['sql']]
+                total[0] += 1
+                total[1] += query['duration_ms']
+        if sql_totals:
+            self.stdout.write(f'Top {options["top"]} SQL statements by total time:')
+            ranked = sorted(sql_totals.items(), key=lambda item: item[1][1], reverse=True)
+            for sql, (count, duration) in ranked[:options['top']]:
+                self.stdout.write(f'{duration:10.2f} ms  {count:6d}x  {sql[:160]}')
@@ -0,0 +1,56 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from fitness.rebalancing import misplaced_users, move_user
+from fitness.sharding import shard_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Move users' DailyUserStats, UserSessionActivity and related rows onto the shard that "
+        "FITNESS_SHARDS assigns them, in batches. Run after adding or removing a shard, or once "
+        "after turning sharding on to move the history out of 'default'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', action='append', dest='sources',
+                            help="Only move rows off this alias, e.g. a retired shard. May be repeated. "
+                                 "Defaults to every shard and 'default'.")
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only move this user id. May be repeated.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows moved per transaction.')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between batches, leaving room for other writers.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report which users would move.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive.')
+        aliases = shard_settings()['ALIASES']
+        if not aliases:
+            raise CommandError("No shards configured in FITNESS_SHARDS['ALIASES'].")
+        sources = options['sources'] or list(dict.fromkeys([*aliases, DEFAULT_DB_ALIAS]))
+        for alias in sources:
+            if alias not in settings.DATABASES:
+                raise CommandError(f'Unknown database alias: {alias}.')
+
+        started = time.perf_counter()
+        users = rows = 0
+        for source in sources:
+            misplaced = misplaced_users(source, options['users'])
+            if options['verbosity'] >= 2 or options['dry_run']:
+                self.stdout.write(f'{source}: {len(misplaced)} users to move')
+            if options['dry_run']:
+                continue
+            for user_id in misplaced:
+                moved = move_user(user_id, source, options['batch_size'], options['pause'])
+                users += 1
+                rows += moved
+                if options['verbosity'] >= 2:
+                    self.stdout.write(f'user {user_id}: {moved} rows moved off {source}')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Moved {rows} rows for {users} users in {elapsed:.1f}s.'))
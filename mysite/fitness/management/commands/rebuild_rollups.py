@@ -0,0 +1,50 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fitness.models import UserProfile
+from fitness.stats import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild WeeklyUserStats and MonthlyUserStats from DailyUserStats, in chunks of users. "
+        "With --since only the periods from that date on are rebuilt."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat,
+                            help='Rebuild from the week and month containing this date (YYYY-MM-DD).')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Users rebuilt per transaction.')
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only rebuild this user id. May be repeated.')
+        parser.add_argument('--database', default='default', help='Database alias to use.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] <= 0:
+            raise CommandError('--chunk-size must be positive.')
+        using = options['database']
+
+        user_ids = UserProfile.objects.using(using).order_by('user_id').values_list('user_id', flat=True)
+        if options['users']:
+            user_ids = user_ids.filter(user_id__in=options['users'])
+
+        started = time.perf_counter()
+        users = written = 0
+        last_id = 0
+        while True:
+            # Keyset pagination, so each chunk is an index range scan
+            chunk = list(user_ids.filter(user_id__gt=last_id)[:options['chunk_size']])
+            if not chunk:
+                break
+            last_id = chunk[-1]
+            written += rebuild_rollups(chunk, since=options['since'], using=using)
+            users += len(chunk)
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'{users} users rebuilt, {written} rollup rows written')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {written} rollup rows for {users} users in {elapsed:.1f}s.'
+        ))
@@ -0,0 +1,42 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fitness.tasks import Worker, task_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background tasks. Any number of workers can run side by side; each claims "
+        "batches of due tasks and runs them on a thread pool. Stops after the current batch on "
+        "SIGINT or SIGTERM."
+    )
+
+    def add_arguments(self, parser):
+        config = task_settings()
+        parser.add_argument('--threads', type=int, default=config['THREADS'], help='Tasks run at once.')
+        parser.add_argument('--batch-size', type=int, default=config['BATCH_SIZE'],
+                            help='Tasks claimed at a time.')
+        parser.add_argument('--lease', type=int, default=config['LEASE'],
+                            help='Seconds a claimed batch is reserved for this worker.')
+        parser.add_argument('--poll-interval', type=float, default=config['POLL_INTERVAL'],
+                            help='Seconds to wait when no task is due.')
+        parser.add_argument('--once', action='store_true', help='Exit once no task is due.')
+        parser.add_argument('--name', help='Worker name recorded on claimed tasks. Defaults to host:pid.')
+
+    def handle(self, *args, **options):
+        if options['threads'] <= 0 or options['batch_size'] <= 0 or options['lease'] <= 0:
+            raise CommandError('--threads, --batch-size and --lease must be positive.')
+
+        worker = Worker(options['name'], options['threads'], options['batch_size'], options['lease'],
+                        options['poll_interval'])
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: worker.stop())
+
+        started = time.perf_counter()
+        worker.run(once=options['once'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Ran {worker.done} tasks in {elapsed:.1f}s; {worker.failed} attempts failed.'
+        ))
@@ -0,0 +1,48 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from fitness.routers import replica_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database onto every SQLite replica in FITNESS_REPLICAS['ALIASES'] "
+        "with the online backup API. A stand-in for real replication in local setups."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help='Keep syncing every this many seconds instead of once.')
+        parser.add_argument('--pages', type=int, default=1024,
+                            help='Pages copied per backup step; the primary is only locked during a step.')
+
+    def handle(self, *args, **options):
+        aliases = replica_settings()['ALIASES']
+        if not aliases:
+            raise CommandError("No replicas configured in FITNESS_REPLICAS['ALIASES'].")
+        for alias in [DEFAULT_DB_ALIAS] + aliases:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f'{alias} is not an SQLite database.')
+
+        while True:
+            for alias in aliases:
+                started = time.perf_counter()
+                self.sync(connections[DEFAULT_DB_ALIAS].settings_dict['NAME'],
+                          connections[alias].settings_dict['NAME'], options['pages'])
+                self.stdout.write(f'{alias}: synced in {time.perf_counter() - started:.2f}s')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def sync(self, source_name, target_name, pages):
+        source = sqlite3.connect(source_name)
+        target = sqlite3.connect(target_name)
+        try:
+            # Readers of the replica see either the old copy or the new one, never a mix
+            source.backup(target, pages=pages)
+        finally:
+            target.close()
+            source.close()
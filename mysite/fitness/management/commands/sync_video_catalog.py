@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from fitness.catalog import WORKOUT_VIDEOS
+from fitness.models import WorkoutVideo
+
+
+class Command(BaseCommand):
+    help = "Copy the built-in WORKOUT_VIDEOS catalog into the WorkoutVideo table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true',
+                            help='Delete table entries that are not in the built-in catalog.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            for position, video in enumerate(WORKOUT_VIDEOS):
+                WorkoutVideo.objects.update_or_create(
+                    video_id=video['id'],
+                    defaults={
+                        'title': video['title'],
+                        'sets': video['sets'],
+                        'calories_per_set': video['calories_per_set'],
+                        'position': position,
+                    },
+                )
+            pruned = 0
+            if options['prune']:
+                pruned, _ = WorkoutVideo.objects.exclude(video_id__in=[v['id'] for v in WORKOUT_VIDEOS]).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Synced {len(WORKOUT_VIDEOS)} videos' + (f', pruned {pruned}.' if pruned else '.')
+        ))
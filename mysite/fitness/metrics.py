@@ -0,0 +1,339 @@
+"""
+Per-view request metrics in Prometheus text format.
+
+MetricsMiddleware records, for each named URL pattern: request counts by
+method and status, a latency histogram, database queries and time per
+request, response sizes and server errors. Samples live in a process-wide
+registry guarded by a lock. Queries are attributed to the request through a
+context variable, so those an async view runs on pool threads count too.
+
+Preforked workers each have their own registry. When
+FITNESS_METRICS['MULTIPROCESS_DIR'] is set, every process periodically writes
+a snapshot to `<dir>/metrics-<pid>-<random>.json`, and the /api/metrics view
+adds up the snapshots of all processes, including ones that have since exited,
+so counters never go backwards. The random part keeps a new process that
+reuses an old PID from overwriting the old process's totals.
+
+/api/metrics is served to admin users, and to scrapers that send
+FITNESS_METRICS['TOKEN'] as a bearer token.
+"""
+import atexit
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from rest_framework.exceptions import APIException
+
+from .authentication import ProfileJWTAuthentication
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MULTIPROCESS_DIR': None,
+    'FLUSH_INTERVAL': 1.0,
+    'TOKEN': None,
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+HISTOGRAMS = {
+    'fitness_http_request_duration_seconds': ('Request latency in seconds.', LATENCY_BUCKETS),
+    'fitness_db_queries_per_request': ('Database queries executed per request.', QUERY_BUCKETS),
+    'fitness_http_response_size_bytes': ('Response body size in bytes.', SIZE_BUCKETS),
+}
+COUNTERS = {
+    'fitness_http_requests_total': 'Requests handled, by view, method and status.',
+    'fitness_http_request_errors_total': 'Requests that ended in a 5xx response.',
+    'fitness_db_query_duration_seconds_total': 'Time spent in database queries.',
+}
+COUNTER_LABELS = {
+    'fitness_http_requests_total': ('view', 'method', 'status'),
+    'fitness_http_request_errors_total': ('view',),
+    'fitness_db_query_duration_seconds_total': ('view',),
+}
+
+
+def metrics_settings():
+    return {**DEFAULTS, **getattr(settings, 'FITNESS_METRICS', {})}
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # counters: {name: {labels: value}}; histograms: {name: {labels: [bucket counts..., sum, count]}}
+        self.counters = {name: {} for name in COUNTERS}
+        self.histograms = {name: {} for name in HISTOGRAMS}
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            series = self.counters[name]
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        with self._lock:
+            series = self.histograms[name].get(labels)
+            if series is None:
+                series = self.histograms[name][labels] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self):
+        """Return a JSON-friendly copy of every series."""
+        with self._lock:
+            return {
+                'counters': {name: [[list(k), v] for k, v in s.items()] for name, s in self.counters.items()},
+                'histograms': {name: [[list(k), list(v)] for k, v in s.items()] for name, s in self.histograms.items()},
+            }
+
+    def after_fork(self):
+        # A forked worker must not report its parent's samples a second time
+        self._lock = threading.Lock()
+        self.reset()
+
+
+registry = Registry()
+os.register_at_fork(after_in_child=registry.after_fork)
+
+
+def merge_snapshots(snapshots):
+    counters = {name: {} for name in COUNTERS}
+    histograms = {name: {} for name in HISTOGRAMS}
+    for snap in snapshots:
+        for name, series in snap.get('counters', {}).items():
+            for labels, value in series:
+                key = tuple(labels)
+                counters[name][key] = counters[name].get(key, 0) + value
+        for name, series in snap.get('histograms', {}).items():
+            for labels, values in series:
+                key = tuple(labels)
+                current = histograms[name].get(key)
+                histograms[name][key] = values if current is None else [a + b for a, b in zip(current, values)]
+    return counters, histograms
+
+
+class SnapshotWriter:
+    """Periodically persists this process's registry for multiprocess aggregation."""
+
+    def __init__(self):
+        self.after_fork()
+
+    def after_fork(self):
+        self._lock = threading.Lock()
+        self._last_write = 0.0
+        self._atexit_pid = None
+        self.filename = f'metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+
+    def maybe_write(self, directory, interval):
+        now = time.monotonic()
+        if now - self._last_write < interval:
+            return
+        self.write(directory)
+
+    def write(self, directory):
+        with self._lock:
+            self._last_write = time.monotonic()
+            if self._atexit_pid != os.getpid():
+                self._atexit_pid = os.getpid()
+                atexit.register(self.write, directory)
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.metrics-', suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(registry.snapshot(), f)
+            # Atomic rename, so readers never see a half-written file
+            os.replace(tmp_path, os.path.join(directory, self.filename))
+
+
+snapshot_writer = SnapshotWriter()
+os.register_at_fork(after_in_child=snapshot_writer.after_fork)
+
+
+def collect():
+    """Merged counters and histograms for this process, or for all processes in multiprocess mode."""
+    directory = metrics_settings()['MULTIPROCESS_DIR']
+    if not directory:
+        return merge_snapshots([registry.snapshot()])
+    snapshot_writer.write(directory)
+    snapshots = []
+    for name in os.listdir(directory):
+        if name.startswith('metrics-') and name.endswith('.json'):
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # file vanished or is being replaced; the next scrape will see it
+    return merge_snapshots(snapshots)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def render_text():
+    counters, histograms = collect()
+    lines = []
+    for name, help_text in COUNTERS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for labels, value in sorted(counters[name].items()):
+            lines.append(f'{name}{_format_labels(COUNTER_LABELS[name], labels)} {value}')
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, values in sorted(histograms[name].items()):
+            for bound, count in zip(buckets, values):
+                lines.append(f'{name}_bucket{_format_labels(("view",), labels, [("le", bound)])} {count}')
+            lines.append(f'{name}_bucket{_format_labels(("view",), labels, [("le", "+Inf")])} {values[-1]}')
+            lines.append(f'{name}_sum{_format_labels(("view",), labels)} {values[-2]}')
+            lines.append(f'{name}_count{_format_labels(("view",), labels)} {values[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def may_read_metrics(request):
+    """Whether `request` carries the metrics token, or comes from an admin user (session or JWT)."""
+    token = metrics_settings()['TOKEN']
+    if token and constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return True
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_staff:
+        return True
+    try:
+        result = ProfileJWTAuthentication().authenticate(request)
+    except APIException:
+        return False
+    return result is not None and result[0].is_staff
+
+
+def metrics_view(request):
+    if not may_read_metrics(request):
+        if 'HTTP_AUTHORIZATION' in request.META:
+            return HttpResponse('Forbidden\n', status=403, content_type='text/plain')
+        response = HttpResponse('Unauthorized\n', status=401, content_type='text/plain')
+        response['WWW-Authenticate'] = 'Bearer realm="api"'
+        return response
+    return HttpResponse(render_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class QueryRecorder:
+    """Counts the queries of one request and their total time. Fed from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.duration += elapsed
+                self.count += 1
+
+
+_recorder = contextvars.ContextVar('fitness_query_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper on every connection, passing queries to the current request's recorder."""
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        # At the bottom, so it outlives execute_wrapper() blocks that were open when the connection was made
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        config = metrics_settings()
+        if not config['ENABLED']:
+            return self.get_response(request)
+        recorder, token = self.start()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self.finish(config, request, response, recorder, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        config = metrics_settings()
+        if not config['ENABLED']:
+            return await self.get_response(request)
+        recorder, token = self.start()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self.finish(config, request, response, recorder, time.perf_counter() - start)
+        return response
+
+    def start(self):
+        # Connections opened before this module was loaded missed connection_created
+        for alias in connections:
+            install_query_recorder(None, connections[alias])
+        recorder = QueryRecorder()
+        return recorder, _recorder.set(recorder)
+
+    def finish(self, config, request, response, recorder, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unmatched'
+        # Streaming bodies are never materialised, so their size is unknown
+        size = None if response.streaming else len(response.content)
+
+        registry.inc('fitness_http_requests_total', (view, request.method, str(response.status_code)))
+        if response.status_code >= 500:
+            registry.inc('fitness_http_request_errors_total', (view,))
+        registry.inc('fitness_db_query_duration_seconds_total', (view,), recorder.duration)
+        registry.observe('fitness_http_request_duration_seconds', (view,), elapsed)
+        registry.observe('fitness_db_queries_per_request', (view,), recorder.count)
+        if size is not None:
+            registry.observe('fitness_http_response_size_bytes', (view,), size)
+
+        if config['MULTIPROCESS_DIR']:
+            snapshot_writer.maybe_write(config['MULTIPROCESS_DIR'], config['FLUSH_INTERVAL'])
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.13 on 2026-10-18 13:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fitness', '0010_alter_userprofile_gender'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dailyuserstats',
+            index=models.Index(condition=models.Q(('weight__isnull', False)), fields=['user', '-date', 'weight'], name='dailystats_user_weight_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usersessionactivity',
+            index=models.Index(condition=models.Q(('logout_time__isnull', True)), fields=['user', '-login_time'], name='session_user_open_idx'),
+        ),
+    ]
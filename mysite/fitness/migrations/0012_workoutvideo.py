@@ -0,0 +1,28 @@
+# Generated by Django 5.0.13 on 2026-10-18 13:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fitness', '0011_dailyuserstats_usersessionactivity_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkoutVideo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('video_id', models.SlugField(unique=True)),
+                ('title', models.CharField(max_length=200)),
+                ('sets', models.JSONField(help_text='Sets per level, e.g. {"beginner": 2, "intermediate": 3, "advanced": 4}.')),
+                ('calories_per_set', models.JSONField(help_text='Calories per set, keyed by level like sets.')),
+                ('position', models.PositiveIntegerField(default=0, help_text='Display order.')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['position', 'video_id'],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.0.13 on 2026-10-18 13:59
+
+from django.db import migrations, models
+
+from fitness.models import ACTIVE_DAY, compute_streaks
+
+
+def backfill_streaks(apps, schema_editor):
+    """Fill the new fields from DailyUserStats history, like `manage.py backfill_streaks`."""
+    db = schema_editor.connection.alias
+    DailyUserStats = apps.get_model('fitness', 'DailyUserStats')
+    UserProfile = apps.get_model('fitness', 'UserProfile')
+    profiles = {p.user_id: p for p in UserProfile.objects.using(db).only('user_id')}
+    days = {}
+    rows = (DailyUserStats.objects.using(db).filter(ACTIVE_DAY, user__in=list(profiles))
+            .order_by('user', 'date').values_list('user', 'date'))
+    for user_id, day in rows.iterator(chunk_size=5000):
+        days.setdefault(user_id, []).append(day)
+    changed = []
+    for user_id, active_days in days.items():
+        profile = profiles[user_id]
+        profile.current_streak, profile.longest_streak, profile.last_active_date = compute_streaks(active_days)
+        changed.append(profile)
+    UserProfile.objects.using(db).bulk_update(
+        changed, ['current_streak', 'longest_streak', 'last_active_date'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fitness', '0012_workoutvideo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='current_streak',
+            field=models.IntegerField(default=0, help_text='Consecutive active days ending on last_active_date.'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='last_active_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='longest_streak',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_streaks, migrations.RunPython.noop, hints={'model_name': 'userprofile'}),
+    ]
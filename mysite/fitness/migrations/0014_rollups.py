@@ -0,0 +1,87 @@
+# Generated by Django 5.0.13 on 2026-10-18 14:00
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+PERIODS = {
+    'WeeklyUserStats': lambda day: day - timedelta(days=day.weekday()),
+    'MonthlyUserStats': lambda day: day.replace(day=1),
+}
+
+
+def backfill_rollups(apps, schema_editor):
+    """Sum the existing DailyUserStats into both rollups, like fitness.stats.rebuild_rollups()."""
+    db = schema_editor.connection.alias
+    DailyUserStats = apps.get_model('fitness', 'DailyUserStats')
+    for model_name, period_for in PERIODS.items():
+        model = apps.get_model('fitness', model_name)
+        model.objects.using(db).all().delete()
+        rows = DailyUserStats.objects.using(db).order_by('user', 'date').values_list(
+            'user', 'date', 'calories_burned', 'time_spent_today', 'workouts_today', 'weight')
+        pending = []
+        current = None
+        for user_id, day, calories, seconds, workouts, weight in rows.iterator(chunk_size=5000):
+            period_start = period_for(day)
+            if current is None or (current.user_id, current.period_start) != (user_id, period_start):
+                current = model(user_id=user_id, period_start=period_start)
+                pending.append(current)
+            current.calories_burned += calories or 0
+            current.time_spent += seconds or 0
+            current.workouts += workouts or 0
+            if weight is not None:
+                # Rows come in date order, so the last weight seen is the latest
+                current.weight, current.weight_date = weight, day
+            if len(pending) > 1000:
+                model.objects.using(db).bulk_create(pending[:-1], batch_size=1000)
+                pending = pending[-1:]
+        model.objects.using(db).bulk_create(pending, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fitness', '0013_userprofile_streaks'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyUserStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField()),
+                ('calories_burned', models.FloatField(default=0)),
+                ('time_spent', models.IntegerField(default=0, help_text='Time spent active on the site, in seconds.')),
+                ('workouts', models.IntegerField(default=0)),
+                ('weight', models.FloatField(blank=True, help_text='Latest weight recorded in the period.', null=True)),
+                ('weight_date', models.DateField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+                'unique_together': {('user', 'period_start')},
+            },
+        ),
+        migrations.CreateModel(
+            name='WeeklyUserStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField()),
+                ('calories_burned', models.FloatField(default=0)),
+                ('time_spent', models.IntegerField(default=0, help_text='Time spent active on the site, in seconds.')),
+                ('workouts', models.IntegerField(default=0)),
+                ('weight', models.FloatField(blank=True, help_text='Latest weight recorded in the period.', null=True)),
+                ('weight_date', models.DateField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+                'unique_together': {('user', 'period_start')},
+            },
+        ),
+        # Named for the sharded tables, so it runs on shards as well as on the primary
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop, hints={'model_name': 'dailyuserstats'}),
+    ]
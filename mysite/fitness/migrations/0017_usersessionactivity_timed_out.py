@@ -0,0 +1,18 @@
+# Generated by Django 5.0.13 on 2026-10-18 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fitness', '0016_background_tasks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersessionactivity',
+            name='timed_out',
+            field=models.BooleanField(default=False, help_text='Closed by close_stale_sessions with no duration; a later logout still counts.'),
+        ),
+    ]
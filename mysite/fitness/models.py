@@ -1,9 +1,96 @@
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, connections, models, router, transaction
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from django.db.models import F
+from django.db.models import Case, F, Q, Value, When
+from datetime import timedelta
+
+from .cache import bump_user_version, user_cache
+from .catalog import bump_catalog_version
+from .sharding import group_by_shard, shard_for, shard_settings
+from .sqlite import apply_pragmas
+
+# A day counts towards a streak once any time or a workout is recorded on it, however it
+# got there. Streaks recomputed from history use ACTIVE_DAY; writes advancing them as they
+# go use is_active_day(), so both agree.
+ACTIVE_DAY = Q(time_spent_today__gt=0) | Q(workouts_today__gt=0)
+
+
+def is_active_day(seconds=0, workouts=0):
+    """Whether adding `seconds` and `workouts` to a day makes it match ACTIVE_DAY."""
+    return seconds > 0 or workouts > 0
+
+
+def compute_streaks(active_days):
+    """
+    Streak state for an ascending iterable of distinct active dates:
+    (current streak ending on the last active day, longest streak, last active day).
+    """
+    current = longest = 0
+    last = None
+    for day in active_days:
+        current = current + 1 if last is not None and day - last == timedelta(days=1) else 1
+        longest = max(longest, current)
+        last = day
+    return current, longest, last
+
+
+def can_upsert(connection, returning=False):
+    """
+    Whether `connection` runs INSERT ... ON CONFLICT (...) DO UPDATE, and with `returning`
+    also INSERT ... RETURNING. SQLite gained these in 3.24 and 3.35, below which the
+    managers fall back to one get-or-create and UPDATE per row.
+    """
+    features = connection.features
+    if not features.supports_update_conflicts_with_target:
+        return False
+    return features.can_return_columns_from_insert or not returning
+
+
+class UserProfileManager(models.Manager):
+    def record_active_day(self, users, day, **updates):
+        """
+        Advance the streaks of `users` (instances or ids) for activity on `day`, in one UPDATE.
+        Extra `updates` are applied in the same statement. Days older than a user's last
+        active day can't be applied incrementally and are left to DailyUserStats.objects.streaks().
+        """
+        previous = day - timedelta(days=1)
+        continues = Q(last_active_date=previous)
+        restarts = Q(last_active_date__isnull=True) | Q(last_active_date__lt=previous)
+        return self.filter(user__in=[getattr(u, 'pk', u) for u in users]).update(
+            current_streak=Case(
+                When(continues, then=F('current_streak') + 1),
+                When(restarts, then=Value(1)),
+                default=F('current_streak'),
+            ),
+            longest_streak=Case(
+                When(continues & Q(current_streak__gte=F('longest_streak')), then=F('current_streak') + 1),
+                When(restarts & Q(longest_streak__lt=1), then=Value(1)),
+                default=F('longest_streak'),
+            ),
+            last_active_date=Case(
+                When(last_active_date__gt=day, then=F('last_active_date')),
+                default=Value(day),
+            ),
+            **updates,
+        )
+
+    def record_active_days(self, rows):
+        """
+        record_active_day() for the rows of a DailyUserStats.objects.bulk_increment() that
+        make their day active, with one UPDATE per day, oldest first.
+        """
+        users_by_day = {}
+        for row in rows:
+            if is_active_day(row.get('seconds', 0), row.get('workouts', 0)):
+                users_by_day.setdefault(row['date'], set()).add(row['user'])
+        for day in sorted(users_by_day):
+            self.record_active_day(users_by_day[day], day)
+
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -15,10 +102,192 @@ class UserProfile(models.Model):
     height = models.FloatField(null=True, blank=True)
     gender = models.CharField(max_length=10, blank=True, null=True)
     level = models.CharField(max_length=20, default='beginner')
+    current_streak = models.IntegerField(default=0, help_text="Consecutive active days ending on last_active_date.")
+    longest_streak = models.IntegerField(default=0)
+    last_active_date = models.DateField(null=True, blank=True)
+
+    objects = UserProfileManager()
 
     def __str__(self):
         return self.user.username
 
+    def day_streak(self, today):
+        """The streak as of `today`: still alive if the user was active today or yesterday."""
+        if self.last_active_date is not None and self.last_active_date >= today - timedelta(days=1):
+            return self.current_streak
+        return 0
+
+class ShardedManager(models.Manager):
+    """Manager for the tables sharded by user id; see fitness.sharding."""
+
+    def for_user(self, user):
+        """`user`'s rows, on the shard that holds them."""
+        queryset = self.filter(user=user)
+        alias = shard_for(user, default=None)
+        return queryset if alias is None else queryset.using(alias)
+
+    def db_for_user(self, user):
+        return shard_for(user, default=self._db or router.db_for_write(self.model))
+
+
+class DailyUserStatsManager(ShardedManager):
+    UPSERT_FIELDS = ('user', 'date', 'calories_burned', 'weight', 'time_spent_today', 'workouts_today')
+    # Rows per statement; keeps parameter counts well under SQLite's limit.
+    UPSERT_BATCH_SIZE = 100
+
+    def increment(self, user, date, calories=0, workouts=0, seconds=0, weight=None):
+        """
+        Add to a user's stats for `date` in a single statement, creating the row if needed,
+        and apply the same delta to the weekly and monthly rollups.
+        `weight` overwrites the stored weight when given. Returns the row as it is after the update.
+        """
+        user_id = getattr(user, 'pk', user)
+        db = self.db_for_user(user_id)
+        connection = connections[db]
+        if not can_upsert(connection, returning=True):
+            return self._increment_fallback(db, user_id, date, calories, workouts, seconds, weight)
+
+        opts = self.model._meta
+        fields = [opts.get_field(name) for name in self.UPSERT_FIELDS]
+        sql = self._upsert_sql(connection, 1, returning=True)
+        params = [user_id, connection.ops.adapt_datefield_value(date), calories, weight, seconds, workouts]
+        delta = {'calories': calories, 'workouts': workouts, 'seconds': seconds, 'weight': weight}
+        with transaction.atomic(using=db), connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+            self._upsert_rollups(connection, cursor, [((user_id, date), delta)])
+
+        values = [opts.pk.to_python(row[0])] + [f.to_python(v) for f, v in zip(fields, row[1:])]
+        instance = self.model(
+            pk=values[0], user_id=values[1], date=values[2], calories_burned=values[3],
+            weight=values[4], time_spent_today=values[5], workouts_today=values[6],
+        )
+        instance._state.adding = False
+        instance._state.db = db
+        return instance
+
+    def bulk_increment(self, rows):
+        """
+        Apply many increments at once. `rows` is an iterable of dicts with `user` (instance or id)
+        and `date`, plus any of `calories`, `workouts`, `seconds` and `weight`.
+        Rows for the same (user, date) are merged first; returns the number of rows written.
+        """
+        merged = {}
+        for row in rows:
+            key = (getattr(row['user'], 'pk', row['user']), row['date'])
+            delta = merged.setdefault(key, {'calories': 0, 'workouts': 0, 'seconds': 0, 'weight': None})
+            delta['calories'] += row.get('calories', 0)
+            delta['workouts'] += row.get('workouts', 0)
+            delta['seconds'] += row.get('seconds', 0)
+            if row.get('weight') is not None:
+                delta['weight'] = row['weight']
+        if not merged:
+            return 0
+
+        # One transaction per shard: a user's daily rows and rollups always live together
+        shards = {}
+        for key, delta in merged.items():
+            shards.setdefault(self.db_for_user(key[0]), []).append((key, delta))
+        for db, items in shards.items():
+            self._bulk_upsert(db, items)
+        return len(merged)
+
+    def _bulk_upsert(self, db, items):
+        connection = connections[db]
+        with transaction.atomic(using=db):
+            if not can_upsert(connection):
+                for (user_id, date), d in items:
+                    self._increment_fallback(db, user_id, date, d['calories'], d['workouts'], d['seconds'], d['weight'])
+                return
+
+            with connection.cursor() as cursor:
+                for i in range(0, len(items), self.UPSERT_BATCH_SIZE):
+                    batch = items[i:i + self.UPSERT_BATCH_SIZE]
+                    params = []
+                    for (user_id, date), d in batch:
+                        params += [user_id, connection.ops.adapt_datefield_value(date),
+                                   d['calories'], d['weight'], d['seconds'], d['workouts']]
+                    cursor.execute(self._upsert_sql(connection, len(batch)), params)
+                self._upsert_rollups(connection, cursor, items)
+
+    def _upsert_rollups(self, connection, cursor, items):
+        """Apply merged daily deltas to every rollup table, one statement per table and batch."""
+        for model in ROLLUP_MODELS:
+            periods = {}
+            for (user_id, date), d in items:
+                key = (user_id, model.period_for(date))
+                total = periods.setdefault(key, {'calories': 0, 'workouts': 0, 'seconds': 0,
+                                                 'weight': None, 'weight_date': None})
+                total['calories'] += d['calories']
+                total['workouts'] += d['workouts']
+                total['seconds'] += d['seconds']
+                if d['weight'] is not None and (total['weight_date'] is None or date >= total['weight_date']):
+                    total['weight'], total['weight_date'] = d['weight'], date
+            merged = list(periods.items())
+            for i in range(0, len(merged), self.UPSERT_BATCH_SIZE):
+                batch = merged[i:i + self.UPSERT_BATCH_SIZE]
+                params = []
+                for (user_id, period_start), t in batch:
+                    params += [user_id, connection.ops.adapt_datefield_value(period_start),
+                               t['calories'], t['seconds'], t['workouts'], t['weight'],
+                               connection.ops.adapt_datefield_value(t['weight_date'])]
+                cursor.execute(model.objects._upsert_sql(connection, len(batch)), params)
+
+    def streaks(self, users):
+        """
+        Recompute streak state from history for `users` (instances or ids). Returns
+        {user_id: {'current_streak', 'longest_streak', 'last_active_date'}}, including users
+        with no active days. Reads only (user, date) pairs, in index order.
+        """
+        user_ids = [getattr(u, 'pk', u) for u in users]
+        days = {user_id: [] for user_id in user_ids}
+        for db, shard_user_ids in group_by_shard(user_ids, default=self._db or router.db_for_read(self.model)).items():
+            rows = (self.using(db).filter(ACTIVE_DAY, user__in=shard_user_ids)
+                    .order_by('user', 'date').values_list('user', 'date'))
+            for user_id, day in rows.iterator(chunk_size=5000):
+                days[user_id].append(day)
+        result = {}
+        for user_id, active_days in days.items():
+            current, longest, last = compute_streaks(active_days)
+            result[user_id] = {'current_streak': current, 'longest_streak': longest, 'last_active_date': last}
+        return result
+
+    def _upsert_sql(self, connection, num_rows, returning=False):
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        table = qn(opts.db_table)
+        columns = [qn(opts.get_field(name).column) for name in self.UPSERT_FIELDS]
+        user_col, date_col, calories_col, weight_col, seconds_col, workouts_col = columns
+        values = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * num_rows)
+        sql = (
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES {values} "
+            f"ON CONFLICT ({user_col}, {date_col}) DO UPDATE SET "
+            f"{calories_col} = {table}.{calories_col} + EXCLUDED.{calories_col}, "
+            f"{weight_col} = COALESCE(EXCLUDED.{weight_col}, {table}.{weight_col}), "
+            f"{seconds_col} = {table}.{seconds_col} + EXCLUDED.{seconds_col}, "
+            f"{workouts_col} = {table}.{workouts_col} + EXCLUDED.{workouts_col}"
+        )
+        if returning:
+            sql += f" RETURNING {', '.join([qn(opts.pk.column)] + columns)}"
+        return sql
+
+    def _increment_fallback(self, db, user_id, date, calories, workouts, seconds, weight):
+        with transaction.atomic(using=db):
+            stats, _ = self.using(db).select_for_update().get_or_create(user_id=user_id, date=date)
+            updates = {
+                'calories_burned': F('calories_burned') + calories,
+                'time_spent_today': F('time_spent_today') + seconds,
+                'workouts_today': F('workouts_today') + workouts,
+            }
+            if weight is not None:
+                updates['weight'] = weight
+            self.using(db).filter(pk=stats.pk).update(**updates)
+            stats.refresh_from_db()
+            for model in ROLLUP_MODELS:
+                model.objects._increment_fallback(db, user_id, date, calories, workouts, seconds, weight)
+        return stats
+
+
 class DailyUserStats(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     date = models.DateField(default=timezone.now)
@@ -27,14 +296,128 @@ class DailyUserStats(models.Model):
     time_spent_today = models.IntegerField(default=0, help_text="Time spent active on the site today, in seconds.")
     workouts_today = models.IntegerField(default=0, help_text="Number of workouts completed today.")
 
+    objects = DailyUserStatsManager()
 
     class Meta:
         unique_together = ('user', 'date') # Ensure only one entry per user per day
+        indexes = [
+            # The unique (user, date) index already serves the dashboard's 30-day range scan.
+            # This one answers "latest known weight before a date" from the index alone.
+            models.Index(
+                fields=['user', '-date', 'weight'],
+                condition=models.Q(weight__isnull=False),
+                name='dailystats_user_weight_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s stats for {self.date}"
 
 
+class RollupManager(ShardedManager):
+    UPSERT_FIELDS = ('user', 'period_start', 'calories_burned', 'time_spent', 'workouts', 'weight', 'weight_date')
+
+    def _upsert_sql(self, connection, num_rows):
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        table = qn(opts.db_table)
+        columns = [qn(opts.get_field(name).column) for name in self.UPSERT_FIELDS]
+        user_col, period_col, calories_col, time_col, workouts_col, weight_col, weight_date_col = columns
+        values = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * num_rows)
+        # A reading replaces the period's weight only if it is at least as recent as the stored one
+        newer = (f"EXCLUDED.{weight_col} IS NOT NULL AND ({table}.{weight_date_col} IS NULL "
+                 f"OR EXCLUDED.{weight_date_col} >= {table}.{weight_date_col})")
+        return (
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES {values} "
+            f"ON CONFLICT ({user_col}, {period_col}) DO UPDATE SET "
+            f"{calories_col} = {table}.{calories_col} + EXCLUDED.{calories_col}, "
+            f"{time_col} = {table}.{time_col} + EXCLUDED.{time_col}, "
+            f"{workouts_col} = {table}.{workouts_col} + EXCLUDED.{workouts_col}, "
+            f"{weight_col} = CASE WHEN {newer} THEN EXCLUDED.{weight_col} ELSE {table}.{weight_col} END, "
+            f"{weight_date_col} = CASE WHEN {newer} THEN EXCLUDED.{weight_date_col} ELSE {table}.{weight_date_col} END"
+        )
+
+    def _increment_fallback(self, db, user_id, date, calories, workouts, seconds, weight):
+        rollup, _ = self.using(db).select_for_update().get_or_create(
+            user_id=user_id, period_start=self.model.period_for(date))
+        updates = {
+            'calories_burned': F('calories_burned') + calories,
+            'time_spent': F('time_spent') + seconds,
+            'workouts': F('workouts') + workouts,
+        }
+        if weight is not None and (rollup.weight_date is None or date >= rollup.weight_date):
+            updates['weight'] = weight
+            updates['weight_date'] = date
+        self.using(db).filter(pk=rollup.pk).update(**updates)
+
+
+class PeriodUserStats(models.Model):
+    """
+    Totals of DailyUserStats over a calendar period, kept in step by DailyUserStats.objects
+    increments and rebuilt with `manage.py rebuild_rollups`.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    period_start = models.DateField()
+    calories_burned = models.FloatField(default=0)
+    time_spent = models.IntegerField(default=0, help_text="Time spent active on the site, in seconds.")
+    workouts = models.IntegerField(default=0)
+    weight = models.FloatField(null=True, blank=True, help_text="Latest weight recorded in the period.")
+    weight_date = models.DateField(null=True, blank=True)
+
+    objects = RollupManager()
+
+    class Meta:
+        abstract = True
+        unique_together = ('user', 'period_start')
+
+    @classmethod
+    def period_for(cls, day):
+        raise NotImplementedError
+
+    @classmethod
+    def next_period(cls, period_start):
+        raise NotImplementedError
+
+
+class WeeklyUserStats(PeriodUserStats):
+    """Weeks start on Monday."""
+
+    class Meta(PeriodUserStats.Meta):
+        pass
+
+    @classmethod
+    def period_for(cls, day):
+        return day - timedelta(days=day.weekday())
+
+    @classmethod
+    def next_period(cls, period_start):
+        return period_start + timedelta(days=7)
+
+    def __str__(self):
+        return f"{self.user.username}'s stats for the week of {self.period_start}"
+
+
+class MonthlyUserStats(PeriodUserStats):
+    class Meta(PeriodUserStats.Meta):
+        pass
+
+    @classmethod
+    def period_for(cls, day):
+        return day.replace(day=1)
+
+    @classmethod
+    def next_period(cls, period_start):
+        if period_start.month == 12:
+            return period_start.replace(year=period_start.year + 1, month=1)
+        return period_start.replace(month=period_start.month + 1)
+
+    def __str__(self):
+        return f"{self.user.username}'s stats for {self.period_start:%B %Y}"
+
+
+ROLLUP_MODELS = (WeeklyUserStats, MonthlyUserStats)
+
+
 class UserSessionActivity(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     session_key = models.CharField(max_length=64, db_index=True)
@@ -42,15 +425,144 @@ class UserSessionActivity(models.Model):
     logout_time = models.DateTimeField(null=True, blank=True)
     duration_seconds = models.IntegerField(default=0, help_text="Computed when the user logs out.")
     date = models.DateField(default=timezone.now, help_text="Login date for daily aggregation.")
-    
+    timed_out = models.BooleanField(
+        default=False, help_text="Closed by close_stale_sessions with no duration; a later logout still counts.",
+    )
+
+    objects = ShardedManager()
+
     class Meta:
         unique_together = ('user', 'session_key')
         ordering = ['-login_time']
+        indexes = [
+            # Open sessions only: the logout lookup stays small however much history a user has
+            models.Index(
+                fields=['user', '-login_time'],
+                condition=models.Q(logout_time__isnull=True),
+                name='session_user_open_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.user.username} session on {self.date} ({self.duration_seconds}s)"
 
 
+class SessionDailySummaryManager(ShardedManager):
+    UPSERT_BATCH_SIZE = DailyUserStatsManager.UPSERT_BATCH_SIZE
+
+    def bulk_add(self, totals, using=None):
+        """
+        Add `totals`, a {(user_id, date): (sessions, seconds)} mapping, to the stored
+        summaries, creating them as needed. Returns the number of summaries written.
+        Without `using`, each user's totals go to that user's shard.
+        """
+        if using is None:
+            shards = {}
+            for key, value in totals.items():
+                shards.setdefault(self.db_for_user(key[0]), {})[key] = value
+            return sum(self.bulk_add(part, using=db) for db, part in shards.items())
+        db = using
+        connection = connections[db]
+        items = list(totals.items())
+        with transaction.atomic(using=db):
+            if not can_upsert(connection):
+                for (user_id, date), (sessions, seconds) in items:
+                    summary, _ = self.using(db).select_for_update().get_or_create(user_id=user_id, date=date)
+                    self.using(db).filter(pk=summary.pk).update(
+                        sessions=F('sessions') + sessions, total_seconds=F('total_seconds') + seconds)
+                return len(items)
+
+            opts = self.model._meta
+            qn = connection.ops.quote_name
+            table = qn(opts.db_table)
+            user_col, date_col, sessions_col, seconds_col = (
+                qn(opts.get_field(name).column) for name in ('user', 'date', 'sessions', 'total_seconds'))
+            with connection.cursor() as cursor:
+                for i in range(0, len(items), self.UPSERT_BATCH_SIZE):
+                    batch = items[i:i + self.UPSERT_BATCH_SIZE]
+                    params = []
+                    for (user_id, date), (sessions, seconds) in batch:
+                        params += [user_id, connection.ops.adapt_datefield_value(date), sessions, seconds]
+                    cursor.execute(
+                        f"INSERT INTO {table} ({user_col}, {date_col}, {sessions_col}, {seconds_col}) "
+                        f"VALUES {', '.join(['(%s, %s, %s, %s)'] * len(batch))} "
+                        f"ON CONFLICT ({user_col}, {date_col}) DO UPDATE SET "
+                        f"{sessions_col} = {table}.{sessions_col} + EXCLUDED.{sessions_col}, "
+                        f"{seconds_col} = {table}.{seconds_col} + EXCLUDED.{seconds_col}",
+                        params,
+                    )
+        return len(items)
+
+
+class SessionDailySummary(models.Model):
+    """Sessions compacted out of UserSessionActivity once they are past the retention window."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField()
+    sessions = models.IntegerField(default=0)
+    total_seconds = models.IntegerField(default=0)
+
+    objects = SessionDailySummaryManager()
+
+    class Meta:
+        unique_together = ('user', 'date')
+        verbose_name_plural = 'session daily summaries'
+
+    def __str__(self):
+        return f"{self.user.username}'s {self.sessions} sessions on {self.date}"
+
+
+class WorkoutVideo(models.Model):
+    """A catalog entry, used when FITNESS_VIDEO_CATALOG_SOURCE is 'database'."""
+    video_id = models.SlugField(max_length=50, unique=True)
+    title = models.CharField(max_length=200)
+    sets = models.JSONField(help_text="Sets per level, e.g. {\"beginner\": 2, \"intermediate\": 3, \"advanced\": 4}.")
+    calories_per_set = models.JSONField(help_text="Calories per set, keyed by level like sets.")
+    position = models.PositiveIntegerField(default=0, help_text="Display order.")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['position', 'video_id']
+
+    def __str__(self):
+        return self.title
+
+    def as_catalog_entry(self):
+        return {
+            "id": self.video_id,
+            "title": self.title,
+            "sets": self.sets,
+            "calories_per_set": self.calories_per_set,
+        }
+
+
+class BackgroundTask(models.Model):
+    """Deferred work queued by fitness.tasks.enqueue() and run by `manage.py run_tasks`."""
+    QUEUED = 'queued'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=200, help_text="Dotted path of the task function.")
+    args = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    # The claim of the worker running the task, valid until locked_until
+    locked_by = models.CharField(max_length=64, null=True, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Workers look for due tasks in run_after order
+            models.Index(fields=['status', 'run_after'], name='task_due_idx'),
+            models.Index(fields=['locked_by'], name='task_locked_by_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name}{tuple(self.args)} ({self.status}, {self.attempts} attempts)"
+
+
 @receiver(user_logged_in)
 def on_user_logged_in(sender, request, user, **kwargs):
     # Ensure we have a session key
@@ -60,8 +572,8 @@ def on_user_logged_in(sender, request, user, **kwargs):
         session_key = request.session.session_key
     if not session_key:
         session_key = f"no-session-{timezone.now().timestamp()}"
-    # Create a new session activity record
-    UserSessionActivity.objects.create(
+    # Create a new session activity record, on the user's shard
+    UserSessionActivity.objects.for_user(user).create(
         user=user,
         session_key=session_key,
         login_time=timezone.now(),
@@ -76,10 +588,13 @@ def on_user_logged_out(sender, request, user, **kwargs):
     session_key = getattr(getattr(request, 'session', None), 'session_key', None)
 
     # Find the latest open session for this user (prefer matching session_key if available)
-    qs = UserSessionActivity.objects.filter(user=user, logout_time__isnull=True)
+    qs = UserSessionActivity.objects.for_user(user).filter(logout_time__isnull=True)
     if session_key:
         qs = qs.filter(session_key=session_key)
     session = qs.order_by('-login_time').first()
+    if not session and session_key:
+        # Closed as stale while the user was still around: it gets its real duration now
+        session = UserSessionActivity.objects.for_user(user).filter(session_key=session_key, timed_out=True).first()
     if not session:
         return
 
@@ -88,8 +603,42 @@ def on_user_logged_out(sender, request, user, **kwargs):
     if duration < 0:
         duration = 0
     session.duration_seconds = duration
-    session.save(update_fields=['logout_time', 'duration_seconds'])
+    session.timed_out = False
+    session.save(update_fields=['logout_time', 'duration_seconds', 'timed_out'])
+
+    # Roll up to DailyUserStats for the session's login date, after the response
+    from .tasks import enqueue, rollup_session_time  # fitness.tasks imports this module
+    enqueue(rollup_session_time, user.pk, session.date, duration)
+
+
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Drop this process's cached copy now; bumping the version invalidates other processes' copies
+    user_id = instance.pk if sender is User else instance.user_id
+    user_cache.invalidate(user_id)
+    bump_user_version(user_id)
+
+
+@receiver(post_delete, sender=User)
+def delete_sharded_rows(sender, instance, **kwargs):
+    # The cascade only reaches rows on the user's own database
+    alias = shard_for(instance, default=None)
+    if alias is None or alias == instance._state.db:
+        return
+    for model in (DailyUserStats, UserSessionActivity, SessionDailySummary) + ROLLUP_MODELS:
+        model.objects.using(alias).filter(user_id=instance.pk).delete()
+
+
+@receiver([post_save, post_delete], sender=WorkoutVideo)
+def invalidate_video_catalog(sender, **kwargs):
+    bump_catalog_version()
+
 
-    # Roll up to DailyUserStats for the session's login date
-    daily, _ = DailyUserStats.objects.get_or_create(user=user, date=session.date)
-    DailyUserStats.objects.filter(pk=daily.pk).update(time_spent_today=F('time_spent_today') + duration)
\ No newline at end of file
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        apply_pragmas(connection)
+        if connection.alias in shard_settings()['ALIASES'] and connection.alias != DEFAULT_DB_ALIAS:
+            # Shard rows reference users that live on the primary
+            apply_pragmas(connection, {'foreign_keys': 'OFF'})
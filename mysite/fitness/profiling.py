@@ -0,0 +1,126 @@
+"""
+Opt-in cProfile capture for selected views.
+
+A view wrapped with @profile_view is profiled when any of these hold:
+  - FITNESS_PROFILING['ALWAYS'] is true,
+  - a staff user sends the FITNESS_PROFILING['HEADER'] header,
+  - a random draw falls under FITNESS_PROFILING['SAMPLE_RATE'].
+
+Each profiled request writes `<name>.prof` (pstats format) and a
+`<name>.json` sidecar with the path, view, user id, wall time and a timeline
+of the SQL it ran. Only the newest MAX_FILES profiles are kept. Use
+`manage.py profile_report` to merge them into a hot-function report.
+"""
+import cProfile
+import functools
+import json
+import os
+import random
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+DEFAULTS = {
+    'ALWAYS': False,
+    'SAMPLE_RATE': 0.0,
+    'HEADER': 'X-Fitness-Profile',
+    'DIRECTORY': None,
+    'MAX_FILES': 500,
+}
+
+
+def profiling_settings():
+    config = {**DEFAULTS, **getattr(settings, 'FITNESS_PROFILING', {})}
+    if not config['DIRECTORY']:
+        config['DIRECTORY'] = os.path.join(settings.BASE_DIR, 'profiles')
+    return config
+
+
+def should_profile(request, config):
+    if config['ALWAYS']:
+        return True
+    header = 'HTTP_' + config['HEADER'].upper().replace('-', '_')
+    if request.META.get(header):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            return True
+    return config['SAMPLE_RATE'] > 0 and random.random() < config['SAMPLE_RATE']
+
+
+class SQLTimeline:
+    """Execute wrapper recording when each query started and how long it took."""
+
+    def __init__(self, started):
+        self.started = started
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            end = time.perf_counter()
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'offset_ms': round((start - self.started) * 1000, 3),
+                'duration_ms': round((end - start) * 1000, 3),
+                'sql': sql,
+            })
+
+
+def profile_view(view):
+    """
+    Profile a view according to FITNESS_PROFILING. Apply it below @api_view and
+    @permission_classes so the request is already authenticated.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        config = profiling_settings()
+        if not should_profile(request, config):
+            return view(request, *args, **kwargs)
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        timeline = SQLTimeline(started)
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(timeline))
+                response = profiler.runcall(view, request, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            write_profile(config, profiler, {
+                'path': request.path,
+                'method': request.method,
+                'view': view.__name__,
+                'user_id': getattr(getattr(request, 'user', None), 'pk', None),
+                'timestamp': time.time(),
+                'elapsed_ms': round(elapsed * 1000, 3),
+                'sql': timeline.queries,
+            })
+        return response
+    return wrapper
+
+
+def write_profile(config, profiler, meta):
+    directory = config['DIRECTORY']
+    os.makedirs(directory, exist_ok=True)
+    # Time-prefixed names sort oldest first, which is what rotation relies on
+    name = f"{time.time_ns()}-{meta['view']}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    profiler.dump_stats(os.path.join(directory, name + '.prof'))
+    with open(os.path.join(directory, name + '.json'), 'w') as f:
+        json.dump(meta, f)
+    rotate(directory, config['MAX_FILES'])
+
+
+def rotate(directory, max_files):
+    profiles = sorted(n[:-len('.prof')] for n in os.listdir(directory) if n.endswith('.prof'))
+    for name in profiles[:max(0, len(profiles) - max_files)]:
+        for suffix in ('.prof', '.json'):
+            try:
+                os.remove(os.path.join(directory, name + suffix))
+            except FileNotFoundError:
+                pass  # another worker rotated it first
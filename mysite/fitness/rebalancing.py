@@ -0,0 +1,104 @@
+"""
+Moving users' sharded rows onto the shard the ring assigns them.
+
+After FITNESS_SHARDS['ALIASES'] changes, new writes already go to each user's
+new shard, while the history is still where it was. move_user copies that
+history over in batches of primary keys and deletes each batch from the old
+shard once it is on the new one:
+  - daily rows are merged in with DailyUserStats.objects.bulk_increment, so
+    anything written on the new shard in the meantime is added to, not
+    overwritten, and the rollups there follow along; the old shard's rollups
+    are dropped at the end;
+  - sessions are copied as they are, skipping any already copied;
+  - session summaries are added to the new shard's.
+Each batch is one transaction on each side, so both shards stay writable
+while a user is moved. A batch that fails between the two commits is copied
+again on the next run; for daily rows and summaries that counts it twice, so
+rerun only after a clean stop.
+"""
+import time
+
+from django.db import transaction
+
+from .cache import bump_user_version
+from .models import ROLLUP_MODELS, DailyUserStats, SessionDailySummary, UserSessionActivity
+from .sharding import shard_for
+
+SHARDED = (DailyUserStats, UserSessionActivity, SessionDailySummary) + ROLLUP_MODELS
+SESSION_FIELDS = ('user_id', 'session_key', 'login_time', 'logout_time', 'duration_seconds', 'date', 'timed_out')
+
+
+def users_on(alias, user_ids=None):
+    """Ids of the users with any sharded rows on `alias`, in order."""
+    found = set()
+    for model in SHARDED:
+        queryset = model.objects.using(alias).order_by().values_list('user_id', flat=True).distinct()
+        if user_ids:
+            queryset = queryset.filter(user_id__in=user_ids)
+        found.update(queryset)
+    return sorted(found)
+
+
+def misplaced_users(alias, user_ids=None):
+    """Ids of the users with rows on `alias` whose shard is another one."""
+    return [user_id for user_id in users_on(alias, user_ids) if shard_for(user_id) != alias]
+
+
+def _batches(queryset, batch_size, pause):
+    """Yield successive primary key ordered batches of `queryset` rows as value tuples, pk first."""
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+        if not batch:
+            return
+        last_pk = batch[-1][0]
+        yield batch
+        if pause:
+            time.sleep(pause)
+
+
+def move_user(user_id, source, batch_size=1000, pause=0.0):
+    """Move `user_id`'s rows from `source` to the user's shard. Returns the number of rows moved."""
+    target = shard_for(user_id)
+    if target == source:
+        return 0
+    moved = 0
+
+    daily = DailyUserStats.objects.using(source).filter(user_id=user_id).values_list(
+        'pk', 'date', 'calories_burned', 'time_spent_today', 'workouts_today', 'weight')
+    for batch in _batches(daily, batch_size, pause):
+        DailyUserStats.objects.bulk_increment(
+            {'user': user_id, 'date': day, 'calories': calories, 'seconds': seconds,
+             'workouts': workouts, 'weight': weight}
+            for _, day, calories, seconds, workouts, weight in batch
+        )
+        with transaction.atomic(using=source):
+            DailyUserStats.objects.using(source).filter(pk__in=[row[0] for row in batch]).delete()
+        moved += len(batch)
+
+    sessions = UserSessionActivity.objects.using(source).filter(user_id=user_id).values_list('pk', *SESSION_FIELDS)
+    for batch in _batches(sessions, batch_size, pause):
+        with transaction.atomic(using=target):
+            UserSessionActivity.objects.using(target).bulk_create(
+                [UserSessionActivity(**dict(zip(SESSION_FIELDS, row[1:]))) for row in batch],
+                ignore_conflicts=True,
+            )
+        with transaction.atomic(using=source):
+            UserSessionActivity.objects.using(source).filter(pk__in=[row[0] for row in batch]).delete()
+        moved += len(batch)
+
+    summaries = SessionDailySummary.objects.using(source).filter(user_id=user_id).values_list(
+        'pk', 'date', 'sessions', 'total_seconds')
+    for batch in _batches(summaries, batch_size, pause):
+        SessionDailySummary.objects.bulk_add(
+            {(user_id, day): (count, seconds) for _, day, count, seconds in batch}, using=target)
+        with transaction.atomic(using=source):
+            SessionDailySummary.objects.using(source).filter(pk__in=[row[0] for row in batch]).delete()
+        moved += len(batch)
+
+    # The increments above already rebuilt the target's rollups
+    with transaction.atomic(using=source):
+        for model in ROLLUP_MODELS:
+            model.objects.using(source).filter(user_id=user_id).delete()
+    bump_user_version(user_id)
+    return moved
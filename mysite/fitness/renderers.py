@@ -0,0 +1,48 @@
+"""
+JSON rendering for the API.
+
+FastJSONRenderer is a drop-in for DRF's JSONRenderer that encodes with orjson
+when it is installed and falls back to DRF's stdlib encoder otherwise. Types
+orjson doesn't handle natively, and datetimes, whose format must match DRF's,
+go through DRF's encoder either way. `bytes` are taken to be JSON serialized
+already, e.g. a cached payload, and are sent as they are.
+
+SingleRendererNegotiation skips Accept header matching when a view has only
+one renderer, which is the case everywhere unless DEBUG adds the browsable API.
+"""
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - the stdlib path is the fallback
+    orjson = None
+
+_default = JSONEncoder().default
+
+
+def dumps(data):
+    """Serialize `data` to JSON bytes the way FastJSONRenderer would."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return JSONRenderer().render(data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, bytes):
+            return data
+        # orjson can't indent by an arbitrary amount; leave indented output to DRF
+        if orjson is None or self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class SingleRendererNegotiation(DefaultContentNegotiation):
+    def select_renderer(self, request, renderers, format_suffix=None):
+        if len(renderers) == 1 and not format_suffix:
+            return renderers[0], renderers[0].media_type
+        return super().select_renderer(request, renderers, format_suffix)
@@ -0,0 +1,165 @@
+"""
+Read/write splitting across a primary and read replicas.
+
+ReplicaReadMiddleware marks GET and HEAD requests to the views listed in
+FITNESS_REPLICAS['READ_VIEWS'], and admin changelists, as replica-safe.
+While such a request runs, ReplicaRouter sends its reads to one of
+FITNESS_REPLICAS['ALIASES'], picked once per request. Everything else goes to
+the primary ('default'):
+  - all writes;
+  - reads in every other request and outside requests;
+  - reads before the user is authenticated, e.g. the JWT user lookup, so a
+    user who has just registered can always log in;
+  - reads inside a transaction on the primary;
+  - reads for a user who wrote within the last STICKY_SECONDS. Every write path
+    calls bump_user_version, which pins the user to the primary for that long,
+    so a dashboard loaded right after a workout never shows stale totals.
+
+With no aliases configured, the router routes everything to the primary.
+"""
+import contextvars
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .sharding import SHARDED_MODELS, is_sharded, shard_for, shard_settings
+
+PRIMARY_PIN_KEY = 'fitness:user:{user_id}:primary'
+
+DEFAULTS = {
+    'ALIASES': [],
+    'READ_VIEWS': [],
+    'ADMIN_CHANGELISTS': True,
+    'STICKY_SECONDS': 10,
+}
+
+_read_state = contextvars.ContextVar('fitness_replica_reads', default=None)
+
+
+def replica_settings():
+    return {**DEFAULTS, **getattr(settings, 'FITNESS_REPLICAS', {})}
+
+
+def pin_to_primary(user_id):
+    """Send `user_id`'s replica-safe reads to the primary for the next STICKY_SECONDS."""
+    config = replica_settings()
+    if config['ALIASES']:
+        cache.set(PRIMARY_PIN_KEY.format(user_id=user_id), True, timeout=config['STICKY_SECONDS'])
+
+
+class ReadState:
+    """The replica picked for one request, and whether its user is pinned to the primary."""
+
+    def __init__(self, request, alias):
+        self.request = request
+        self.alias = alias
+        self._pinned = {}
+
+    def replica_for_user(self):
+        user = getattr(self.request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return None
+        if user.pk not in self._pinned:
+            self._pinned[user.pk] = cache.get(PRIMARY_PIN_KEY.format(user_id=user.pk)) is not None
+        return None if self._pinned[user.pk] else self.alias
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _read_state.get()
+        if state is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.replica_for_user() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary along with the data
+        return db not in replica_settings()['ALIASES']
+
+
+class ShardRouter:
+    """
+    Sends the sharded per-user tables to their user's shard, when the user is known from
+    the instance hint (saves, deletes, related lookups). Querysets name their shard
+    themselves through the managers' for_user(). Goes before ReplicaRouter.
+    """
+
+    def _shard(self, model, hints):
+        instance = hints.get('instance')
+        if instance is None or not is_sharded(model):
+            return None
+        user_id = instance.pk if instance._meta.label == settings.AUTH_USER_MODEL else getattr(instance, 'user_id', None)
+        return None if user_id is None else shard_for(user_id, default=None)
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS or db not in shard_settings()['ALIASES']:
+            return None
+        # Shards only hold the sharded tables
+        return app_label == 'fitness' and model_name in SHARDED_MODELS
+
+
+class ReplicaReadMiddleware:
+    """Marks replica-safe requests for ReplicaRouter. Must come after AuthenticationMiddleware."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        try:
+            return self.get_response(request)
+        finally:
+            self.reset(request)
+
+    async def __acall__(self, request):
+        try:
+            return await self.get_response(request)
+        finally:
+            self.reset(request)
+
+    def reset(self, request):
+        token = request.__dict__.pop('_replica_read_token', None)
+        if token is None:
+            return
+        try:
+            _read_state.reset(token)
+        except ValueError:
+            # Under ASGI process_view runs on a worker thread, in a copy of this context
+            _read_state.set(None)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        config = replica_settings()
+        if not config['ALIASES'] or request.method not in ('GET', 'HEAD') or not self.is_read_view(request, config):
+            return None
+        # Resolve the session user now, on the primary, so the router never has to
+        request.user.is_authenticated
+        request._replica_read_token = _read_state.set(ReadState(request, random.choice(config['ALIASES'])))
+        return None
+
+    def is_read_view(self, request, config):
+        match = request.resolver_match
+        if match.url_name in config['READ_VIEWS']:
+            return True
+        return config['ADMIN_CHANGELISTS'] and match.namespace == 'admin' and \
+            (match.url_name or '').endswith('_changelist')
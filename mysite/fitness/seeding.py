@@ -0,0 +1,161 @@
+"""
+Deterministic synthetic data for local load testing.
+
+Users are generated in fixed-size chunks. Each chunk draws from its own
+random.Random seeded with (seed, chunk index), so a chunk's contents don't
+depend on which process built it or in what order. Building chunks is plain
+Python and can run in a multiprocessing pool; the rows are always written by
+the calling process, in chunk order, with bulk_create.
+"""
+import math
+import random
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from multiprocessing import Pool
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .models import DailyUserStats, UserProfile, UserSessionActivity, compute_streaks
+from .sharding import group_by_shard
+from .stats import rebuild_rollups
+
+DEFAULT_PASSWORD = 'fitness-seed'
+LEVELS = ('beginner', 'intermediate', 'advanced')
+GENDERS = ('male', 'female', None)
+
+
+def build_chunk(spec):
+    """
+    Generate the rows for one chunk of users as plain tuples.
+    `spec` is a dict so it pickles cleanly for worker processes.
+    """
+    rng = random.Random(f"{spec['seed']}:{spec['chunk']}")
+    end_date = spec['end_date']
+    days = spec['days']
+    users = []
+    for i in range(spec['start'], spec['start'] + spec['count']):
+        weight = round(rng.uniform(50, 110), 1)
+        profile = {
+            'weight': weight,
+            'height': round(rng.uniform(150, 200), 1),
+            'gender': rng.choice(GENDERS),
+            'level': rng.choice(LEVELS),
+            'age': rng.randint(16, 75),
+        }
+        # Users drop in at different points in the window
+        active_days = rng.randint(1, days) if days else 0
+        stats = []
+        sessions = []
+        total_workouts = 0
+        total_time = 0
+        for d in range(active_days - 1, -1, -1):
+            day = end_date - timedelta(days=d)
+            if rng.random() < 0.3:
+                continue  # rest day
+            workouts = rng.randint(0, 3)
+            seconds = rng.randint(60, 5400)
+            if rng.random() < 0.1:
+                weight = round(weight + rng.uniform(-0.8, 0.8), 1)
+                day_weight = weight
+            else:
+                day_weight = None
+            stats.append((day, round(workouts * rng.uniform(80, 350), 1), day_weight, seconds, workouts))
+            total_workouts += workouts
+            total_time += seconds
+
+            for n in range(_poisson(rng, spec['sessions_per_day'])):
+                login = datetime.combine(day, time(), tzinfo=dt_timezone.utc) + timedelta(
+                    seconds=rng.randint(0, 86399))
+                duration = rng.randint(30, 7200)
+                sessions.append((f'seed-{i}-{day.isoformat()}-{n}', login, duration, day))
+        if sessions and rng.random() < 0.05:
+            # Leave the latest session open, as if the user never logged out
+            key, login, _, day = sessions[-1]
+            sessions[-1] = (key, login, None, day)
+        profile['total_workouts'] = total_workouts
+        profile['total_exercise_time'] = total_time
+        # Every generated day has time on site, so each one counts as active
+        profile['current_streak'], profile['longest_streak'], profile['last_active_date'] = \
+            compute_streaks(day for day, *_ in stats)
+        users.append({
+            'username': f"{spec['prefix']}{i}",
+            'email': f"{spec['prefix']}{i}@example.com",
+            'profile': profile,
+            'stats': stats,
+            'sessions': sessions,
+        })
+    return users
+
+
+def _poisson(rng, mean):
+    """Small-mean Poisson sample (Knuth); good enough for sessions per day."""
+    if mean <= 0:
+        return 0
+    threshold = math.exp(-mean)
+    k, p = 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= threshold:
+            return k
+        k += 1
+
+
+def write_chunk(rows, password_hash, batch_size, using='default'):
+    """Insert one generated chunk and return the new users' ids."""
+    with transaction.atomic(using=using):
+        users = User.objects.using(using).bulk_create(
+            [User(username=r['username'], email=r['email'], password=password_hash) for r in rows],
+            batch_size=batch_size,
+        )
+        UserProfile.objects.using(using).bulk_create(
+            [UserProfile(user=u, **r['profile']) for u, r in zip(users, rows)],
+            batch_size=batch_size,
+        )
+        # History goes to each user's shard, which is `using` unless sharding is on
+        members = dict(zip(users, rows))
+        for db, shard_users in group_by_shard(users, default=using).items():
+            with transaction.atomic(using=db):
+                DailyUserStats.objects.using(db).bulk_create(
+                    (DailyUserStats(user=u, date=day, calories_burned=calories, weight=weight,
+                                    time_spent_today=seconds, workouts_today=workouts)
+                     for u in shard_users
+                     for day, calories, weight, seconds, workouts in members[u]['stats']),
+                    batch_size=batch_size,
+                )
+                UserSessionActivity.objects.using(db).bulk_create(
+                    (UserSessionActivity(
+                        user=u, session_key=key, login_time=login, date=day,
+                        logout_time=login + timedelta(seconds=duration) if duration is not None else None,
+                        duration_seconds=duration or 0,
+                    )
+                     for u in shard_users
+                     for key, login, duration, day in members[u]['sessions']),
+                    batch_size=batch_size,
+                )
+        user_ids = [u.pk for u in users]
+        rebuild_rollups(user_ids, using=using)
+    return user_ids
+
+
+def seed(users, days, end_date, seed=0, sessions_per_day=1.0, chunk_size=1000, batch_size=5000,
+         jobs=1, prefix='seed', password=DEFAULT_PASSWORD, using='default'):
+    """
+    Create `users` users with up to `days` days of history ending at `end_date`.
+    Yields (chunk index, user ids) after each chunk is committed.
+    """
+    # One PBKDF2 hash shared by every seeded user; a fixed salt keeps reruns identical
+    password_hash = make_password(password, salt=f'fitnessseed{seed}')
+    specs = [
+        {'seed': seed, 'chunk': n, 'start': start, 'count': min(chunk_size, users - start),
+         'days': days, 'end_date': end_date, 'sessions_per_day': sessions_per_day, 'prefix': prefix}
+        for n, start in enumerate(range(0, users, chunk_size))
+    ]
+    if jobs > 1:
+        with Pool(jobs) as pool:
+            # imap keeps chunk order, so inserts (and primary keys) are the same as a serial run
+            for spec, rows in zip(specs, pool.imap(build_chunk, specs)):
+                yield spec['chunk'], write_chunk(rows, password_hash, batch_size, using)
+    else:
+        for spec in specs:
+            yield spec['chunk'], write_chunk(build_chunk(spec), password_hash, batch_size, using)
@@ -1,5 +1,7 @@
+from datetime import timedelta
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.utils import timezone
 from .models import UserProfile
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -19,4 +21,33 @@ class UserProfileSerializer(serializers.ModelSerializer):
             'weight', 
             'level', 
             'date_of_birth'
-        ]
\ No newline at end of file
+        ]
+
+
+class ActivityEventSerializer(serializers.Serializer):
+    """One entry of a /api/events/batch/ upload."""
+    REQUIRED_FIELDS = {
+        'activity': 'seconds',
+        'workout': 'calories_burned',
+        'weight': 'weight',
+    }
+
+    type = serializers.ChoiceField(choices=list(REQUIRED_FIELDS))
+    timestamp = serializers.DateTimeField()
+    seconds = serializers.IntegerField(min_value=1, required=False)
+    calories_burned = serializers.FloatField(min_value=0, required=False)
+    weight = serializers.FloatField(min_value=0, required=False)
+
+    # Tolerated clock skew between the client and the server
+    MAX_FUTURE_SKEW = timedelta(minutes=5)
+
+    def validate_timestamp(self, value):
+        if value > timezone.now() + self.MAX_FUTURE_SKEW:
+            raise serializers.ValidationError('timestamp cannot be in the future.')
+        return value
+
+    def validate(self, attrs):
+        field = self.REQUIRED_FIELDS[attrs['type']]
+        if attrs.get(field) is None:
+            raise serializers.ValidationError({field: f"This field is required for '{attrs['type']}' events."})
+        return attrs
@@ -0,0 +1,117 @@
+"""
+Housekeeping for UserSessionActivity.
+
+JWT clients rarely log out, so sessions stay open forever unless something
+closes them. close_stale_sessions closes every session that has been open for
+longer than the idle timeout with no duration: nothing records when the user
+was last active in a session, so no time is credited for it. The session is
+marked timed_out, and a later logout from it still records its real duration.
+
+compact_sessions folds closed sessions older than the retention window into
+SessionDailySummary rows and deletes them.
+
+Both functions work in batches of primary keys, and each batch runs in its
+own short transaction. The database write lock is never held for long, so
+live requests can get in between batches. With sharding, each shard is
+processed in turn.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import SessionDailySummary, UserSessionActivity
+from .sharding import shard_aliases
+
+DEFAULTS = {
+    # Seconds without a logout after which an open session counts as abandoned
+    'IDLE_TIMEOUT': 30 * 60,
+    # Closed sessions older than this many days are compacted into daily summaries
+    'RETENTION_DAYS': 90,
+    'BATCH_SIZE': 1000,
+    # Seconds to sleep between batches, leaving room for other writers
+    'PAUSE': 0.0,
+}
+
+
+def session_settings():
+    return {**DEFAULTS, **getattr(settings, 'FITNESS_SESSIONS', {})}
+
+
+def _session_dbs():
+    """The aliases holding sessions: every shard, or the usual database without sharding."""
+    return shard_aliases(default=router.db_for_write(UserSessionActivity))
+
+
+def close_stale_sessions(idle_timeout=None, batch_size=None, pause=None, now=None):
+    """
+    Close sessions opened more than `idle_timeout` seconds ago that are still open, with a
+    duration of 0 and marked timed_out. Returns the number of sessions closed.
+
+    No time is credited: DailyUserStats and the rollups are left as they are, since a guessed
+    duration would count abandoned tabs as activity. A later logout from a closed session
+    credits its real duration.
+    """
+    config = session_settings()
+    idle_timeout = config['IDLE_TIMEOUT'] if idle_timeout is None else idle_timeout
+    batch_size = batch_size or config['BATCH_SIZE']
+    pause = config['PAUSE'] if pause is None else pause
+    cutoff = (now or timezone.now()) - timedelta(seconds=idle_timeout)
+
+    closed = 0
+    for db in _session_dbs():
+        last_pk = 0
+        while True:
+            with transaction.atomic(using=db):
+                batch = list(
+                    UserSessionActivity.objects.using(db).select_for_update()
+                    .filter(logout_time__isnull=True, login_time__lt=cutoff, pk__gt=last_pk)
+                    .order_by('pk').values_list('pk', flat=True)[:batch_size]
+                )
+                if not batch:
+                    break
+                last_pk = batch[-1]
+                UserSessionActivity.objects.using(db).filter(pk__in=batch).update(
+                    logout_time=F('login_time'), duration_seconds=0, timed_out=True,
+                )
+            closed += len(batch)
+            if pause:
+                time.sleep(pause)
+    return closed
+
+
+def compact_sessions(retention_days=None, batch_size=None, pause=None, today=None):
+    """
+    Move closed sessions dated more than `retention_days` ago into SessionDailySummary and
+    delete them. Returns the number of sessions compacted.
+    """
+    config = session_settings()
+    retention_days = config['RETENTION_DAYS'] if retention_days is None else retention_days
+    batch_size = batch_size or config['BATCH_SIZE']
+    pause = config['PAUSE'] if pause is None else pause
+    before = (today or timezone.now().date()) - timedelta(days=retention_days)
+
+    compacted = 0
+    for db in _session_dbs():
+        while True:
+            with transaction.atomic(using=db):
+                batch = list(
+                    UserSessionActivity.objects.using(db).select_for_update()
+                    .filter(logout_time__isnull=False, date__lt=before)
+                    .order_by('pk').values_list('pk', 'user_id', 'date', 'duration_seconds')[:batch_size]
+                )
+                if not batch:
+                    break
+                totals = {}
+                for _, user_id, date, seconds in batch:
+                    sessions, total = totals.get((user_id, date), (0, 0))
+                    totals[(user_id, date)] = (sessions + 1, total + seconds)
+                SessionDailySummary.objects.bulk_add(totals, using=db)
+                UserSessionActivity.objects.using(db).filter(pk__in=[row[0] for row in batch]).delete()
+            compacted += len(batch)
+            if pause:
+                time.sleep(pause)
+    return compacted
@@ -0,0 +1,92 @@
+"""
+Sharding of the per-user stats tables by user id.
+
+DailyUserStats, UserSessionActivity and the tables written together with
+them (the weekly and monthly rollups, SessionDailySummary) can be spread over
+the aliases in FITNESS_SHARDS['ALIASES']. A user's rows all live on one shard,
+picked by a consistent hash ring with VNODES points per alias. Adding a shard
+therefore moves only about 1/N of the users; `manage.py rebalance_shards`
+moves them.
+
+Users, profiles and everything else stay on 'default'. Shard connections
+don't enforce foreign keys, because the rows there reference users that live
+on the primary.
+
+Code that touches the sharded tables goes through their managers:
+`for_user(user)` returns a queryset on the user's shard, and the
+increment/upsert helpers route each user's rows themselves. With no aliases
+configured, everything uses the usual database.
+"""
+import bisect
+import functools
+import hashlib
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+DEFAULTS = {
+    'ALIASES': [],
+    'VNODES': 64,
+}
+
+SHARDED_MODELS = {'dailyuserstats', 'usersessionactivity', 'weeklyuserstats', 'monthlyuserstats',
+                  'sessiondailysummary'}
+
+
+def shard_settings():
+    return {**DEFAULTS, **getattr(settings, 'FITNESS_SHARDS', {})}
+
+
+def _point(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    def __init__(self, aliases, vnodes):
+        points = sorted((_point(f'{alias}#{i}'), alias) for alias in aliases for i in range(vnodes))
+        self._points = [p for p, _ in points]
+        self._aliases = [a for _, a in points]
+
+    def alias_for(self, user_id):
+        index = bisect.bisect(self._points, _point(str(user_id))) % len(self._points)
+        return self._aliases[index]
+
+
+@functools.lru_cache(maxsize=8)
+def _ring(aliases, vnodes):
+    return HashRing(aliases, vnodes)
+
+
+def get_ring(aliases=None):
+    """The ring for `aliases`, by default the configured shards; None when sharding is off."""
+    config = shard_settings()
+    aliases = tuple(config['ALIASES'] if aliases is None else aliases)
+    return _ring(aliases, config['VNODES']) if aliases else None
+
+
+def sharding_enabled():
+    return bool(shard_settings()['ALIASES'])
+
+
+def is_sharded(model):
+    return model._meta.app_label == 'fitness' and model._meta.model_name in SHARDED_MODELS
+
+
+def shard_for(user, default=DEFAULT_DB_ALIAS):
+    """The alias holding `user`'s (instance or id) sharded rows, or `default` when sharding is off."""
+    ring = get_ring()
+    if ring is None:
+        return default
+    return ring.alias_for(getattr(user, 'pk', user))
+
+
+def group_by_shard(user_ids, default=DEFAULT_DB_ALIAS):
+    groups = {}
+    for user_id in user_ids:
+        groups.setdefault(shard_for(user_id, default), []).append(user_id)
+    return groups
+
+
+def shard_aliases(default=DEFAULT_DB_ALIAS):
+    """Every alias that may hold sharded rows."""
+    return list(shard_settings()['ALIASES']) or [default]
@@ -0,0 +1,41 @@
+"""
+Per-connection SQLite tuning.
+
+FITNESS_DB_PROFILE selects a set of PRAGMAs run on every new SQLite
+connection; FITNESS_SQLITE_PRAGMAS adds to or overrides them. The
+'production' profile switches to WAL, so readers never block the writer and
+the writer never blocks readers, relaxes fsyncs to what WAL needs to stay
+consistent, waits on a busy database instead of failing with "database is
+locked", and gives each connection a larger page cache and a memory map.
+"""
+from django.conf import settings
+
+PROFILE_PRAGMAS = {
+    'development': {},
+    'production': {
+        # Order matters: journal_mode first, synchronous=NORMAL is only durable-safe under WAL
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'busy_timeout': 5000,  # ms
+        'cache_size': -64000,  # negative means KiB, so about 64 MB per connection
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'memory',
+        # Reclaim space a little at a time rather than never
+        'wal_autocheckpoint': 1000,
+    },
+}
+
+
+def sqlite_pragmas():
+    profile = getattr(settings, 'FITNESS_DB_PROFILE', 'development')
+    return {**PROFILE_PRAGMAS[profile], **getattr(settings, 'FITNESS_SQLITE_PRAGMAS', {})}
+
+
+def apply_pragmas(connection, pragmas=None):
+    """Run the configured PRAGMAs on a freshly opened SQLite connection."""
+    pragmas = sqlite_pragmas() if pragmas is None else pragmas
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
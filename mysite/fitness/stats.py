@@ -0,0 +1,177 @@
+"""
+Arbitrary-range stats read from the weekly and monthly rollups.
+
+A range is split into buckets of the chosen granularity. Buckets that lie
+wholly inside the range are read from the matching rollup table; the partial
+buckets at either edge (at most one period each) are summed from
+DailyUserStats. With 'auto' granularity the finest of day, week and month
+that stays within FITNESS_STATS['MAX_POINTS'] buckets is used, and anything
+still longer is downsampled by merging neighbouring buckets, so even an
+all-time chart reads a few dozen rows.
+
+A range may span at most FITNESS_STATS['MAX_DAYS'] days, and at most
+MAX_DAILY_DAYS days with 'day' granularity; /api/stats/ rejects longer ones
+after clamping 'from' to the start of the user's history.
+"""
+import math
+from bisect import bisect_right
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import DailyUserStats, MonthlyUserStats, WeeklyUserStats
+from .sharding import group_by_shard
+
+DEFAULTS = {
+    'MAX_POINTS': 60,
+    'MAX_DAYS': 3660,
+    'MAX_DAILY_DAYS': 366,
+}
+
+GRANULARITIES = ('day', 'week', 'month')
+ROLLUPS = {'week': WeeklyUserStats, 'month': MonthlyUserStats}
+
+
+def stats_settings():
+    return {**DEFAULTS, **getattr(settings, 'FITNESS_STATS', {})}
+
+
+def period_bounds(granularity, start, end):
+    """List the (first day, last day) of every bucket touching [start, end], clipped to the range."""
+    if granularity == 'day':
+        return [(start + timedelta(days=i),) * 2 for i in range((end - start).days + 1)]
+    model = ROLLUPS[granularity]
+    bounds = []
+    period = model.period_for(start)
+    while period <= end:
+        following = model.next_period(period)
+        bounds.append((max(period, start), min(following - timedelta(days=1), end)))
+        period = following
+    return bounds
+
+
+def period_count(granularity, start, end):
+    """The number of buckets period_bounds() returns, without building them."""
+    if granularity == 'day':
+        return (end - start).days + 1
+    if granularity == 'week':
+        return (WeeklyUserStats.period_for(end) - WeeklyUserStats.period_for(start)).days // 7 + 1
+    return (end.year - start.year) * 12 + end.month - start.month + 1
+
+
+def pick_granularity(start, end, max_points):
+    for granularity in GRANULARITIES:
+        if period_count(granularity, start, end) <= max_points:
+            return granularity
+    return GRANULARITIES[-1]
+
+
+def _empty_point(first, last):
+    return {'start': first, 'end': last, 'calories_burned': 0, 'time_spent': 0, 'workouts': 0,
+            'weight': None, 'weight_date': None}
+
+
+def _add(point, calories, seconds, workouts, weight, weight_date):
+    point['calories_burned'] += calories or 0
+    point['time_spent'] += seconds or 0
+    point['workouts'] += workouts or 0
+    if weight is not None and (point['weight_date'] is None or weight_date >= point['weight_date']):
+        point['weight'], point['weight_date'] = weight, weight_date
+
+
+def range_stats(user, start, end, granularity='auto'):
+    """
+    Return (granularity, points) for `user` between `start` and `end` inclusive. Each point
+    covers `start`..`end` days with summed calories, seconds and workouts, and the latest
+    weight recorded inside it.
+    """
+    max_points = stats_settings()['MAX_POINTS']
+    if granularity == 'auto':
+        granularity = pick_granularity(start, end, max_points)
+    bounds = period_bounds(granularity, start, end)
+    points = {first: _empty_point(first, last) for first, last in bounds}
+
+    if granularity == 'day':
+        whole, partial = [], [(start, end)]
+    else:
+        model = ROLLUPS[granularity]
+        whole = [(first, last) for first, last in bounds
+                 if first == model.period_for(first) and last == model.next_period(first) - timedelta(days=1)]
+        # At most the first and last bucket are cut short by the range
+        partial = [b for b in bounds if b not in whole]
+
+    if whole:
+        rows = (ROLLUPS[granularity].objects.for_user(user)
+                .filter(period_start__gte=whole[0][0], period_start__lte=whole[-1][0])
+                .values_list('period_start', 'calories_burned', 'time_spent', 'workouts', 'weight', 'weight_date'))
+        for period_start, *values in rows:
+            _add(points[period_start], *values)
+    if partial:
+        in_partial = Q()
+        for first, last in partial:
+            in_partial |= Q(date__gte=first, date__lte=last)
+        rows = DailyUserStats.objects.for_user(user).filter(in_partial).values_list(
+            'date', 'calories_burned', 'time_spent_today', 'workouts_today', 'weight')
+        firsts = [first for first, _ in bounds]
+        for day, calories, seconds, workouts, weight in rows:
+            _add(points[firsts[bisect_right(firsts, day) - 1]], calories, seconds, workouts, weight, day)
+
+    return granularity, downsample([points[first] for first, _ in bounds], max_points)
+
+
+def downsample(points, max_points):
+    """Merge runs of neighbouring points so that at most `max_points` remain."""
+    if len(points) <= max_points:
+        return points
+    size = math.ceil(len(points) / max_points)
+    merged = []
+    for i in range(0, len(points), size):
+        group = points[i:i + size]
+        point = _empty_point(group[0]['start'], group[-1]['end'])
+        for p in group:
+            _add(point, p['calories_burned'], p['time_spent'], p['workouts'], p['weight'], p['weight_date'])
+        merged.append(point)
+    return merged
+
+
+def rebuild_rollups(user_ids, since=None, using='default'):
+    """
+    Recompute the weekly and monthly rollups of `user_ids` from DailyUserStats, from the
+    period containing `since` onwards (or from scratch), on each user's shard, or on `using`
+    without sharding. Returns the number of rollup rows written.
+    """
+    return sum(_rebuild_rollups(ids, since, db) for db, ids in group_by_shard(user_ids, default=using).items())
+
+
+def _rebuild_rollups(user_ids, since, using):
+    written = 0
+    with transaction.atomic(using=using):
+        for model in (WeeklyUserStats, MonthlyUserStats):
+            rollups = model.objects.using(using).filter(user__in=user_ids)
+            daily = DailyUserStats.objects.using(using).filter(user__in=user_ids)
+            if since is not None:
+                period_start = model.period_for(since)
+                rollups = rollups.filter(period_start__gte=period_start)
+                daily = daily.filter(date__gte=period_start)
+            rollups.delete()
+
+            totals = {}
+            rows = daily.order_by('user', 'date').values_list(
+                'user', 'date', 'calories_burned', 'time_spent_today', 'workouts_today', 'weight')
+            for user_id, day, calories, seconds, workouts, weight in rows.iterator(chunk_size=5000):
+                key = (user_id, model.period_for(day))
+                point = totals.get(key)
+                if point is None:
+                    point = totals[key] = _empty_point(key[1], None)
+                _add(point, calories, seconds, workouts, weight, day)
+            model.objects.using(using).bulk_create(
+                (model(user_id=user_id, period_start=period_start, calories_burned=p['calories_burned'],
+                       time_spent=p['time_spent'], workouts=p['workouts'], weight=p['weight'],
+                       weight_date=p['weight_date'])
+                 for (user_id, period_start), p in totals.items()),
+                batch_size=1000,
+            )
+            written += len(totals)
+    return written
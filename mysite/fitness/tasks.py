@@ -0,0 +1,245 @@
+"""
+Background tasks: work a request doesn't need to wait for, run from the
+BackgroundTask table by `manage.py run_tasks` workers, with no broker.
+
+    @task(batch=True)
+    def record_weight(calls):
+        ...
+
+    enqueue(record_weight, user.pk, today, 72.5)
+
+enqueue() inserts the task on the caller's connection, so a task queued inside
+a transaction only exists once that transaction commits. Arguments must be
+JSON serializable; dates and decimals arrive as strings. With
+FITNESS_TASKS['ALWAYS_EAGER'] set (off by default, like Celery's, but turned on
+by mysite's settings under DEBUG), the task runs at once in the caller instead,
+with its arguments passed through JSON all the same.
+
+A worker claims up to BATCH_SIZE due tasks with one UPDATE that leases them to
+it for LEASE seconds. The UPDATE re-checks that each row is still unclaimed,
+which keeps workers apart on SQLite; where the backend has SKIP LOCKED, rows
+another worker is claiming are skipped too. Claimed tasks run on THREADS
+threads, and a batch task gets all of its claimed calls in one go, so a burst
+of logouts is rolled up by one bulk upsert. A task's writes to the default
+database and the removal of its row commit together, so those happen once;
+writes to shards commit on their own and can repeat if the worker dies in
+between. A task that raises is retried after RETRY_DELAY seconds, doubling
+each time, and is kept as 'failed' after MAX_ATTEMPTS attempts. Tasks of a
+worker that dies are run again once their lease runs out.
+
+Tasks run in the worker's process, so their publish_stats() events only reach
+live streams served by that process: none, unless tasks run eagerly.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .cache import bump_user_version
+from .live import publish_stats
+from .models import BackgroundTask, DailyUserStats, UserProfile
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ALWAYS_EAGER': False,
+    'THREADS': 4,
+    'BATCH_SIZE': 100,
+    'LEASE': 60,
+    'POLL_INTERVAL': 1.0,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_DELAY': 10,
+}
+
+
+def task_settings():
+    return {**DEFAULTS, **getattr(settings, 'FITNESS_TASKS', {})}
+
+
+_registry = {}
+
+
+def task(func=None, *, batch=False):
+    """
+    Register a task under its dotted path. A batch task takes a single argument: the list of
+    argument lists of every call being run.
+    """
+    def register(func):
+        func.task_name = f'{func.__module__}.{func.__qualname__}'
+        func.task_batch = batch
+        _registry[func.task_name] = func
+        return func
+    return register if func is None else register(func)
+
+
+def get_task(name):
+    if name not in _registry:
+        # Importing the module registers its tasks
+        import_string(name)
+    return _registry[name]
+
+
+def run_calls(func, calls):
+    if func.task_batch:
+        func(calls)
+    else:
+        for args in calls:
+            func(*args)
+
+
+def enqueue(func, *args, delay=0):
+    """Queue a call of task `func` (or its name). Returns the BackgroundTask, or None if it ran eagerly."""
+    name = func if isinstance(func, str) else func.task_name
+    args = json.loads(json.dumps(args, cls=DjangoJSONEncoder))
+    if task_settings()['ALWAYS_EAGER']:
+        run_calls(get_task(name), [args])
+        return None
+    return BackgroundTask.objects.create(name=name, args=args, run_after=timezone.now() + timedelta(seconds=delay))
+
+
+def claim_tasks(worker, limit, lease):
+    """Lease up to `limit` due tasks to a new claim by `worker`. Returns (claim, tasks oldest first)."""
+    now = timezone.now()
+    claim = f'{worker[:40]}:{uuid.uuid4().hex[:12]}'
+    db = router.db_for_write(BackgroundTask)
+    due = BackgroundTask.objects.using(db).filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+        status=BackgroundTask.QUEUED, run_after__lte=now,
+    )
+    candidates = due.order_by('run_after', 'pk')
+    if connections[db].features.has_select_for_update_skip_locked:
+        candidates = candidates.select_for_update(skip_locked=True)
+    with transaction.atomic(using=db):
+        # One statement: a row another worker leased in the meantime no longer matches `due`
+        due.filter(pk__in=candidates.values('pk')[:limit]).update(
+            locked_by=claim, locked_until=now + timedelta(seconds=lease), attempts=F('attempts') + 1,
+        )
+    return claim, list(BackgroundTask.objects.using(db).filter(locked_by=claim).order_by('run_after', 'pk'))
+
+
+class LeaseLost(Exception):
+    """The lease ran out and another worker claimed the task; this run's writes are rolled back."""
+
+
+def run_claimed(claim, name, tasks):
+    """Run claimed tasks of one name. Returns (done, failed)."""
+    db = router.db_for_write(BackgroundTask)
+    try:
+        func = get_task(name)
+        with transaction.atomic(using=db):
+            run_calls(func, [t.args for t in tasks])
+            deleted, _ = BackgroundTask.objects.using(db).filter(
+                pk__in=[t.pk for t in tasks], locked_by=claim,
+            ).delete()
+            if deleted != len(tasks):
+                raise LeaseLost(name)
+    except LeaseLost:
+        logger.warning('Lost the lease on %s tasks of %s; another worker runs them', len(tasks), name)
+        return 0, 0
+    except Exception:
+        if len(tasks) > 1:
+            # Find the failing calls, so they don't hold back the others
+            results = [run_claimed(claim, name, [t]) for t in tasks]
+            return sum(r[0] for r in results), sum(r[1] for r in results)
+        logger.exception('Task %s%s failed', name, tuple(tasks[0].args))
+        retry_or_fail(claim, tasks[0], traceback.format_exc())
+        return 0, 1
+    return len(tasks), 0
+
+
+def retry_or_fail(claim, background_task, error):
+    config = task_settings()
+    update = {'locked_by': None, 'locked_until': None, 'last_error': error}
+    if background_task.attempts >= config['MAX_ATTEMPTS']:
+        update['status'] = BackgroundTask.FAILED
+    else:
+        delay = config['RETRY_DELAY'] * 2 ** (background_task.attempts - 1)
+        update['run_after'] = timezone.now() + timedelta(seconds=delay)
+    BackgroundTask.objects.using(router.db_for_write(BackgroundTask)) \
+        .filter(pk=background_task.pk, locked_by=claim).update(**update)
+
+
+def _run_in_thread(claim, name, tasks):
+    # Pool threads live as long as the worker: tidy up connections around each job like a request would
+    close_old_connections()
+    try:
+        return run_claimed(claim, name, tasks)
+    finally:
+        close_old_connections()
+
+
+class Worker:
+    def __init__(self, name=None, threads=None, batch_size=None, lease=None, poll_interval=None):
+        config = task_settings()
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.threads = threads or config['THREADS']
+        self.batch_size = batch_size or config['BATCH_SIZE']
+        self.lease = lease or config['LEASE']
+        self.poll_interval = config['POLL_INTERVAL'] if poll_interval is None else poll_interval
+        self.stopping = threading.Event()
+        self.done = self.failed = 0
+
+    def stop(self):
+        """Finish the tasks in hand, then return from run()."""
+        self.stopping.set()
+
+    def run(self, once=False):
+        """Run due tasks until stop(), or with `once`, until none are due."""
+        with ThreadPoolExecutor(self.threads) as pool:
+            while not self.stopping.is_set():
+                close_old_connections()
+                if self.run_batch(pool):
+                    continue
+                if once:
+                    break
+                self.stopping.wait(self.poll_interval)
+
+    def run_batch(self, pool):
+        """Claim and run one batch of tasks. Returns how many were claimed."""
+        claim, tasks = claim_tasks(self.name, self.batch_size, self.lease)
+        jobs = {}
+        for background_task in tasks:
+            try:
+                batch = get_task(background_task.name).task_batch
+            except Exception:
+                batch = False  # run_claimed() records the failure
+            # Calls of a batch task run together; anything else, one job per call
+            key = background_task.name if batch else background_task.pk
+            jobs.setdefault(key, (background_task.name, []))[1].append(background_task)
+        for future in [pool.submit(_run_in_thread, claim, name, claimed) for name, claimed in jobs.values()]:
+            done, failed = future.result()
+            self.done += done
+            self.failed += failed
+        return len(tasks)
+
+
+@task(batch=True)
+def rollup_session_time(calls):
+    """Add the time of closed sessions to DailyUserStats and streaks. Calls of (user id, ISO date, seconds)."""
+    rows = [{'user': user_id, 'date': date.fromisoformat(day), 'seconds': seconds} for user_id, day, seconds in calls]
+    DailyUserStats.objects.bulk_increment(rows)
+    UserProfile.objects.record_active_days(rows)
+    for row in rows:
+        bump_user_version(row['user'])
+        publish_stats(row['user'], row['date'], time_spent_today=row['seconds'])
+
+
+@task(batch=True)
+def record_weight(calls):
+    """Store weights on DailyUserStats, the latest call per day winning. Calls of (user id, ISO date, weight)."""
+    rows = [{'user': user_id, 'date': date.fromisoformat(day), 'weight': weight} for user_id, day, weight in calls]
+    DailyUserStats.objects.bulk_increment(rows)
+    for user_id in {row['user'] for row in rows}:
+        bump_user_version(user_id)
@@ -0,0 +1,998 @@
+"""
+Query budgets and wall-time ceilings for every API view, plus query-plan checks
+for the hot lookups. A failing budget means a view now runs more queries than
+it used to: fix the regression, or raise the budget deliberately in the same
+change that needs it.
+"""
+import cProfile
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+from importlib import import_module
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps as django_apps
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.auth.signals import user_logged_out
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.db.models import Count
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import async_views
+from .activity_buffer import ActivityBuffer, LocalMemoryStore, flush_activity
+from .cache import bump_user_version, dashboard_cache_key, user_cache
+from .catalog import bump_catalog_version
+from .live import EventStream, broadcaster, live_settings, publish_stats
+from .metrics import SnapshotWriter
+from .models import (BackgroundTask, DailyUserStats, MonthlyUserStats, SessionDailySummary, UserProfile,
+                     UserSessionActivity, WeeklyUserStats, WorkoutVideo)
+from .renderers import FastJSONRenderer
+from .routers import ReadState, ReplicaRouter, ShardRouter, _read_state
+from .seeding import seed
+from .sessions import close_stale_sessions, compact_sessions
+from .sharding import get_ring, shard_for
+from .stats import GRANULARITIES, period_bounds, period_count
+from .tasks import Worker, claim_tasks, enqueue, rollup_session_time, run_claimed, task
+
+SEED_USERS = 20
+SEED_DAYS = 400
+# Generous enough for a slow CI machine; a view over this is doing far too much work.
+WALL_TIME_CEILING = 0.5
+
+# view name -> (method, path, request body, budget for a cold user, budget for a warm user)
+# Budgets include JWT authentication (one query loading user and profile, plus
+# creating the profile for a cold user), and atomic blocks count their
+# SAVEPOINT/RELEASE pair because TestCase wraps every test in a transaction.
+# A daily stats increment is three statements in one atomic block: the daily
+# row plus the weekly and monthly rollups.
+BUDGETS = {
+    'dashboard_data': ('get', '/api/dashboard/', None, 7, 4),
+    'log_activity': ('post', '/api/log_activity/', {'seconds': 30}, 10, 7),
+    'user_profile': ('get', '/api/profile/', None, 4, 1),
+    # Counters are added to in the database and read back for the response
+    'track_workout': ('post', '/api/track-workout/', {'exercise_time': 600}, 6, 3),
+    'complete_workout': ('post', '/api/complete-workout/', {'calories_burned': 250}, 10, 7),
+    'events_batch': ('post', '/api/events/batch/', {'events': [
+        {'type': 'activity', 'seconds': 60, 'timestamp': '2024-03-01T08:00:00Z'},
+        {'type': 'workout', 'calories_burned': 120, 'timestamp': '2024-03-01T09:00:00Z'},
+        {'type': 'weight', 'weight': 72.5, 'timestamp': '2024-03-02T07:00:00Z'},
+    ]}, 14, 11),
+    'stats_range': ('get', '/api/stats/', None, 6, 4),
+    'get_user_profile': ('get', '/api/get_user_profile/', None, 4, 1),
+    'save_user_profile': ('post', '/api/save_user_profile/', {'weight': 71.0, 'level': '2'}, 10, 7),
+    'videos': ('get', '/api/videos/', None, 4, 1),
+}
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for _ in seed(users=SEED_USERS, days=SEED_DAYS, end_date=timezone.now().date(), prefix='budget'):
+            pass
+        # Warm: the seeded user with the longest history
+        warm_id = (DailyUserStats.objects.values('user').order_by('user')
+                   .annotate(n=Count('id')).order_by('-n', 'user')[0]['user'])
+        cls.warm_user = User.objects.get(pk=warm_id)
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        return client
+
+    def cold_user(self):
+        # No profile and no stats
+        return User.objects.create_user('cold', 'cold@example.com', 'pw')
+
+    def assertWithinBudget(self, client, method, path, data, budget):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(client, method)(path, data, format='json') if data is not None \
+                else getattr(client, method)(path)
+            elapsed = time.perf_counter() - start
+        self.assertLess(response.status_code, 400, response.content)
+        executed = '\n'.join(q['sql'] for q in queries.captured_queries)
+        self.assertLessEqual(len(queries), budget, f'{method.upper()} {path} ran {len(queries)} queries:\n{executed}')
+        self.assertLess(elapsed, WALL_TIME_CEILING, f'{method.upper()} {path} took {elapsed:.3f}s')
+        return response
+
+    def test_cold_user_budgets(self):
+        for name, (method, path, data, cold_budget, _) in BUDGETS.items():
+            with self.subTest(view=name):
+                user = self.cold_user()
+                try:
+                    self.assertWithinBudget(self.client_for(user), method, path, data, cold_budget)
+                finally:
+                    user.delete()
+
+    def test_warm_user_budgets(self):
+        client = self.client_for(self.warm_user)
+        for name, (method, path, data, _, warm_budget) in BUDGETS.items():
+            with self.subTest(view=name):
+                cache.clear()
+                self.assertWithinBudget(client, method, path, data, warm_budget)
+
+    def test_cached_dashboard_runs_no_queries(self):
+        # Both the authenticated user and the payload come from cache
+        client = self.client_for(self.warm_user)
+        client.get('/api/dashboard/')
+        self.assertWithinBudget(client, 'get', '/api/dashboard/', None, 0)
+
+    def test_unchanged_poll_gets_not_modified(self):
+        client = self.client_for(self.warm_user)
+        etag = client.get('/api/dashboard/')['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/dashboard/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(len(queries), 0)
+
+        client.post('/api/log_activity/', {'seconds': 30}, format='json')
+        response = client.get('/api/dashboard/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_large_responses_are_compressed(self):
+        client = self.client_for(self.warm_user)
+        response = client.get('/api/dashboard/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.content))['chart_data'][-1].keys(),
+                         {'date', 'calories_burned', 'weight'})
+        self.assertFalse(client.get('/api/dashboard/').has_header('Content-Encoding'))
+
+    def test_register_user_budget(self):
+        self.assertWithinBudget(APIClient(), 'post', '/api/register/', {
+            'username': 'newbie', 'email': 'newbie@example.com', 'password': 'pw-123456',
+        }, 4)
+
+
+class QueryPlanTests(TestCase):
+    """The hot lookups must be index searches, never full table scans."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for _ in seed(users=5, days=60, end_date=date(2025, 1, 31), prefix='plan'):
+            pass
+        cls.user = User.objects.filter(username__startswith='plan').first()
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plan assertions are written against SQLite EXPLAIN QUERY PLAN output.')
+
+    def assertIndexSearch(self, queryset, table):
+        plan = queryset.explain()
+        self.assertNotRegex(plan, rf'SCAN {table}\b(?! USING)', f'full scan of {table}:\n{plan}')
+        self.assertRegex(plan, rf'SEARCH {table} USING (COVERING )?INDEX', plan)
+        return plan
+
+    def test_dashboard_range_scan_uses_index(self):
+        start = date(2025, 1, 31) - timedelta(days=29)
+        self.assertIndexSearch(
+            DailyUserStats.objects.filter(user=self.user, date__gte=start).order_by('date'),
+            'fitness_dailyuserstats',
+        )
+
+    def test_dashboard_weight_backfill_uses_index(self):
+        start = date(2025, 1, 31) - timedelta(days=29)
+        plan = self.assertIndexSearch(
+            DailyUserStats.objects.filter(user=self.user, date__lt=start, weight__isnull=False)
+            .order_by('-date').values_list('weight', flat=True)[:1],
+            'fitness_dailyuserstats',
+        )
+        self.assertIn('COVERING INDEX dailystats_user_weight_idx', plan)
+
+    def test_open_session_lookup_uses_index(self):
+        plan = self.assertIndexSearch(
+            UserSessionActivity.objects.filter(user=self.user, logout_time__isnull=True).order_by('-login_time')[:1],
+            'fitness_usersessionactivity',
+        )
+        self.assertIn('session_user_open_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class IncrementTests(TestCase):
+    """The upsert and its per-row fallback must leave the same rows behind."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('counter', 'counter@example.com', 'pw')
+        self.day = date(2024, 3, 1)
+
+    def assertTotals(self, calories, workouts, seconds, weight):
+        stats = DailyUserStats.objects.get(user=self.user, date=self.day)
+        self.assertEqual((stats.calories_burned, stats.workouts_today, stats.time_spent_today, stats.weight),
+                         (calories, workouts, seconds, weight))
+        for model in (WeeklyUserStats, MonthlyUserStats):
+            rollup = model.objects.get(user=self.user)
+            self.assertEqual((rollup.calories_burned, rollup.workouts, rollup.time_spent, rollup.weight),
+                             (calories, workouts, seconds, weight))
+
+    def test_increment_returns_the_updated_row(self):
+        stats = DailyUserStats.objects.increment(self.user, self.day, calories=120, workouts=1, seconds=60)
+        self.assertEqual(stats, DailyUserStats.objects.get(user=self.user, date=self.day))
+        self.assertFalse(stats._state.adding)
+        self.assertEqual((stats.user_id, stats.date, stats.calories_burned, stats.workouts_today,
+                          stats.time_spent_today, stats.weight), (self.user.pk, self.day, 120, 1, 60, None))
+
+    def test_increments_to_the_same_day_add_up(self):
+        DailyUserStats.objects.increment(self.user, self.day, calories=120, workouts=1, seconds=60)
+        stats = DailyUserStats.objects.increment(self.user, self.day, calories=80.5, seconds=30, weight=72.5)
+        self.assertEqual((stats.calories_burned, stats.workouts_today, stats.time_spent_today, stats.weight),
+                         (200.5, 1, 90, 72.5))
+        self.assertEqual(DailyUserStats.objects.filter(user=self.user).count(), 1)
+        self.assertTotals(200.5, 1, 90, 72.5)
+
+    def test_increment_falls_back_without_insert_returning(self):
+        # SQLite before 3.35: ON CONFLICT works but RETURNING does not
+        manager = DailyUserStats.objects
+        with mock.patch.object(connection.features, 'can_return_columns_from_insert', False), \
+                mock.patch.object(manager, '_increment_fallback', wraps=manager._increment_fallback) as fallback:
+            manager.increment(self.user, self.day, calories=120, workouts=1, seconds=60)
+            stats = manager.increment(self.user, self.day, calories=80.5, seconds=30, weight=72.5)
+            manager.bulk_increment([{'user': self.user, 'date': self.day, 'seconds': 10}])
+        self.assertEqual(fallback.call_count, 2)
+        self.assertEqual((stats.calories_burned, stats.workouts_today, stats.time_spent_today, stats.weight),
+                         (200.5, 1, 90, 72.5))
+        self.assertTotals(200.5, 1, 100, 72.5)
+
+    def test_writes_fall_back_without_upsert(self):
+        manager = DailyUserStats.objects
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False), \
+                mock.patch.object(manager, '_increment_fallback', wraps=manager._increment_fallback) as fallback:
+            manager.increment(self.user, self.day, calories=120, workouts=1, seconds=60)
+            manager.bulk_increment([
+                {'user': self.user, 'date': self.day, 'calories': 80.5, 'seconds': 30},
+                {'user': self.user, 'date': self.day, 'weight': 72.5},
+            ])
+            SessionDailySummary.objects.bulk_add({(self.user.pk, self.day): (2, 90)})
+            SessionDailySummary.objects.bulk_add({(self.user.pk, self.day): (1, 30)})
+        self.assertEqual(fallback.call_count, 2)
+        self.assertTotals(200.5, 1, 90, 72.5)
+        summary = SessionDailySummary.objects.get(user=self.user, date=self.day)
+        self.assertEqual((summary.sessions, summary.total_seconds), (3, 120))
+
+
+@override_settings(FITNESS_REPLICAS={'ALIASES': ['replica1'], 'STICKY_SECONDS': 10})
+class ReplicaRouterTests(SimpleTestCase):
+    """Routing decisions only; no database is touched."""
+
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.request = RequestFactory().get('/api/dashboard/')
+        self.request.user = User(pk=42)
+
+    def route(self):
+        token = _read_state.set(ReadState(self.request, 'replica1'))
+        try:
+            return self.router.db_for_read(DailyUserStats)
+        finally:
+            _read_state.reset(token)
+
+    def test_reads_outside_replica_safe_requests_use_primary(self):
+        self.assertEqual(self.router.db_for_read(DailyUserStats), 'default')
+
+    def test_authenticated_reads_use_replica(self):
+        self.assertEqual(self.route(), 'replica1')
+
+    def test_reads_before_authentication_use_primary(self):
+        self.request.user = AnonymousUser()
+        self.assertEqual(self.route(), 'default')
+
+    def test_user_who_just_wrote_reads_from_primary(self):
+        bump_user_version(42)
+        self.assertEqual(self.route(), 'default')
+
+    def test_writes_use_primary(self):
+        self.assertEqual(self.router.db_for_write(DailyUserStats), 'default')
+
+
+@override_settings(FITNESS_SHARDS={'ALIASES': ['shard1', 'shard2'], 'VNODES': 64})
+class ShardRouterTests(SimpleTestCase):
+    """Shard placement only; no database is touched."""
+
+    def setUp(self):
+        self.router = ShardRouter()
+
+    def test_rows_follow_their_user(self):
+        stats = DailyUserStats(user_id=7)
+        self.assertEqual(self.router.db_for_write(DailyUserStats, instance=stats), shard_for(7))
+        self.assertEqual(self.router.db_for_read(UserSessionActivity, instance=User(pk=7)), shard_for(7))
+        self.assertIsNone(self.router.db_for_write(User, instance=User(pk=7)))
+
+    def test_adding_a_shard_moves_only_its_share_of_users(self):
+        before = {user_id: get_ring(['shard1', 'shard2']).alias_for(user_id) for user_id in range(3000)}
+        after = {user_id: get_ring(['shard1', 'shard2', 'shard3']).alias_for(user_id) for user_id in range(3000)}
+        moved = [user_id for user_id in before if before[user_id] != after[user_id]]
+        self.assertTrue(all(after[user_id] == 'shard3' for user_id in moved))
+        self.assertLess(abs(len(moved) - 1000), 250)
+
+    def test_shards_only_get_sharded_tables(self):
+        self.assertTrue(self.router.allow_migrate('shard1', 'fitness', 'dailyuserstats'))
+        self.assertFalse(self.router.allow_migrate('shard1', 'fitness', 'userprofile'))
+        self.assertFalse(self.router.allow_migrate('shard1', 'auth', 'user'))
+        self.assertIsNone(self.router.allow_migrate('default', 'fitness', 'dailyuserstats'))
+
+    @override_settings(FITNESS_SHARDS={'ALIASES': []})
+    def test_without_shards_everything_stays_put(self):
+        self.assertEqual(shard_for(7), 'default')
+        self.assertIsNone(self.router.db_for_write(DailyUserStats, instance=DailyUserStats(user_id=7)))
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    def test_matches_drf_output(self):
+        data = {'when': timezone.now(), 'day': date(2024, 1, 5), 'amount': Decimal('1.50'), 'name': 'é', 'none': None}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_bytes_are_sent_as_they_are(self):
+        self.assertEqual(FastJSONRenderer().render(b'{"cached":true}'), b'{"cached":true}')
+
+
+class LiveUpdatesTests(TestCase):
+    def publish_and_commit(self, user):
+        with self.captureOnCommitCallbacks(execute=True):
+            publish_stats(user, date(2024, 3, 1), calories_burned=250.0, workouts_today=1, seconds=0)
+
+    async def test_stream_opens_with_a_valid_token(self):
+        user = await User.objects.acreate(username='live')
+        response = await self.async_client.get(f'/api/live/?token={AccessToken.for_user(user)}')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        try:
+            self.assertIn(b'event: ready', await anext(stream))
+        finally:
+            await stream.aclose()
+        response = await self.async_client.get('/api/live/?token=not-a-token')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_stream_pushes_committed_deltas(self):
+        user = await User.objects.acreate(username='live')
+        stream = EventStream(user.pk, live_settings())
+        events = aiter(stream)
+        try:
+            await anext(events)
+            await sync_to_async(self.publish_and_commit)(user)
+            event = await anext(events)
+        finally:
+            stream.close()
+        self.assertTrue(event.startswith('event: delta\ndata: '))
+        self.assertEqual(json.loads(event.split('data: ', 1)[1]),
+                         {'date': '2024-03-01', 'delta': {'calories_burned': 250.0, 'workouts_today': 1}})
+        self.assertEqual(broadcaster.connection_count(), 0)
+
+    def test_wsgi_workers_refuse_streams(self):
+        self.assertEqual(self.client.get('/api/live/').status_code, 501)
+
+
+class EventsBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('offline')
+        UserProfile.objects.create(user=self.user, weight=80.0, total_workouts=2)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def post(self, events):
+        return self.client.post('/api/events/batch/', {'events': events}, format='json')
+
+    def day(self, day):
+        stats = DailyUserStats.objects.get(user=self.user, date=day)
+        return stats.calories_burned, stats.workouts_today, stats.time_spent_today, stats.weight
+
+    def profile(self):
+        profile = UserProfile.objects.get(user=self.user)
+        return (profile.weight, profile.total_workouts, profile.current_streak,
+                profile.longest_streak, profile.last_active_date)
+
+    def test_events_reach_daily_stats_and_profile(self):
+        response = self.post([
+            {'type': 'activity', 'seconds': 60, 'timestamp': '2024-03-01T08:00:00Z'},
+            {'type': 'workout', 'calories_burned': 120, 'timestamp': '2024-03-01T09:00:00Z'},
+            {'type': 'activity', 'seconds': 30, 'timestamp': '2024-03-01T21:00:00Z'},
+            {'type': 'workout', 'calories_burned': 80.5, 'timestamp': '2024-03-02T09:00:00Z'},
+            {'type': 'weight', 'weight': 72.5, 'timestamp': '2024-03-02T19:00:00Z'},
+            # Sent later but taken earlier: the evening reading wins
+            {'type': 'weight', 'weight': 73.0, 'timestamp': '2024-03-02T07:00:00Z'},
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual((response.data['applied'], response.data['rejected']), (6, 0))
+        self.assertEqual(response.data['results'], [{'index': i, 'status': 'applied'} for i in range(6)])
+
+        self.assertEqual(self.day(date(2024, 3, 1)), (120, 1, 90, None))
+        self.assertEqual(self.day(date(2024, 3, 2)), (80.5, 1, 0, 72.5))
+        self.assertEqual(MonthlyUserStats.objects.get(user=self.user).workouts, 2)
+        self.assertEqual(self.profile(), (72.5, 4, 2, 2, date(2024, 3, 2)))
+
+    def test_events_are_bucketed_by_utc_day(self):
+        self.post([{'type': 'activity', 'seconds': 60, 'timestamp': '2024-03-01T23:30:00-02:00'}])
+        self.assertEqual(self.day(date(2024, 3, 2)), (0, 0, 60, None))
+
+    def test_invalid_events_are_reported_and_skipped(self):
+        response = self.post([
+            {'type': 'activity', 'seconds': 60, 'timestamp': '2024-03-01T08:00:00Z'},
+            {'type': 'sleep', 'timestamp': '2024-03-01T08:00:00Z'},
+            {'type': 'activity', 'timestamp': '2024-03-01T08:00:00Z'},
+            {'type': 'workout', 'calories_burned': 120,
+             'timestamp': (timezone.now() + timedelta(days=1)).isoformat()},
+            {'type': 'weight', 'weight': -1, 'timestamp': '2024-03-01T08:00:00Z'},
+            {'type': 'workout', 'calories_burned': 120, 'timestamp': '2024-03-01T09:00:00Z'},
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual((response.data['applied'], response.data['rejected']), (2, 4))
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results],
+                         ['applied', 'rejected', 'rejected', 'rejected', 'rejected', 'applied'])
+        self.assertEqual([r['index'] for r in results], list(range(6)))
+        self.assertIn('type', results[1]['errors'])
+        self.assertIn('seconds', results[2]['errors'])
+        self.assertIn('timestamp', results[3]['errors'])
+        self.assertIn('weight', results[4]['errors'])
+
+        self.assertEqual(DailyUserStats.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(self.day(date(2024, 3, 1)), (120, 1, 60, None))
+        self.assertEqual(self.profile(), (80.0, 3, 1, 1, date(2024, 3, 1)))
+
+    def test_a_batch_of_only_invalid_events_writes_nothing(self):
+        response = self.post([{'type': 'workout', 'timestamp': '2024-03-01T09:00:00Z'}, 'not an event'])
+        self.assertEqual((response.data['applied'], response.data['rejected']), (0, 2))
+        self.assertFalse(DailyUserStats.objects.filter(user=self.user).exists())
+        self.assertEqual(self.profile(), (80.0, 2, 0, 0, None))
+
+    def test_an_older_weight_does_not_replace_the_current_one(self):
+        DailyUserStats.objects.increment(self.user, date(2024, 3, 10), weight=75.0)
+        self.post([{'type': 'weight', 'weight': 72.5, 'timestamp': '2024-03-02T07:00:00Z'}])
+        self.assertEqual(self.day(date(2024, 3, 2)), (0, 0, 0, 72.5))
+        self.assertEqual(self.profile()[0], 80.0)
+
+    @override_settings(FITNESS_EVENTS_BATCH_MAX=2)
+    def test_malformed_and_oversized_batches_are_refused(self):
+        event = {'type': 'activity', 'seconds': 60, 'timestamp': '2024-03-01T08:00:00Z'}
+        self.assertEqual(self.client.post('/api/events/batch/', {'events': event}, format='json').status_code, 400)
+        self.assertEqual(self.post([event] * 3).status_code, 400)
+        self.assertFalse(DailyUserStats.objects.filter(user=self.user).exists())
+
+
+class StatsRangeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ranger')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_from_is_clamped_to_the_users_history(self):
+        DailyUserStats.objects.increment(self.user, date(2024, 3, 5), seconds=60)
+        response = self.client.get('/api/stats/', {'from': '0001-01-01', 'to': '2024-04-15'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['from'], date(2024, 3, 5))
+        self.assertEqual(response.data['granularity'], 'day')
+        self.assertEqual(sum(p['time_spent_seconds'] for p in response.data['points']), 60)
+
+    def test_history_written_before_the_rollups_is_backfilled(self):
+        # Rows from before the rollup tables existed, then the first write after deploy
+        DailyUserStats.objects.bulk_create([
+            DailyUserStats(user=self.user, date=date(2023, 11, 30), calories_burned=100, workouts_today=1),
+            DailyUserStats(user=self.user, date=date(2023, 12, 4), time_spent_today=600, weight=71.0),
+            DailyUserStats(user=self.user, date=date(2023, 12, 6), time_spent_today=300, weight=70.5),
+        ])
+        DailyUserStats.objects.increment(self.user, date(2024, 3, 5), seconds=60)
+        response = self.client.get('/api/stats/', {'to': '2024-03-31', 'granularity': 'month'})
+        # The range starts at the first daily row, whatever the rollups hold
+        self.assertEqual(response.data['from'], date(2023, 11, 30))
+        self.assertEqual(response.data['points'][1]['time_spent_seconds'], 0)
+
+        WeeklyUserStats.objects.all().delete()
+        MonthlyUserStats.objects.all().delete()
+        import_module('fitness.migrations.0014_rollups').backfill_rollups(django_apps, connection.schema_editor())
+        response = self.client.get('/api/stats/', {'to': '2024-03-31', 'granularity': 'month'})
+        self.assertEqual([(p['start'], p['time_spent_seconds'], p['workouts'], p['weight'])
+                          for p in response.data['points']], [
+            (date(2023, 11, 30), 0, 1, None), (date(2023, 12, 1), 900, 0, 70.5),
+            (date(2024, 1, 1), 0, 0, None), (date(2024, 2, 1), 0, 0, None), (date(2024, 3, 1), 60, 0, None),
+        ])
+        self.assertEqual(WeeklyUserStats.objects.get(user=self.user, period_start=date(2023, 12, 4)).time_spent, 900)
+
+    @override_settings(FITNESS_STATS={'MAX_DAYS': 365, 'MAX_DAILY_DAYS': 31})
+    def test_long_ranges_are_refused(self):
+        # Nothing to clamp to without history
+        response = self.client.get('/api/stats/', {'from': '0001-01-01', 'to': '2024-04-30'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/stats/', {'from': '2023-04-01', 'to': '2024-04-30'}).status_code, 400)
+        response = self.client.get('/api/stats/', {'from': '2024-01-01', 'to': '2024-04-30', 'granularity': 'day'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/stats/', {'from': '2024-04-01', 'to': '2024-04-30', 'granularity': 'day'})
+        self.assertEqual(len(response.data['points']), 30)
+
+    def test_period_count_matches_period_bounds(self):
+        for start, end in [(date(2024, 1, 1), date(2024, 1, 1)), (date(2023, 12, 31), date(2024, 3, 4)),
+                           (date(2024, 2, 29), date(2026, 1, 31)), (date(2021, 6, 15), date(2024, 6, 14))]:
+            for granularity in GRANULARITIES:
+                with self.subTest(granularity=granularity, start=start, end=end):
+                    self.assertEqual(period_count(granularity, start, end),
+                                     len(period_bounds(granularity, start, end)))
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('importer')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def post(self, body, content_type='application/x-ndjson'):
+        return self.client.generic('POST', '/api/import/', body, content_type=content_type)
+
+    def test_out_of_range_numbers_are_rejected_per_line(self):
+        response = self.post(b'{"date":"2024-03-01","time_spent_today":1e400}\n'
+                             b'{"date":"2024-03-02","time_spent_today":99999999999999999999999}\n'
+                             b'{"date":"2024-03-03","calories_burned":-1}\n'
+                             b'{"date":"2024-03-04","time_spent_today":600,"weight":72.5}\n')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual((response.data['imported'], response.data['rejected']), (1, 3))
+        self.assertEqual([e['line'] for e in response.data['errors']], [1, 2, 3])
+        self.assertEqual(DailyUserStats.objects.get(user=self.user).time_spent_today, 600)
+
+    def test_unreadable_input_is_a_bad_request(self):
+        response = self.post(b'{"date":"2024-03-01"}\n\xff\xfe\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('UTF-8', response.data['error'])
+        # An unterminated quote swallows the rest of the file into one field
+        response = self.post(b'date,weight\n2024-03-01,"72\n' + b'0\n' * 70000, content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('CSV', response.data['error'])
+
+    def test_command_reports_unreadable_input(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as f:
+            f.write(b'date,workouts_today\n2024-03-01,2\n2024-03-02,\xe9\n')
+        self.addCleanup(os.remove, f.name)
+        with self.assertRaisesMessage(CommandError, 'UTF-8'):
+            call_command('import_history', f.name, user='importer', stdout=open(os.devnull, 'w'))
+
+        with open(f.name, 'wb') as out:
+            out.write(b'date,workouts_today,time_spent_today\n2024-03-01,2,1e400\n2024-03-02,1,60\n')
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('import_history', f.name, user='importer', stdout=stdout, stderr=stderr)
+        self.assertIn('1 rejected', stdout.getvalue())
+        self.assertIn('line 2:', stderr.getvalue())
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('exporter')
+        cls.admin = User.objects.create_user('admin', is_staff=True)
+        DailyUserStats.objects.increment(cls.user, date(2024, 3, 1), calories=250, workouts=1, seconds=600)
+        DailyUserStats.objects.increment(cls.user, date(2024, 3, 2), weight=72.5)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+
+    def test_csv(self):
+        response = self.client_for(self.user).get('/api/export/daily.csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(b''.join(response.streaming_content).decode().splitlines(), [
+            'date,calories_burned,weight,time_spent_today,workouts_today',
+            '2024-03-01,250.0,,600,1',
+            '2024-03-02,0.0,72.5,0,0',
+        ])
+
+    def test_gzipped_ndjson(self):
+        response = self.client_for(self.user).get('/api/export/daily.ndjson.gz')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('daily.ndjson.gz', response['Content-Disposition'])
+        lines = gzip.decompress(b''.join(response.streaming_content)).splitlines()
+        self.assertEqual([json.loads(line)['date'] for line in lines], ['2024-03-01', '2024-03-02'])
+
+    def test_all_users_export_is_for_admins(self):
+        self.assertEqual(self.client_for(self.user).get('/api/export/all/daily.csv').status_code, 403)
+        response = self.client_for(self.admin).get('/api/export/all/daily.ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual({(row['username'], row['date']) for row in rows},
+                         {('exporter', '2024-03-01'), ('exporter', '2024-03-02')})
+
+    async def test_asgi_requests_stream_asynchronously(self):
+        response = await self.async_client.get(
+            '/api/export/daily.csv.gz', headers={'Authorization': f'Bearer {AccessToken.for_user(self.user)}'})
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(gzip.decompress(body).splitlines()), 3)
+
+
+class StreakTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('streaker')
+        UserProfile.objects.get_or_create(user=self.user)
+
+    def log_activity(self, day, seconds=30):
+        # What log_activity and complete_workout do
+        DailyUserStats.objects.increment(self.user, day, seconds=seconds)
+        UserProfile.objects.record_active_day([self.user], day)
+
+    def streak(self):
+        profile = UserProfile.objects.get(user=self.user)
+        return profile.current_streak, profile.longest_streak, profile.last_active_date
+
+    def test_consecutive_days(self):
+        for n in range(3):
+            self.log_activity(date(2024, 3, 1) + timedelta(days=n))
+        self.assertEqual(self.streak(), (3, 3, date(2024, 3, 3)))
+
+    def test_a_gap_restarts_the_streak(self):
+        for day in (date(2024, 3, 1), date(2024, 3, 2), date(2024, 3, 5)):
+            self.log_activity(day)
+        self.assertEqual(self.streak(), (1, 2, date(2024, 3, 5)))
+
+    def test_the_same_day_counts_once(self):
+        self.log_activity(date(2024, 3, 1))
+        self.log_activity(date(2024, 3, 1))
+        self.assertEqual(self.streak(), (1, 1, date(2024, 3, 1)))
+
+    def test_backfill_matches_incremental(self):
+        self.log_activity(date(2024, 3, 1))
+        # A day with only session time from a logout rollup, then one with only a weight
+        rollup_session_time([[self.user.pk, '2024-03-02', 600]])
+        DailyUserStats.objects.increment(self.user, date(2024, 3, 3), weight=72.5)
+        self.log_activity(date(2024, 3, 4))
+        rollup_session_time([[self.user.pk, '2024-03-05', 60]])
+        incremental = self.streak()
+        self.assertEqual(incremental, (2, 2, date(2024, 3, 5)))
+
+        UserProfile.objects.filter(user=self.user).update(current_streak=0, longest_streak=0, last_active_date=None)
+        call_command('backfill_streaks', stdout=io.StringIO())
+        self.assertEqual(self.streak(), incremental)
+
+    def test_migration_fills_existing_profiles(self):
+        for day in (date(2024, 3, 1), date(2024, 3, 2), date(2024, 3, 3), date(2024, 3, 6), date(2024, 3, 7)):
+            DailyUserStats.objects.increment(self.user, day, seconds=30)
+        DailyUserStats.objects.increment(self.user, date(2024, 3, 8), weight=72.5)
+        idle = User.objects.create_user('idle')
+        UserProfile.objects.create(user=idle)
+
+        import_module('fitness.migrations.0013_userprofile_streaks').backfill_streaks(
+            django_apps, connection.schema_editor())
+        self.assertEqual(self.streak(), (2, 3, date(2024, 3, 7)))
+        profile = UserProfile.objects.get(user=idle)
+        self.assertEqual((profile.current_streak, profile.longest_streak, profile.last_active_date), (0, 0, None))
+
+
+class SessionHousekeepingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('sessions')
+        self.now = timezone.now()
+
+    def session(self, key, hours_ago, closed_after=None):
+        login = self.now - timedelta(hours=hours_ago)
+        return UserSessionActivity.objects.create(
+            user=self.user, session_key=key, login_time=login, date=login.date(),
+            logout_time=None if closed_after is None else login + timedelta(seconds=closed_after),
+            duration_seconds=closed_after or 0,
+        )
+
+    def test_stale_sessions_are_closed_without_time(self):
+        stale, fresh = self.session('stale', 2), self.session('fresh', 0.1)
+        self.assertEqual(close_stale_sessions(idle_timeout=1800, now=self.now), 1)
+        stale.refresh_from_db()
+        self.assertEqual((stale.duration_seconds, stale.timed_out), (0, True))
+        self.assertIsNone(UserSessionActivity.objects.get(pk=fresh.pk).logout_time)
+        self.assertFalse(DailyUserStats.objects.filter(user=self.user).exists())
+        self.assertFalse(BackgroundTask.objects.exists())
+
+    def test_closing_sessions_leaves_daily_stats_unchanged(self):
+        stale = self.session('stale-session', 2)
+        DailyUserStats.objects.increment(self.user, stale.date, calories=100, workouts=1, seconds=600)
+        before = list(DailyUserStats.objects.filter(user=self.user).values())
+        rollups = [list(model.objects.filter(user=self.user).values()) for model in (WeeklyUserStats, MonthlyUserStats)]
+
+        call_command('cleanup_sessions', '--idle-timeout=1800', '--skip-compact', stdout=io.StringIO())
+        self.assertTrue(UserSessionActivity.objects.get(pk=stale.pk).timed_out)
+        self.assertEqual(list(DailyUserStats.objects.filter(user=self.user).values()), before)
+        self.assertEqual([list(model.objects.filter(user=self.user).values())
+                          for model in (WeeklyUserStats, MonthlyUserStats)], rollups)
+        self.assertFalse(BackgroundTask.objects.exists())
+
+    @override_settings(FITNESS_TASKS={'ALWAYS_EAGER': False})
+    def test_a_later_logout_still_counts(self):
+        stale = self.session('stale-session', 2)
+        close_stale_sessions(idle_timeout=1800, now=self.now)
+        # Without a session key there is no telling which session ended
+        user_logged_out.send(User, request=RequestFactory().get('/'), user=self.user)
+        self.assertTrue(UserSessionActivity.objects.get(pk=stale.pk).timed_out)
+        request = RequestFactory().get('/')
+        request.session = SessionStore(session_key='stale-session')
+        user_logged_out.send(User, request=request, user=self.user)
+        stale.refresh_from_db()
+        self.assertFalse(stale.timed_out)
+        self.assertGreaterEqual(stale.duration_seconds, 7200)
+        self.assertEqual(BackgroundTask.objects.get().args[2], stale.duration_seconds)
+
+    def test_old_closed_sessions_are_compacted(self):
+        self.session('a', 24 * 100, closed_after=600)
+        self.session('b', 24 * 100 + 1, closed_after=300)
+        kept = self.session('recent', 24, closed_after=60)
+        self.session('open', 24 * 100)
+        self.assertEqual(compact_sessions(retention_days=90, today=self.now.date()), 2)
+        summary = SessionDailySummary.objects.get(user=self.user)
+        self.assertEqual((summary.sessions, summary.total_seconds), (2, 900))
+        self.assertEqual(set(UserSessionActivity.objects.values_list('session_key', flat=True)), {'recent', 'open'})
+        self.assertTrue(UserSessionActivity.objects.filter(pk=kept.pk).exists())
+
+
+class MetricsTests(TestCase):
+    def get(self, authorization=None):
+        headers = {'Authorization': authorization} if authorization else {}
+        return self.client.get('/api/metrics', headers=headers)
+
+    @override_settings(FITNESS_METRICS={'TOKEN': 'scrape-me'})
+    def test_metrics_need_an_admin_or_the_token(self):
+        user = User.objects.create_user('member')
+        admin = User.objects.create_user('operator', is_staff=True)
+        self.assertEqual(self.get().status_code, 401)
+        self.assertEqual(self.get('Bearer wrong').status_code, 403)
+        self.assertEqual(self.get(f'Bearer {AccessToken.for_user(user)}').status_code, 403)
+        self.assertEqual(self.get(f'Bearer {AccessToken.for_user(admin)}').status_code, 200)
+        response = self.get('Bearer scrape-me')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'fitness_http_requests_total', response.content)
+
+    def test_snapshot_files_are_unique_per_process(self):
+        # A restarted worker that got the same PID starts a new writer
+        first, second = SnapshotWriter().filename, SnapshotWriter().filename
+        self.assertTrue(first.startswith(f'metrics-{os.getpid()}-'))
+        self.assertNotEqual(first, second)
+
+
+class ProfileReportTests(SimpleTestCase):
+    def test_view_filter_applies_to_the_wall_time_summary(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for name, view, elapsed_ms in [('1', 'dashboard_data', 5.0), ('2', 'dashboard_data', 7.0),
+                                           ('3', 'stats_range', 900.0)]:
+                profiler = cProfile.Profile()
+                profiler.runcall(sum, range(10))
+                profiler.dump_stats(os.path.join(directory, name + '.prof'))
+                with open(os.path.join(directory, name + '.json'), 'w') as f:
+                    json.dump({'view': view, 'elapsed_ms': elapsed_ms, 'sql': []}, f)
+            stdout = io.StringIO()
+            call_command('profile_report', directory=directory, view='dashboard_data', stdout=stdout)
+        self.assertIn('2 profiles from', stdout.getvalue())
+        self.assertIn('wall time ms: median 7.0, max 7.0', stdout.getvalue())
+
+
+class ProfileWriteTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        # Caches the user and profile for authentication
+        self.client.get('/api/get_user_profile/')
+        # A write from elsewhere that this process's cached profile hasn't seen
+        UserProfile.objects.filter(user=self.user).update(total_workouts=5, total_exercise_time=3000)
+
+    def test_profile_save_keeps_the_stored_counters(self):
+        response = self.client.post('/api/save_user_profile/', {'height': 180, 'level': 'advanced'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual((profile.total_workouts, profile.total_exercise_time), (5, 3000))
+        self.assertEqual((profile.height, profile.level), (180, 'advanced'))
+
+    def test_track_workout_adds_to_the_stored_counters(self):
+        response = self.client.post('/api/track-workout/', {'exercise_time': 600}, format='json')
+        self.assertEqual((response.data['total_workouts'], response.data['total_exercise_time']), (6, 3600))
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual((profile.total_workouts, profile.total_exercise_time), (6, 3600))
+        response = self.client.post('/api/track-workout/', {'exercise_time': 'soon'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ActivityBufferTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('heartbeat')
+        UserProfile.objects.create(user=self.user)
+        self.buffer = ActivityBuffer(LocalMemoryStore(), flush_interval=3600, max_pending=2)
+        self.addCleanup(self.buffer._stopped.set)
+        self.today = timezone.now().date()
+
+    def seconds(self):
+        return dict(DailyUserStats.objects.filter(user=self.user).values_list('date', 'time_spent_today'))
+
+    def test_reaching_max_pending_flushes(self):
+        self.buffer.add(self.user.pk, self.today, 30)
+        self.buffer.add(self.user.pk, self.today, 30)
+        self.assertEqual(self.seconds(), {})
+        self.buffer.add(self.user.pk, self.today - timedelta(days=1), 15)
+        self.assertEqual(self.seconds(), {self.today: 60, self.today - timedelta(days=1): 15})
+        self.assertEqual(len(self.buffer.store), 0)
+        self.assertEqual(UserProfile.objects.get(user=self.user).last_active_date, self.today)
+
+    def test_a_failed_flush_keeps_the_seconds(self):
+        with mock.patch.object(DailyUserStats.objects, 'bulk_increment', side_effect=DatabaseError('locked')), \
+                self.assertLogs('fitness.activity_buffer', 'ERROR'):
+            self.buffer.add(self.user.pk, self.today, 30)
+            self.buffer.add(self.user.pk, self.today - timedelta(days=1), 15)
+        self.assertEqual(len(self.buffer.store), 2)
+        self.buffer.add(self.user.pk, self.today, 30)
+        self.assertEqual(self.seconds(), {self.today: 60, self.today - timedelta(days=1): 15})
+
+    def test_flush_activity(self):
+        self.assertEqual(flush_activity(), 0)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        with override_settings(FITNESS_ACTIVITY_BUFFER={'ENABLED': True}), \
+                mock.patch('fitness.activity_buffer._buffer', self.buffer):
+            for _ in range(3):
+                self.assertEqual(client.post('/api/log_activity/', {'seconds': 20}, format='json').status_code, 200)
+            self.assertEqual(self.seconds(), {})
+            self.assertEqual(flush_activity(), 1)
+        self.assertEqual(self.seconds(), {self.today: 60})
+
+
+class VideoCatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('viewer')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+    def test_etag_and_not_modified(self):
+        response = self.client.get('/api/videos/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertEqual(json.loads(response.content)['videos'][0]['level'], 'beginner')
+        etag = response['ETag']
+        response = self.client.get('/api/videos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    @override_settings(FITNESS_VIDEO_CATALOG_SOURCE='database')
+    def test_etag_changes_after_a_version_bump(self):
+        WorkoutVideo.objects.create(video_id='squats', title='Squats', sets={'beginner': 2},
+                                    calories_per_set={'beginner': 10})
+        etag = self.client.get('/api/videos/')['ETag']
+        # Bypasses the post_save signal: the compiled catalog is kept until the version moves
+        WorkoutVideo.objects.update(title='Deep Squats')
+        self.assertEqual(self.client.get('/api/videos/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        bump_catalog_version()
+        response = self.client.get('/api/videos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content)['videos'][0]['title'], 'Deep Squats')
+
+
+class SQLitePragmaTests(SimpleTestCase):
+    def pragmas(self, alias, *names):
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = SQLiteDatabaseWrapper({**connection.settings_dict, 'NAME': os.path.join(directory, 'db.sqlite3')},
+                                            alias=alias)
+            try:
+                with wrapper.cursor() as cursor:
+                    return [cursor.execute(f'PRAGMA {name}').fetchone()[0] for name in names]
+            finally:
+                wrapper.close()
+
+    @override_settings(FITNESS_DB_PROFILE='production')
+    def test_production_profile_is_applied_on_connect(self):
+        self.assertEqual(self.pragmas('primary', 'journal_mode', 'busy_timeout', 'synchronous', 'foreign_keys'),
+                         ['wal', 5000, 1, 1])
+
+    def test_development_profile_leaves_the_defaults(self):
+        self.assertEqual(self.pragmas('primary', 'journal_mode', 'synchronous'), ['delete', 2])
+
+    @override_settings(FITNESS_SHARDS={'ALIASES': ['shard1'], 'VNODES': 64})
+    def test_shard_connections_skip_foreign_keys(self):
+        self.assertEqual(self.pragmas('shard1', 'foreign_keys'), [0])
+
+
+class AsyncViewTests(TransactionTestCase):
+    """The async hot views answer like the sync ones. Committed data, so their pool threads see it."""
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        for _, ids in seed(users=1, days=60, end_date=timezone.now().date(), prefix='async'):
+            self.user = User.objects.get(pk=ids[0])
+        self.auth = f'Bearer {AccessToken.for_user(self.user)}'
+
+    def get(self, view, path, **headers):
+        return async_to_sync(view)(AsyncRequestFactory().get(path, headers=headers))
+
+    def test_same_responses_as_sync_views(self):
+        views = {
+            '/api/dashboard/': async_views.dashboard_data,
+            '/api/get_user_profile/': async_views.get_user_profile,
+            '/api/videos/': async_views.videos,
+        }
+        for path, view in views.items():
+            with self.subTest(path=path):
+                expected = self.client.get(path, HTTP_AUTHORIZATION=self.auth)
+                # Make the async view build the dashboard itself
+                cache.delete(dashboard_cache_key(self.user, timezone.now().date()))
+                response = self.get(view, path, Authorization=self.auth)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, expected.content)
+                self.assertEqual(response['ETag'], expected['ETag'])
+
+    def test_not_modified_and_unauthenticated(self):
+        etag = self.get(async_views.dashboard_data, '/api/dashboard/', Authorization=self.auth)['ETag']
+        response = self.get(async_views.dashboard_data, '/api/dashboard/', Authorization=self.auth,
+                            **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        response = self.get(async_views.get_user_profile, '/api/get_user_profile/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+
+
+@task
+def always_fails():
+    raise ValueError('boom')
+
+
+@override_settings(FITNESS_TASKS={'ALWAYS_EAGER': False, 'MAX_ATTEMPTS': 2, 'RETRY_DELAY': 0})
+class BackgroundTaskTests(TestCase):
+    def test_claims_do_not_overlap(self):
+        for seconds in (10, 20, 30):
+            enqueue(rollup_session_time, 1, '2024-03-01', seconds)
+        _, first = claim_tasks('a', 2, 60)
+        _, second = claim_tasks('b', 10, 60)
+        self.assertEqual([len(first), len(second)], [2, 1])
+        self.assertEqual(claim_tasks('c', 10, 60)[1], [])
+
+        # Tasks of a worker that died are claimed again once the lease runs out
+        BackgroundTask.objects.filter(pk__in=[t.pk for t in first]).update(locked_until=timezone.now())
+        _, reclaimed = claim_tasks('c', 10, 60)
+        self.assertEqual({t.pk for t in reclaimed}, {t.pk for t in first})
+        self.assertEqual({t.attempts for t in reclaimed}, {2})
+
+    def test_failing_tasks_are_retried_then_kept(self):
+        enqueue(always_fails)
+        for status in (BackgroundTask.QUEUED, BackgroundTask.FAILED):
+            claim, claimed = claim_tasks('a', 10, 60)
+            with self.assertLogs('fitness.tasks', 'ERROR'):
+                self.assertEqual(run_claimed(claim, always_fails.task_name, claimed), (0, 1))
+            self.assertEqual(BackgroundTask.objects.get().status, status)
+        self.assertIn('ValueError: boom', BackgroundTask.objects.get().last_error)
+        self.assertEqual(claim_tasks('a', 10, 60)[1], [])
+
+    @override_settings(FITNESS_TASKS={'ALWAYS_EAGER': True})
+    def test_eager_tasks_run_in_the_caller(self):
+        user = User.objects.create_user('eager')
+        self.assertIsNone(enqueue(rollup_session_time, user.pk, date(2024, 3, 1), 60))
+        self.assertEqual(DailyUserStats.objects.get(user=user).time_spent_today, 60)
+        self.assertFalse(BackgroundTask.objects.exists())
+
+
+@override_settings(FITNESS_TASKS={'ALWAYS_EAGER': False})
+class BackgroundWorkerTests(TransactionTestCase):
+    """The worker runs tasks on pool threads, which only see committed data."""
+
+    def test_profile_save_hands_off_the_weight_row(self):
+        user = User.objects.create_user('tasks', 'tasks@example.com', 'pw')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        response = client.post('/api/save_user_profile/', {'weight': 71.5}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(DailyUserStats.objects.filter(user=user).exists())
+
+        for seconds in (60, 120):
+            enqueue(rollup_session_time, user.pk, date.today(), seconds)
+        # One pool thread: the in-memory test database locks whole tables, so concurrent writers collide
+        worker = Worker(threads=1, poll_interval=0)
+        worker.run(once=True)
+        self.assertEqual((worker.done, worker.failed), (3, 0))
+        stats = DailyUserStats.objects.get(user=user, date=date.today())
+        self.assertEqual((stats.weight, stats.time_spent_today), (71.5, 180))
+        self.assertFalse(BackgroundTask.objects.exists())
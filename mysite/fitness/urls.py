@@ -1,19 +1,35 @@
-from django.urls import path
+from django.conf import settings
+from django.urls import path, re_path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from . import views
+from . import async_views, views
+from .live import live_updates
+from .metrics import metrics_view
+
+# The hot read views in their async versions under ASGI; see fitness/async_views.py
+hot_views = async_views if settings.FITNESS_ASYNC_VIEWS else views
 
 urlpatterns = [
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/register/', views.register_user, name='register'),
-    path('api/dashboard/', views.dashboard_data, name='dashboard_data'),
+    path('api/dashboard/', hot_views.dashboard_data, name='dashboard_data'),
     path('api/profile/', views.user_profile, name='user_profile'),
     path('api/track-workout/', views.track_workout, name='track_workout'),
     path('api/complete-workout/', views.complete_workout, name='complete_workout'),
+    path('api/events/batch/', views.events_batch, name='events_batch'),
+    path('api/stats/', views.stats_range, name='stats_range'),
+    path('api/import/', views.import_user_data, name='import_user_data'),
+    # e.g. /api/export/daily.csv or /api/export/sessions.ndjson.gz
+    re_path(r'^api/export/(?P<dataset>daily|sessions)\.(?P<fmt>csv|ndjson)(?P<compression>\.gz)?$',
+            views.export_user_data, name='export_user_data'),
+    re_path(r'^api/export/all/(?P<dataset>daily|sessions)\.(?P<fmt>csv|ndjson)(?P<compression>\.gz)?$',
+            views.export_all_data, name='export_all_data'),
     # Note: The '/api/profile/' path above seems redundant now. You may want to remove it.
-    path('api/get_user_profile/', views.get_user_profile, name='get_user_profile'),
+    path('api/get_user_profile/', hot_views.get_user_profile, name='get_user_profile'),
     path('api/save_user_profile/', views.save_user_profile, name='save_user_profile'),
-    path('api/videos/', views.videos, name='videos'),
-    path('videos/', views.videos, name='videos_no_prefix'),
+    path('api/videos/', hot_views.videos, name='videos'),
+    path('videos/', hot_views.videos, name='videos_no_prefix'),
     path('api/log_activity/', views.log_activity, name='log_activity'),
+    path('api/live/', live_updates, name='live_updates'),
+    path('api/metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -1,13 +1,41 @@
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from .models import UserProfile, DailyUserStats
-from datetime import timedelta
+from .serializers import ActivityEventSerializer
+from .activity_buffer import get_activity_buffer
+from .catalog import get_video_catalog, normalize_level
+from .conditional import etag_matches, user_etag
+from .export import export_response
+from .importing import ImportFormatError, detect_format, import_history
+from .live import publish_stats
+from .profiling import profile_view
+from .renderers import dumps
+from .stats import GRANULARITIES, range_stats, stats_settings
+from .tasks import enqueue, record_weight
+from .cache import bump_user_version, dashboard_cache_key, get_cached_dashboard, set_cached_dashboard
+from datetime import date, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import F, Min, Sum
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
 from django.utils import timezone
 
+def get_request_profile(request):
+    """
+    The authenticated user's profile. ProfileJWTAuthentication attaches it to the request
+    already; fall back to a lookup for other authentication classes.
+    """
+    profile = getattr(request, 'profile', None)
+    if profile is None:
+        profile, _ = UserProfile.objects.get_or_create(user=request.user)
+    return profile
+
 @api_view(['POST'])
 def register_user(request):
     username = request.data.get('username')
@@ -35,41 +63,70 @@ def register_user(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@profile_view
+@user_etag('dashboard', daily=True)
 def dashboard_data(request):
-    # Get summary stats from UserProfile
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
-
-    # Get daily stats for the last 30 days
+    # Serve straight from the cache while the user's data version is unchanged.
+    # The body is cached serialized, so a hit is passed through the renderer untouched.
     today = timezone.now().date()
-    start_date = today - timedelta(days=29)
-    
-    daily_stats_qs = DailyUserStats.objects.filter(
-        user=request.user,
+    cache_key = dashboard_cache_key(request.user, today)
+    body = get_cached_dashboard(cache_key)
+    if body is None:
+        body = dumps(build_dashboard_payload(request.user, get_request_profile(request), today))
+        set_cached_dashboard(cache_key, body)
+    return Response(body)
+
+
+def dashboard_range(user, start_date):
+    """The user's daily stats from `start_date` on, oldest first."""
+    return DailyUserStats.objects.for_user(user).filter(
         date__gte=start_date
     ).order_by('date')
 
+
+def dashboard_weight_before(user, start_date):
+    """The most recent weight entered before `start_date`, to back-fill the chart from."""
+    # Only the weight is needed, so this is answered from dailystats_user_weight_idx alone
+    return DailyUserStats.objects.for_user(user).filter(
+        date__lt=start_date, 
+        weight__isnull=False
+    ).order_by('-date').values_list('weight', flat=True).first()
+
+
+def dashboard_calories_total(user, start_date):
+    return dashboard_range(user, start_date).aggregate(total_calories=Sum('calories_burned'))['total_calories'] or 0
+
+
+def build_dashboard_payload(user, profile, today):
+    """Build the dashboard response body for `user` as of `today`."""
+    # Get daily stats for the last 30 days
+    start_date = today - timedelta(days=29)
+    daily_stats = list(dashboard_range(user, start_date))
+    return assemble_dashboard_payload(
+        user, profile, today, daily_stats,
+        dashboard_weight_before(user, start_date),
+        dashboard_calories_total(user, start_date),
+    )
+
+
+def assemble_dashboard_payload(user, profile, today, daily_stats, most_recent_weight, total_calories_30_days):
+    """The dashboard body from the results of the three dashboard queries."""
+    start_date = today - timedelta(days=29)
+
     # Create a dictionary for quick lookups
-    stats_dict = {s.date.strftime('%Y-%m-%d'): s for s in daily_stats_qs}
+    stats_dict = {s.date: s for s in daily_stats}
 
     # Prepare data for charts, filling in missing days
     chart_data = []
     
-    # Find the most recent weight entry to back-fill from
-    most_recent_stat_with_weight = DailyUserStats.objects.filter(
-        user=request.user, 
-        date__lt=start_date, 
-        weight__isnull=False
-    ).order_by('-date').first()
-    
     last_known_weight = profile.weight
-    if most_recent_stat_with_weight:
-        last_known_weight = most_recent_stat_with_weight.weight
+    if most_recent_weight is not None:
+        last_known_weight = most_recent_weight
 
     for i in range(30):
         current_date = start_date + timedelta(days=i)
-        date_str = current_date.strftime('%Y-%m-%d')
         
-        stat = stats_dict.get(date_str)
+        stat = stats_dict.get(current_date)
         
         calories = stat.calories_burned if stat and stat.calories_burned is not None else 0
         
@@ -86,12 +143,8 @@ def dashboard_data(request):
             'weight': weight if weight is not None else None # can be null if never entered
         })
 
-    # Calculate total calories burned in the last 30 days
-    from django.db.models import Sum
-    total_calories_30_days = daily_stats_qs.aggregate(total_calories=Sum('calories_burned'))['total_calories'] or 0
-
     # Get today's stats from the data we already fetched
-    today_stat = stats_dict.get(today.strftime('%Y-%m-%d'))
+    today_stat = stats_dict.get(today)
     calories_today = 0
     seconds_today = 0
     workouts_today = 0
@@ -103,20 +156,20 @@ def dashboard_data(request):
         workouts_today = getattr(today_stat, 'workouts_today', 0) or 0
         minutes_today = seconds_today // 60
 
-    return Response({
-        'message': f'Welcome {request.user.username}!',
+    return {
+        'message': f'Welcome {user.username}!',
         'summary_stats': {
             'total_workouts': profile.total_workouts,
             'total_calories': total_calories_30_days,
             'total_minutes': minutes_today,
             'time_spent_seconds': seconds_today,
             'current_weight': profile.weight,
-            'day_streak': 0, # Placeholder for now
+            'day_streak': profile.day_streak(today),
             'calories_today': calories_today,
             'workouts_today': workouts_today,
         },
         'chart_data': chart_data
-    })
+    }
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -134,25 +187,26 @@ def log_activity(request):
     except (ValueError, TypeError):
         return Response({'error': 'Invalid seconds value'}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Get or create a daily stats record for today
     today = timezone.now().date()
-    daily_stats, created = DailyUserStats.objects.get_or_create(
-        user=request.user,
-        date=today
-    )
-    
-    # Use an F() expression for a safe, atomic update directly in the database.
-    # This avoids race conditions and correctly handles cases where the field might be null.
-    from django.db.models import F
-    daily_stats.time_spent_today = F('time_spent_today') + seconds
-    daily_stats.save(update_fields=['time_spent_today'])
+    activity_buffer = get_activity_buffer()
+    if activity_buffer is not None:
+        # Write-behind mode: coalesced and flushed later, which also bumps the user's version
+        activity_buffer.add(request.user.pk, today, seconds)
+        publish_stats(request.user, today, time_spent_today=seconds)
+    else:
+        # Create or increment today's stats row in a single atomic statement
+        daily_stats = DailyUserStats.objects.increment(request.user, today, seconds=seconds)
+        UserProfile.objects.record_active_day([request.user], today)
+        bump_user_version(request.user)
+        publish_stats(request.user, today, daily_stats, time_spent_today=seconds)
     
     return Response({'message': 'Activity logged'}, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@user_etag('user_profile')
 def user_profile(request):
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    profile = get_request_profile(request)
     return Response({
         'username': request.user.username,
         'email': request.user.email,
@@ -168,11 +222,22 @@ def user_profile(request):
 @permission_classes([IsAuthenticated])
 def track_workout(request):
     exercise_time = request.data.get('exercise_time', 0)  # in seconds
-    
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
-    profile.total_exercise_time += exercise_time
-    profile.total_workouts += 1
-    profile.save()
+    try:
+        exercise_time = int(exercise_time)
+        if exercise_time < 0:
+            raise ValueError()
+    except (ValueError, TypeError):
+        return Response({'error': 'exercise_time must be a non-negative integer'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # The profile may come from the authentication cache: add to the stored totals, not to its copy
+    profile = get_request_profile(request)
+    UserProfile.objects.filter(pk=profile.pk).update(
+        total_exercise_time=F('total_exercise_time') + exercise_time,
+        total_workouts=F('total_workouts') + 1,
+    )
+    profile.refresh_from_db(fields=['total_exercise_time', 'total_workouts'])
+    bump_user_version(request.user)
     
     return Response({
         'total_exercise_time': profile.total_exercise_time,
@@ -199,128 +264,244 @@ def complete_workout(request):
     except (ValueError, TypeError):
         return Response({'error': 'calories_burned must be a non-negative number'}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Get or create a daily stats record for today
+    # Atomically create or update stats for today
     today = timezone.now().date()
-    daily_stats, created = DailyUserStats.objects.get_or_create(
-        user=request.user,
-        date=today
-    )
+    daily_stats = DailyUserStats.objects.increment(request.user, today, calories=calories, workouts=1)
 
-    # Atomically update stats for today
-    from django.db.models import F
-    DailyUserStats.objects.filter(pk=daily_stats.pk).update(
-        calories_burned=F('calories_burned') + calories,
-        workouts_today=F('workouts_today') + 1
-    )
-    # Also increment the total workout count on the user's profile
-    from django.db.models import F
-    profile, _ = UserProfile.objects.get_or_create(user=request.user)
-    profile.total_workouts = F('total_workouts') + 1
-    profile.save(update_fields=['total_workouts'])
+    # Also increment the total workout count and advance the streak on the user's profile
+    get_request_profile(request)  # makes sure the profile row exists
+    UserProfile.objects.record_active_day([request.user], today, total_workouts=F('total_workouts') + 1)
+    bump_user_version(request.user)
+    publish_stats(request.user, today, daily_stats, calories_burned=calories, workouts_today=1, total_workouts=1)
 
     return Response({
         'message': f'Great job! {calories:.0f} calories added to your daily total.',
         'date': daily_stats.date,
-        # Return the new total, since the daily_stats object is stale after .update()
-        'total_calories_today': (daily_stats.calories_burned or 0) + calories
+        'total_calories_today': daily_stats.calories_burned or 0
     }, status=status.HTTP_200_OK)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def events_batch(request):
+    """
+    Applies a batch of offline events in one request.
+    Accepts 'events': a list of {'type': 'activity'|'workout'|'weight', 'timestamp', ...} objects.
+    Valid events are applied together; invalid ones are reported and skipped.
+    """
+    events = request.data.get('events')
+    if not isinstance(events, list):
+        return Response({'error': 'events must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+    max_events = getattr(settings, 'FITNESS_EVENTS_BATCH_MAX', 1000)
+    if len(events) > max_events:
+        return Response({'error': f'A batch may contain at most {max_events} events.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    results = []
+    rows = []
+    workouts = 0
+    active = False
+    latest_weight = None
+    for index, event in enumerate(events):
+        serializer = ActivityEventSerializer(data=event)
+        if not serializer.is_valid():
+            results.append({'index': index, 'status': 'rejected', 'errors': serializer.errors})
+            continue
+        data = serializer.validated_data
+        # Bucket by UTC day, the same day timezone.now().date() gives the live endpoints
+        day = data['timestamp'].astimezone(dt_timezone.utc).date()
+        row = {'user': request.user.pk, 'date': day}
+        if data['type'] == 'activity':
+            row['seconds'] = data['seconds']
+            active = True
+        elif data['type'] == 'workout':
+            row['calories'] = data['calories_burned']
+            row['workouts'] = 1
+            workouts += 1
+            active = True
+        else:
+            row['weight'] = data['weight']
+            if latest_weight is None or data['timestamp'] >= latest_weight[0]:
+                latest_weight = (data['timestamp'], day, data['weight'])
+        rows.append((data['timestamp'], row))
+        results.append({'index': index, 'status': 'applied'})
+
+    if rows:
+        # Sorting by timestamp makes the last weight reading of each day win
+        rows.sort(key=lambda item: item[0])
+        with transaction.atomic():
+            DailyUserStats.objects.bulk_increment(row for _, row in rows)
+
+            profile_updates = {}
+            if workouts:
+                profile_updates['total_workouts'] = F('total_workouts') + workouts
+            # Only move the profile's current weight if nothing newer is on record
+            if latest_weight is not None and not DailyUserStats.objects.for_user(request.user).filter(
+                date__gt=latest_weight[1], weight__isnull=False
+            ).exists():
+                profile_updates['weight'] = latest_weight[2]
+            if active:
+                # Offline events can land on any day, so recompute the streak from history
+                streak = DailyUserStats.objects.streaks([request.user])[request.user.pk]
+                profile_updates.update(streak)
+            if profile_updates and not UserProfile.objects.filter(user=request.user).update(**profile_updates):
+                UserProfile.objects.create(
+                    user=request.user,
+                    total_workouts=workouts,
+                    weight=profile_updates.get('weight'),
+                    **(streak if active else {}),
+                )
+        bump_user_version(request.user)
+
+    applied = len(rows)
+    return Response({
+        'applied': applied,
+        'rejected': len(events) - applied,
+        'results': results,
+    }, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@profile_view
+def stats_range(request):
+    """
+    Totals per bucket between 'from' and 'to' (YYYY-MM-DD, inclusive).
+    'to' defaults to today and 'from' to the start of the user's history, which
+    also bounds an earlier 'from'. Longer ranges than FITNESS_STATS allows are refused.
+    'granularity' is 'day', 'week', 'month' or 'auto' (default).
+    """
+    today = timezone.now().date()
+    try:
+        end = date.fromisoformat(request.query_params['to']) if request.query_params.get('to') else today
+        start = date.fromisoformat(request.query_params['from']) if request.query_params.get('from') else None
+    except ValueError:
+        return Response({'error': "'from' and 'to' must be dates in YYYY-MM-DD format"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    granularity = request.query_params.get('granularity', 'auto')
+    if granularity not in ('auto',) + GRANULARITIES:
+        return Response({'error': "granularity must be one of 'auto', 'day', 'week' or 'month'"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    first = DailyUserStats.objects.for_user(request.user).aggregate(first=Min('date'))['first']
+    if start is None:
+        start = min(first or end, end)
+    elif start > end:
+        return Response({'error': "'from' must not be after 'to'"}, status=status.HTTP_400_BAD_REQUEST)
+    elif first is not None:
+        start = min(max(start, first), end)
+    config = stats_settings()
+    span = (end - start).days + 1
+    if span > config['MAX_DAYS']:
+        return Response({'error': f"a range may span at most {config['MAX_DAYS']} days"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if granularity == 'day' and span > config['MAX_DAILY_DAYS']:
+        return Response({'error': f"'day' granularity allows at most {config['MAX_DAILY_DAYS']} days"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    granularity, points = range_stats(request.user, start, end, granularity)
+    return Response({
+        'from': start,
+        'to': end,
+        'granularity': granularity,
+        'points': [{
+            'start': p['start'],
+            'end': p['end'],
+            'calories_burned': p['calories_burned'],
+            'time_spent_seconds': p['time_spent'],
+            'workouts': p['workouts'],
+            'weight': p['weight'],
+        } for p in points],
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_user_data(request, dataset, fmt, compression=None):
+    """Streams the user's full 'daily' or 'sessions' history as CSV or NDJSON, gzipped for a .gz suffix."""
+    return export_response(dataset, fmt, compress=bool(compression), user=request.user,
+                           asynchronous=isinstance(request._request, ASGIRequest))
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_all_data(request, dataset, fmt, compression=None):
+    """Like export_user_data, but every user's rows, ordered by user."""
+    return export_response(dataset, fmt, compress=bool(compression),
+                           asynchronous=isinstance(request._request, ASGIRequest))
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def import_user_data(request):
+    """
+    Imports per-day history into the user's stats. Send either a multipart upload in 'file'
+    or the raw body with a text/csv or application/x-ndjson content type. Columns match the
+    daily export; imported values replace the stored ones for those days.
+    """
+    upload = request.FILES.get('file') if request.content_type.startswith('multipart/') else None
+    if upload is not None:
+        fmt = detect_format(upload.name, upload.content_type)
+        lines = upload
+    else:
+        fmt = detect_format(None, request.content_type)
+        lines = iter(request.stream.readline, b'') if request.stream is not None else []
+    if fmt is None:
+        return Response({'error': 'Upload a .csv or .ndjson file, or send text/csv or application/x-ndjson.'},
+                        status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    try:
+        summary = import_history(request.user, lines, fmt,
+                                 chunk_size=getattr(settings, 'FITNESS_IMPORT_CHUNK_SIZE', 1000))
+    except ImportFormatError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(summary, status=status.HTTP_200_OK)
+
 # get user profile
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@user_etag('get_user_profile')
 def get_user_profile(request):
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
-    return Response({
-        'username': request.user.username,
-        'email': request.user.email,
+    return Response(profile_payload(request.user, get_request_profile(request)))
+
+
+def profile_payload(user, profile):
+    return {
+        'username': user.username,
+        'email': user.email,
         'date_of_birth': profile.date_of_birth,
         'age': profile.age,
         'weight': profile.weight,
         'height': profile.height,
         'gender': profile.gender,
         'level': profile.level
-    })
+    }
     
     
-# Level normalization and video configurations
-ALLOWED_LEVELS = {"beginner", "intermediate", "advanced"}
-
-def normalize_level(level):
-    """Normalize various forms of level input to canonical strings: beginner|intermediate|advanced."""
-    s = str(level).strip().lower() if level is not None else ""
-    if s in ("1", "beginner"):
-        return "beginner"
-    if s in ("2", "intermediate"):
-        return "intermediate"
-    if s in ("3", "advanced"):
-        return "advanced"
-    # Default/fallback
-    return "beginner"
-
-# Define your videos with per-level sets and calories per set
-WORKOUT_VIDEOS = [
-    {
-        "id": "warmup",
-        "title": "Full Body Warm-up",
-        "sets": {"beginner": 2, "intermediate": 3, "advanced": 4},
-        "calories_per_set": {"beginner": 20, "intermediate": 25, "advanced": 30}
-    },
-    {
-        "id": "jjacks",
-        "title": "Jumping Jacks",
-        "sets": {"beginner": 3, "intermediate": 4, "advanced": 5},
-        "calories_per_set": {"beginner": 30, "intermediate": 40, "advanced": 55}
-    },
-    {
-        "id": "squats",
-        "title": "Bodyweight Squats",
-        "sets": {"beginner": 2, "intermediate": 3, "advanced": 5},
-        "calories_per_set": {"beginner": 35, "intermediate": 45, "advanced": 60}
-    },
-    {
-        "id": "pushups",
-        "title": "Push-ups",
-        "sets": {"beginner": 2, "intermediate": 3, "advanced": 4},
-        "calories_per_set": {"beginner": 25, "intermediate": 35, "advanced": 50}
-    },
-    {
-        "id": "plank",
-        "title": "Plank Holds",
-        "sets": {"beginner": 2, "intermediate": 3, "advanced": 4},
-        "calories_per_set": {"beginner": 15, "intermediate": 20, "advanced": 28}
-    }
-]
-
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def videos(request):
     """
     Return videos adjusted to the authenticated user's level, including sets and calories per set
     and total calories for those sets.
+    The body comes precompiled from the catalog; clients holding the current ETag get a 304.
     """
-    profile, _ = UserProfile.objects.get_or_create(user=request.user)
+    profile = get_request_profile(request)
     user_level = normalize_level(getattr(profile, 'level', 'beginner'))
+    body, etag = get_video_catalog().for_level(user_level)
+    return catalog_response(request, body, etag)
 
-    payload = []
-    for v in WORKOUT_VIDEOS:
-        sets = v["sets"].get(user_level, v["sets"]["beginner"])  # fallback safe
-        cal_per_set = v["calories_per_set"].get(user_level, v["calories_per_set"]["beginner"])  # fallback safe
-        payload.append({
-            "id": v["id"],
-            "title": v["title"],
-            "level": user_level,
-            "sets": sets,
-            "calories_per_set": cal_per_set,
-            "total_calories": sets * cal_per_set
-        })
 
-    return Response({"videos": payload})
+def catalog_response(request, body, etag):
+    if etag_matches(etag, request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    # Private because the body depends on the user's level; no-cache so a level change shows up at once
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ['Authorization'])
+    return response
 
-from datetime import date
 from rest_framework import status
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@profile_view
 def save_user_profile(request):
     """
     Save or update the authenticated user's profile.
@@ -328,7 +509,10 @@ def save_user_profile(request):
     - If age is not provided (or is empty) but date_of_birth is available (from request or existing profile),
       age is computed and saved based on date_of_birth.
     """
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    profile = get_request_profile(request)
+    # Only the fields set here are saved: the profile may come from the authentication cache,
+    # and writing back its counters would undo workouts tracked since it was cached
+    changed = []
 
     # 1) Handle and validate date_of_birth
     dob_input = request.data.get('date_of_birth', None)
@@ -358,7 +542,8 @@ def save_user_profile(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-    profile.date_of_birth = dob_to_set
+        profile.date_of_birth = dob_to_set
+        changed.append('date_of_birth')
 
     # 2) Handle age: compute from dob if not provided
     age_input = request.data.get('age', None)
@@ -391,6 +576,7 @@ def save_user_profile(request):
 
     if age_to_set is not None:
         profile.age = age_to_set
+        changed.append('age')
 
     # 3) Other fields: weight, height, gender
     # Preserve existing values if not provided
@@ -398,23 +584,27 @@ def save_user_profile(request):
         new_weight = request.data.get('weight')
         if new_weight is not None:
             profile.weight = new_weight
-            # Also update today's daily stats with the new weight
+            changed.append('weight')
+            # Also update today's daily stats with the new weight, after the response
             today = date.today()
-            daily_stats, created = DailyUserStats.objects.get_or_create(user=request.user, date=today)
             try:
-                daily_stats.weight = float(profile.weight)
-                daily_stats.save()
+                enqueue(record_weight, request.user.pk, today, float(profile.weight))
             except (ValueError, TypeError):
                 pass # Ignore if weight is not a valid float
     if 'height' in request.data:
         profile.height = request.data.get('height', profile.height)
+        changed.append('height')
     if 'gender' in request.data:
         profile.gender = request.data.get('gender', profile.gender)
+        changed.append('gender')
 
     # 4) Handle level (normalize and store as canonical string)
     level_input = request.data.get('level', None)
     if level_input is not None:
         profile.level = normalize_level(level_input)
+        changed.append('level')
 
-    profile.save()
+    if changed:
+        profile.save(update_fields=changed)
+        bump_user_version(request.user)
     return Response({'message': 'Profile updated successfully'})
\ No newline at end of file
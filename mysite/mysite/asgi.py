@@ -2,6 +2,9 @@
 ASGI config for mysite project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server, e.g. ``uvicorn mysite.asgi:application``, to get
+the /api/live/ event streams; WSGI workers answer that endpoint with 501. It
+also serves the async versions of the hot read views (FITNESS_ASYNC_VIEWS).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -12,5 +15,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+os.environ.setdefault('FITNESS_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,12 +45,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so its timings cover every other middleware
+    'fitness.metrics.MetricsMiddleware',
+    # Outside everything but metrics, so it compresses the final body
+    'fitness.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     # 'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'fitness.routers.ReplicaReadMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -85,6 +91,191 @@ DATABASES = {
     }
 }
 
+# 'development' or 'production'. The production profile tunes every SQLite
+# connection for concurrent use (WAL, synchronous=NORMAL, busy_timeout, mmap
+# and a bigger page cache; see fitness/sqlite.py) and keeps connections open
+# between requests, checking them before reuse.
+FITNESS_DB_PROFILE = os.environ.get('FITNESS_DB_PROFILE', 'development')
+
+# Extra PRAGMAs for every SQLite connection, overriding the profile's, e.g. {'cache_size': -128000}
+FITNESS_SQLITE_PRAGMAS = {}
+
+if FITNESS_DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        # Seconds the sqlite3 module waits on a lock; the busy_timeout PRAGMA takes over once connected
+        'OPTIONS': {'timeout': 20},
+    })
+
+# Read replicas. Reads of the views in READ_VIEWS (and admin changelists) go to
+# one of ALIASES unless the user wrote in the last STICKY_SECONDS; everything
+# else uses 'default'. See fitness/routers.py.
+FITNESS_REPLICAS = {
+    'ALIASES': [],
+    'READ_VIEWS': [
+        'dashboard_data', 'get_user_profile', 'user_profile', 'videos', 'videos_no_prefix',
+        'stats_range', 'export_user_data', 'export_all_data',
+    ],
+    'ADMIN_CHANGELISTS': True,
+    'STICKY_SECONDS': 10,
+}
+
+# Local stand-in for replication: comma-separated SQLite files kept in step with
+# the primary by `manage.py sync_replicas`, e.g. FITNESS_SQLITE_REPLICAS=/tmp/replica.sqlite3
+for _n, _path in enumerate(filter(None, os.environ.get('FITNESS_SQLITE_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica{_n}'] = {
+        **DATABASES['default'],
+        'NAME': _path,
+        # Tests read the replica through the primary's test database
+        'TEST': {'MIRROR': 'default'},
+    }
+    FITNESS_REPLICAS['ALIASES'].append(f'replica{_n}')
+
+# Shards for the per-user stats tables (DailyUserStats, UserSessionActivity and
+# the tables written with them), picked per user by a consistent hash ring with
+# VNODES points per alias. Empty keeps them on 'default'. After changing
+# ALIASES, run `manage.py migrate --database <alias>` for new shards and
+# `manage.py rebalance_shards`. See fitness/sharding.py.
+FITNESS_SHARDS = {
+    'ALIASES': [],
+    'VNODES': 64,
+}
+
+# Local shards: comma-separated SQLite files, e.g. FITNESS_SQLITE_SHARDS=/tmp/shard1.sqlite3,/tmp/shard2.sqlite3
+for _n, _path in enumerate(filter(None, os.environ.get('FITNESS_SQLITE_SHARDS', '').split(',')), start=1):
+    DATABASES[f'shard{_n}'] = {**DATABASES['default'], 'NAME': _path}
+    FITNESS_SHARDS['ALIASES'].append(f'shard{_n}')
+
+DATABASE_ROUTERS = ['fitness.routers.ShardRouter', 'fitness.routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Local memory is per-process; point this at a shared backend (Redis,
+# Memcached, database) when running more than one worker so that version
+# bumps from one process invalidate dashboards cached by the others.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fitness',
+    }
+}
+
+# Seconds a cached dashboard payload may live before it is rebuilt anyway.
+DASHBOARD_CACHE_TIMEOUT = 300
+
+# Responses of at least MIN_SIZE bytes with one of CONTENT_TYPES are sent
+# brotli-compressed (if the brotli package is installed) or gzipped to clients
+# that accept it. See fitness/compression.py.
+FITNESS_COMPRESSION = {
+    'MIN_SIZE': 1024,
+    'CONTENT_TYPES': ['application/json', 'application/x-ndjson', 'text/'],
+    'BROTLI_QUALITY': 5,
+}
+
+# Write-behind mode for /api/log_activity/ heartbeats: seconds are summed per
+# (user, day) in each worker and flushed as one bulk upsert every
+# FLUSH_INTERVAL seconds, when MAX_PENDING rows are waiting, and at exit.
+FITNESS_ACTIVITY_BUFFER = {
+    'ENABLED': False,
+    'STORE': 'fitness.activity_buffer.LocalMemoryStore',
+    'FLUSH_INTERVAL': 5,
+    'MAX_PENDING': 500,
+}
+
+# Session housekeeping done by `manage.py cleanup_sessions`: sessions still open
+# IDLE_TIMEOUT seconds after login are closed with no duration, and closed
+# sessions older than RETENTION_DAYS are folded into SessionDailySummary.
+# Work is done BATCH_SIZE sessions per transaction, sleeping PAUSE in between.
+FITNESS_SESSIONS = {
+    'IDLE_TIMEOUT': 30 * 60,
+    'RETENTION_DAYS': 90,
+    'BATCH_SIZE': 1000,
+    'PAUSE': 0.0,
+}
+
+# /api/live/ server-sent events (ASGI only): a comment every HEARTBEAT seconds
+# keeps idle streams open, QUEUE_SIZE events are buffered per stream before
+# the client is told to resync, and clients reconnect after RETRY_MS.
+FITNESS_LIVE = {
+    'HEARTBEAT': 15,
+    'QUEUE_SIZE': 100,
+    'RETRY_MS': 5000,
+}
+
+# Route dashboard_data, get_user_profile and videos to their async versions
+# (fitness/async_views.py). mysite/asgi.py turns this on; WSGI keeps the sync views.
+FITNESS_ASYNC_VIEWS = os.environ.get('FITNESS_ASYNC_VIEWS') == '1'
+
+# Background tasks (fitness/tasks.py): secondary writes handed off by requests,
+# such as the logout rollup and the weight row of a profile save. They are
+# queued for `manage.py run_tasks`, which claims BATCH_SIZE tasks at a time for
+# LEASE seconds and runs them on THREADS threads. Failures are retried after
+# RETRY_DELAY seconds, doubling each time, up to MAX_ATTEMPTS attempts. With
+# DEBUG on, as under devserver.sh, no worker is expected and they run inside
+# the request instead (ALWAYS_EAGER); FITNESS_TASKS_EAGER=0 or 1 overrides that.
+FITNESS_TASKS = {
+    'ALWAYS_EAGER': os.environ.get('FITNESS_TASKS_EAGER', '1' if DEBUG else '0') == '1',
+    'THREADS': 4,
+    'BATCH_SIZE': 100,
+    'LEASE': 60,
+    'POLL_INTERVAL': 1.0,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_DELAY': 10,
+}
+
+# Largest number of events accepted by one /api/events/batch/ request.
+FITNESS_EVENTS_BATCH_MAX = 1000
+
+# /api/stats/: most buckets returned for one range before neighbouring
+# buckets are merged. Also bounds the granularity picked automatically.
+# Ranges longer than MAX_DAYS, or MAX_DAILY_DAYS with granularity=day, are refused.
+FITNESS_STATS = {
+    'MAX_POINTS': 60,
+    'MAX_DAYS': 3660,
+    'MAX_DAILY_DAYS': 366,
+}
+
+# /api/export/: rows fetched per database round trip, and the approximate
+# size of each block handed to the streaming response.
+FITNESS_EXPORT = {
+    'CHUNK_SIZE': 2000,
+    'BLOCK_SIZE': 64 * 1024,
+}
+
+# Days written per transaction by /api/import/ and the import_history command.
+FITNESS_IMPORT_CHUNK_SIZE = 1000
+
+# Where /api/videos/ reads the workout catalog from: 'static' (WORKOUT_VIDEOS
+# in fitness/catalog.py) or 'database' (the WorkoutVideo table; load it with
+# `manage.py sync_video_catalog`). Either way it is compiled once per process.
+FITNESS_VIDEO_CATALOG_SOURCE = 'static'
+
+# Per-view request metrics served at /api/metrics to admin users, and to
+# scrapers sending `Authorization: Bearer $FITNESS_METRICS_TOKEN`. With several
+# worker processes, set FITNESS_METRICS_DIR to a directory shared by all of them
+# (cleared on deploy) so the endpoint reports totals across workers.
+FITNESS_METRICS = {
+    'ENABLED': True,
+    'MULTIPROCESS_DIR': os.environ.get('FITNESS_METRICS_DIR'),
+    'FLUSH_INTERVAL': 1.0,
+    'TOKEN': os.environ.get('FITNESS_METRICS_TOKEN'),
+}
+
+# cProfile capture for views decorated with @profile_view. Profiles are taken
+# when ALWAYS is set, when a staff user sends HEADER, or for a SAMPLE_RATE
+# fraction of requests; only the newest MAX_FILES are kept in DIRECTORY.
+# Summarise them with `manage.py profile_report`.
+FITNESS_PROFILING = {
+    'ALWAYS': False,
+    'SAMPLE_RATE': 0.0,
+    'HEADER': 'X-Fitness-Profile',
+    'DIRECTORY': BASE_DIR / 'profiles',
+    'MAX_FILES': 500,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -137,8 +328,20 @@ CSRF_TRUSTED_ORIGINS = ['https://9000-firebase-forgebackend-1754324027271.cluste
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        'fitness.authentication.ProfileJWTAuthentication',
+    ),
+    # orjson-backed JSON (stdlib fallback); the browsable API only while developing
+    'DEFAULT_RENDERER_CLASSES': ('fitness.renderers.FastJSONRenderer',) + (
+        ('rest_framework.renderers.BrowsableAPIRenderer',) if DEBUG else ()
+    ),
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'fitness.renderers.SingleRendererNegotiation',
+}
+
+# Per-process cache of authenticated users and their profiles, keyed by user id.
+# Entries also expire as soon as the user's data version changes.
+FITNESS_AUTH_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 30,
 }
 
 from datetime import timedelta